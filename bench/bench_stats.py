@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Benchmark des implementations de /stats selon le volume de donnees.
+
+Compare, pour chaque volume :
+- scan brut : les 5 requetes d'origine sur user_choices ;
+- agregats : les 4 requetes sur les agregats horaires/journaliers ;
+- grouping sets : la requete unique de stats.py.
+
+Les choix generes et les agregats recalcules sont annules a la fin : a
+executer sur une base de test (variables DB_* du serveur).
+
+Exemples:
+    python bench_stats.py
+    python bench_stats.py --sizes 10000,100000,1000000 --days 30 --machine bench_001
+"""
+
+import argparse
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "server"))
+
+from sqlalchemy import desc, func, select, text  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+import rollups  # noqa: E402
+import stats  # noqa: E402
+from seed import seed  # noqa: E402
+from models import Machine, UserChoice  # noqa: E402
+
+
+def scan_raw(db: Session, cutoff: datetime, machine: Optional[str]) -> int:
+    """Implementation d'origine : 5 requetes sur les lignes brutes."""
+    base = (
+        select(UserChoice.id)
+        .join(Machine, Machine.id == UserChoice.machine_id)
+        .where(UserChoice.event_time >= cutoff)
+    )
+    if machine:
+        base = base.where(Machine.name == machine)
+    filtered = base.subquery()
+
+    db.execute(select(func.count()).select_from(filtered)).scalar()
+    db.execute(select(func.count(Machine.id))).scalar()
+    db.execute(
+        base.with_only_columns(UserChoice.choix, func.count(UserChoice.id))
+        .group_by(UserChoice.choix).order_by(desc(func.count(UserChoice.id)))
+    ).all()
+    db.execute(
+        select(Machine.name, func.count(UserChoice.id), func.max(UserChoice.event_time))
+        .join(Machine, Machine.id == UserChoice.machine_id)
+        .where(UserChoice.event_time >= cutoff)
+        .group_by(Machine.name).order_by(desc(func.count(UserChoice.id)))
+    ).all()
+    day = func.date(UserChoice.event_time)
+    db.execute(
+        base.with_only_columns(day, func.count(UserChoice.id)).group_by(day).order_by(day)
+    ).all()
+    return 5
+
+
+def multi_rollups(db: Session, cutoff: datetime, machine: Optional[str]) -> int:
+    """Implementation precedente : 4 requetes sur les agregats."""
+    segments = rollups.segments(cutoff, machine)
+    all_segments = rollups.segments(cutoff)
+    total = func.sum(segments.c.count)
+
+    db.execute(select(func.count(Machine.id))).scalar()
+    db.execute(
+        select(segments.c.choix, total).group_by(segments.c.choix).order_by(desc(total))
+    ).all()
+    db.execute(
+        select(all_segments.c.machine, func.sum(all_segments.c.count), func.max(all_segments.c.last_event))
+        .group_by(all_segments.c.machine).order_by(desc(func.sum(all_segments.c.count)))
+    ).all()
+    db.execute(
+        select(segments.c.day, total).group_by(segments.c.day).order_by(segments.c.day)
+    ).all()
+    return 4
+
+
+def grouping_sets(db: Session, cutoff: datetime, machine: Optional[str]) -> int:
+    """Implementation actuelle : 1 requete (stats.breakdown)."""
+    stats.assemble(db.execute(stats.breakdown(cutoff, machine)).all())
+    return 1
+
+
+IMPLEMENTATIONS: Dict[str, Callable[[Session, datetime, Optional[str]], int]] = {
+    "scan brut": scan_raw,
+    "agregats": multi_rollups,
+    "grouping sets": grouping_sets,
+}
+
+
+def measure(func: Callable, db: Session, cutoff: datetime, machine: Optional[str], repeat: int) -> List[float]:
+    """Durees (secondes) de `repeat` executions, apres une execution a vide."""
+    func(db, cutoff, machine)
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(db, cutoff, machine)
+        durations.append(time.perf_counter() - start)
+    return sorted(durations)
+
+
+def run(sizes: List[int], days: int, machine: Optional[str], repeat: int) -> None:
+    """Execute le benchmark et affiche les resultats."""
+    from database import SessionLocal
+
+    db = SessionLocal()
+    inserted = 0
+    try:
+        print(f"days={days} machine={machine or '-'} repetitions={repeat}")
+        print(f"{'choix':>10}  {'implementation':<14} {'requetes':>8} {'p50 ms':>9} {'p95 ms':>9}")
+        for size in sizes:
+            seed(db, size - inserted)
+            inserted = size
+            rollups.rebuild(db)
+            db.execute(text("ANALYZE choice_rollups_hourly"))
+            db.execute(text("ANALYZE choice_rollups_daily"))
+
+            cutoff = datetime.utcnow() - timedelta(days=days)
+            for name, func in IMPLEMENTATIONS.items():
+                durations = measure(func, db, cutoff, machine, repeat)
+                queries = func(db, cutoff, machine)
+                p95 = durations[min(len(durations) - 1, round(0.95 * len(durations)) - 1)]
+                print(
+                    f"{size:>10}  {name:<14} {queries:>8} "
+                    f"{statistics.median(durations) * 1000:>9.2f} {p95 * 1000:>9.2f}"
+                )
+    finally:
+        db.rollback()
+        db.close()
+
+
+def main() -> None:
+    """Point d'entree."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", default="10000,100000,1000000",
+                        help="Volumes de choix, separes par des virgules (croissants)")
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--machine", default=None)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    sizes = sorted(int(size) for size in args.sizes.split(","))
+    run(sizes, args.days, args.machine, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
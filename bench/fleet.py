@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Simulation d'un parc de bornes et de tableaux de bord.
+
+Chaque borne est un thread qui utilise APIClient (client/api_client.py)
+comme une vraie borne : un appui toutes les 60 / --rate secondes en
+moyenne (loi exponentielle), envoye par log_choice, directement ou via la
+file d'attente (--outbox). Des lecteurs interrogent en parallele /stats,
+/choices et /stats/live comme le tableau de bord.
+
+Affiche le debit et les latences p50/p95/p99 par endpoint. Avec la meme
+graine, les bornes appuient sur les memes boutons aux memes instants
+relatifs. Le serveur doit tourner (base PostgreSQL de test, eventuellement
+remplie avec seed_data.py).
+
+Exemples:
+    python fleet.py --url http://localhost:8000 --kiosks 50 --rate 12 --duration 60
+    python fleet.py --kiosks 200 --rate 30 --readers 4 --outbox
+"""
+
+import argparse
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "client"))
+
+from api_client import APIClient  # noqa: E402
+from load_api import percentile  # noqa: E402
+from workload import BUTTONS, BUTTON_WEIGHTS, machine_names, video_paths  # noqa: E402
+
+
+class Recorder:
+    """Latences et erreurs par endpoint, partagees entre threads."""
+
+    def __init__(self):
+        """Initialise un enregistreur vide."""
+        self._latencies: Dict[str, List[float]] = defaultdict(list)
+        self._errors: Dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def record(self, endpoint: str, seconds: float, ok: bool) -> None:
+        """Enregistre une requete."""
+        with self._lock:
+            if ok:
+                self._latencies[endpoint].append(seconds)
+            else:
+                self._errors[endpoint] += 1
+
+    def report(self, duration: float) -> None:
+        """Affiche le debit et les percentiles par endpoint."""
+        print(
+            f"{'endpoint':<20} {'requetes':>9} {'erreurs':>8} {'req/s':>8} "
+            f"{'moy ms':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"
+        )
+        for endpoint in sorted(self._latencies.keys() | self._errors.keys()):
+            values = sorted(self._latencies[endpoint])
+            mean = statistics.mean(values) * 1000 if values else 0.0
+            print(
+                f"{endpoint:<20} {len(values):>9} {self._errors[endpoint]:>8} "
+                f"{len(values) / duration:>8.1f} {mean:>8.1f} "
+                + " ".join(f"{percentile(values, pct) * 1000:>8.1f}" for pct in (50, 95, 99))
+            )
+
+
+class TimedAPIClient(APIClient):
+    """APIClient qui mesure chaque requete HTTP."""
+
+    def __init__(self, recorder: Recorder, *args, **kwargs):
+        """
+        Initialise le client.
+
+        Args:
+            recorder: Enregistreur des latences.
+            *args, **kwargs: Arguments de APIClient.
+        """
+        super().__init__(*args, **kwargs)
+        self.recorder = recorder
+
+    def _make_request(
+        self,
+        method: str,
+        endpoint: str,
+        json: Optional[dict] = None,
+        params: Optional[dict] = None
+    ) -> Optional[dict]:
+        """Effectue la requete et enregistre sa latence."""
+        start = time.perf_counter()
+        result = super()._make_request(method, endpoint, json=json, params=params)
+        self.recorder.record(f"{method} {endpoint}", time.perf_counter() - start, result is not None)
+        return result
+
+
+def kiosk(client: APIClient, rng: random.Random, rate: float, videos: List[str], stop: threading.Event) -> None:
+    """
+    Boucle d'une borne : appuis aleatoires jusqu'a l'arret.
+
+    Args:
+        client: Client de la borne.
+        rng: Generateur aleatoire de la borne.
+        rate: Appuis par minute (moyenne).
+        videos: Chemins des videos.
+        stop: Evenement d'arret.
+    """
+    while not stop.wait(rng.expovariate(rate / 60)):
+        button = rng.choices(BUTTONS, weights=BUTTON_WEIGHTS)[0]
+        path = rng.choice([video for video in videos if video.startswith(f"/videos/{button}/")])
+        client.log_choice(button, path)
+
+
+# Requetes du tableau de bord : (endpoint, parametres)
+DASHBOARD_QUERIES: Tuple[Tuple[str, dict], ...] = (
+    ("/stats", {"days": 7}),
+    ("/stats", {"days": 30}),
+    ("/choices", {"limit": 100}),
+    ("/stats/live", {}),
+)
+
+
+def reader(client: APIClient, rng: random.Random, interval: float, stop: threading.Event) -> None:
+    """
+    Boucle d'un tableau de bord : une requete toutes les `interval` secondes.
+
+    Args:
+        client: Client (mesure des latences).
+        rng: Generateur aleatoire du lecteur.
+        interval: Delai entre deux requetes (0 = sans pause).
+        stop: Evenement d'arret.
+    """
+    while not stop.is_set():
+        endpoint, params = rng.choice(DASHBOARD_QUERIES)
+        client._make_request("GET", endpoint, params=params)
+        if interval:
+            stop.wait(interval)
+
+
+def run(args: argparse.Namespace) -> None:
+    """Lance le parc, attend la duree demandee puis affiche les resultats."""
+    recorder = Recorder()
+    stop = threading.Event()
+    videos = video_paths(args.videos)
+    outbox_dir = tempfile.TemporaryDirectory(prefix="fleet-") if args.outbox else None
+
+    clients = []
+    threads = []
+    for index, name in enumerate(machine_names(args.prefix, args.kiosks)):
+        client = TimedAPIClient(
+            recorder,
+            args.url,
+            name,
+            timeout=args.timeout,
+            outbox_path=Path(outbox_dir.name) / f"{name}.db" if outbox_dir else None
+        )
+        client.start()
+        clients.append(client)
+        rng = random.Random(f"{args.seed}-kiosk-{index}")
+        threads.append(threading.Thread(
+            target=kiosk, args=(client, rng, args.rate, videos, stop), daemon=True
+        ))
+
+    for index in range(args.readers):
+        client = TimedAPIClient(recorder, args.url, f"dashboard_{index}", timeout=args.timeout)
+        rng = random.Random(f"{args.seed}-reader-{index}")
+        threads.append(threading.Thread(
+            target=reader, args=(client, rng, args.read_interval, stop), daemon=True
+        ))
+
+    print(
+        f"bornes={args.kiosks} appuis/min/borne={args.rate} lecteurs={args.readers} "
+        f"duree={args.duration}s mode={'file' if args.outbox else 'direct'}"
+    )
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    try:
+        time.sleep(args.duration)
+    except KeyboardInterrupt:
+        pass
+    stop.set()
+    for thread in threads:
+        thread.join()
+    duration = time.perf_counter() - started
+    pending = sum(client.pending_choices for client in clients)
+    # Derniers envois de la file d'attente
+    for client in clients:
+        client.close()
+
+    recorder.report(duration)
+    if outbox_dir:
+        print(f"choix en file a l'arret du parc: {pending}")
+        outbox_dir.cleanup()
+
+
+def main() -> None:
+    """Point d'entree."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--kiosks", type=int, default=20)
+    parser.add_argument("--rate", type=float, default=6.0, help="Appuis par minute et par borne")
+    parser.add_argument("--readers", type=int, default=2, help="Tableaux de bord simules")
+    parser.add_argument("--read-interval", type=float, default=1.0,
+                        help="Delai entre deux requetes d'un tableau de bord (s)")
+    parser.add_argument("--duration", type=float, default=60.0, help="Duree du test (s)")
+    parser.add_argument("--outbox", action="store_true",
+                        help="Envoi par la file d'attente (/choices/batch)")
+    parser.add_argument("--videos", type=int, default=10, help="Videos par bouton")
+    parser.add_argument("--prefix", default="kiosk", help="Prefixe des noms de machine")
+    parser.add_argument("--timeout", type=float, default=5.0)
+    parser.add_argument("--seed", type=int, default=42, help="Graine aleatoire")
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Benchmark de charge de l'API Video Analytics.
+
+Envoie des requetes concurrentes sur un endpoint et affiche le debit et
+les percentiles de latence. Utilise uniquement la bibliotheque standard.
+
+Exemples:
+    python load_api.py --url http://localhost:8000 --endpoint choices
+    python load_api.py --endpoint stats --concurrency 128 --requests 20000
+"""
+
+import argparse
+import http.client
+import json
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
+from urllib.parse import urlparse
+
+BUTTONS = "ABCDEFG"
+
+
+def build_request(endpoint: str, machines: int) -> Tuple[str, str, bytes]:
+    """Construit une requete (methode, chemin, corps) pour un endpoint."""
+    machine = f"bench_{random.randrange(machines):03d}"
+    if endpoint == "choices":
+        choix = random.choice(BUTTONS)
+        body = {"choix": choix, "video": f"/videos/{choix}/demo.mp4", "machine": machine}
+        return "POST", "/choices", json.dumps(body).encode()
+    if endpoint == "stats":
+        return "GET", f"/stats?days={random.choice((1, 7, 30))}", b""
+    if endpoint == "live":
+        return "GET", "/stats/live", b""
+    if endpoint == "list":
+        return "GET", f"/choices?limit=100&machine={machine}", b""
+    raise ValueError(f"Endpoint inconnu: {endpoint}")
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Percentile (methode du rang le plus proche) d'une liste triee."""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, round(pct / 100 * len(values)) - 1))
+    return values[index]
+
+
+def run(url: str, endpoint: str, concurrency: int, total: int, machines: int) -> None:
+    """Execute le benchmark et affiche les resultats."""
+    target = urlparse(url)
+    local = threading.local()
+    latencies: List[float] = []
+    errors = 0
+    lock = threading.Lock()
+
+    def worker(_):
+        nonlocal errors
+        # Une connexion keep-alive par thread
+        if not hasattr(local, "conn"):
+            local.conn = http.client.HTTPConnection(target.hostname, target.port or 80, timeout=30)
+        method, path, body = build_request(endpoint, machines)
+        headers = {"Content-Type": "application/json"} if body else {}
+        start = time.perf_counter()
+        try:
+            local.conn.request(method, path, body=body or None, headers=headers)
+            response = local.conn.getresponse()
+            response.read()
+            ok = response.status < 400
+        except (OSError, http.client.HTTPException):
+            local.conn.close()
+            del local.conn
+            ok = False
+        elapsed = time.perf_counter() - start
+        with lock:
+            if ok:
+                latencies.append(elapsed)
+            else:
+                errors += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, range(total)))
+    duration = time.perf_counter() - started
+
+    latencies.sort()
+    print(f"endpoint={endpoint} concurrency={concurrency} requests={total}")
+    print(f"  debit   : {len(latencies) / duration:8.1f} req/s ({errors} erreurs)")
+    if latencies:
+        print(f"  moyenne : {statistics.mean(latencies) * 1000:8.1f} ms")
+        for pct in (50, 95, 99):
+            print(f"  p{pct:<7}: {percentile(latencies, pct) * 1000:8.1f} ms")
+
+
+def main() -> None:
+    """Point d'entree."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--endpoint", choices=["choices", "stats", "live", "list"], default="choices")
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--machines", type=int, default=20)
+    args = parser.parse_args()
+    run(args.url, args.endpoint, args.concurrency, args.requests, args.machines)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Generateur de donnees pour dimensionner le serveur.
+
+Insere des millions de choix dans user_choices avec COPY, par lots, puis
+recalcule les agregats de /stats. Les machines (kiosk_000, kiosk_001...)
+portent les memes noms que celles de fleet.py. La repartition suit une
+journee d'ouverture (plus de choix entre 9 h et 19 h) et des boutons
+inegalement populaires. Avec la meme graine, les donnees sont les memes.
+
+Les donnees sont validees en base : a executer sur une base de test
+(variables DB_* du serveur).
+
+Exemples:
+    python seed_data.py --rows 1000000
+    python seed_data.py --rows 5000000 --machines 200 --days 365 --seed 42
+"""
+
+import argparse
+import io
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "server"))
+
+from sqlalchemy import select, text  # noqa: E402
+from sqlalchemy.dialects.postgresql import insert as pg_insert  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+import partitions  # noqa: E402
+import rollups  # noqa: E402
+from models import Machine, Video  # noqa: E402
+from workload import BUTTONS, BUTTON_WEIGHTS, HOUR_WEIGHTS, machine_names, video_paths  # noqa: E402
+
+
+def upsert_names(db: Session, model, column: str, names: List[str]) -> Dict[str, int]:
+    """Cree les lignes manquantes d'une table de noms et retourne nom -> id."""
+    db.execute(pg_insert(model).values([{column: name} for name in names]).on_conflict_do_nothing())
+    key = getattr(model, column)
+    return dict(db.execute(select(key, model.id).where(key.in_(names))).tuples().all())
+
+
+def generate(
+    rng: random.Random,
+    count: int,
+    start: datetime,
+    days: int,
+    machine_ids: List[int],
+    videos: Dict[str, List[int]]
+) -> io.StringIO:
+    """
+    Genere un lot de choix au format CSV de COPY.
+
+    Args:
+        rng: Generateur aleatoire (graine fixee).
+        count: Nombre de choix.
+        start: Debut de la periode.
+        days: Duree de la periode en jours.
+        machine_ids: Identifiants des machines.
+        videos: Identifiants des videos par bouton.
+
+    Returns:
+        Tampon CSV (choix, video_id, event_time, machine_id).
+    """
+    buffer = io.StringIO()
+    day_offsets = [rng.randrange(days) for _ in range(count)]
+    hours = rng.choices(range(24), weights=HOUR_WEIGHTS, k=count)
+    buttons = rng.choices(BUTTONS, weights=BUTTON_WEIGHTS, k=count)
+    now = datetime.utcnow()
+
+    for day, hour, button in zip(day_offsets, hours, buttons):
+        moment = start + timedelta(days=day, hours=hour, seconds=rng.random() * 3600)
+        if moment > now:
+            moment = now - timedelta(seconds=rng.random() * 3600)
+        buffer.write(
+            f"{button},{rng.choice(videos[button])},{moment.isoformat(sep=' ')},"
+            f"{rng.choice(machine_ids)}\n"
+        )
+    buffer.seek(0)
+    return buffer
+
+
+def seed(
+    db: Session,
+    rows: int,
+    machines: int = 50,
+    videos_per_button: int = 10,
+    days: int = 365,
+    prefix: str = "kiosk",
+    chunk: int = 200_000,
+    random_seed: int = 42
+) -> None:
+    """
+    Insere `rows` choix puis recalcule les agregats.
+
+    Chaque lot est valide separement : une interruption garde les lots deja
+    inseres.
+
+    Args:
+        db: Session de base de donnees.
+        rows: Nombre de choix a inserer.
+        machines: Nombre de machines.
+        videos_per_button: Nombre de videos par bouton.
+        days: Periode couverte, jusqu'a maintenant.
+        prefix: Prefixe des noms de machine.
+        chunk: Nombre de choix par COPY.
+        random_seed: Graine du generateur aleatoire.
+    """
+    rng = random.Random(random_seed)
+    start = (datetime.utcnow() - timedelta(days=days - 1)).replace(
+        hour=0, minute=0, second=0, microsecond=0
+    )
+
+    partitions.ensure_partitions(db, since=start)
+    machine_ids = list(upsert_names(db, Machine, "name", machine_names(prefix, machines)).values())
+    video_ids = upsert_names(db, Video, "path", video_paths(videos_per_button))
+    videos = {
+        button: [id_ for path, id_ in video_ids.items() if path.startswith(f"/videos/{button}/")]
+        for button in BUTTONS
+    }
+    db.commit()
+
+    cursor = db.connection().connection.cursor()
+    started = time.perf_counter()
+    done = 0
+    while done < rows:
+        count = min(chunk, rows - done)
+        cursor.copy_expert(
+            "COPY user_choices (choix, video_id, event_time, machine_id) FROM STDIN WITH (FORMAT csv)",
+            generate(rng, count, start, days, machine_ids, videos)
+        )
+        db.commit()
+        done += count
+        elapsed = time.perf_counter() - started
+        print(f"  {done:>10} / {rows} choix ({done / elapsed:,.0f} choix/s)")
+    cursor.close()
+
+    print("Agregats et statistiques...")
+    db.execute(text(
+        "UPDATE machines m SET last_seen = s.last_event "
+        "FROM (SELECT machine_id, max(event_time) AS last_event FROM user_choices "
+        "GROUP BY machine_id) s WHERE m.id = s.machine_id"
+    ))
+    rollups.rebuild(db)
+    db.commit()
+    db.execute(text("ANALYZE"))
+    db.commit()
+
+
+def main() -> None:
+    """Point d'entree."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--machines", type=int, default=50)
+    parser.add_argument("--videos", type=int, default=10, help="Videos par bouton")
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--prefix", default="kiosk", help="Prefixe des noms de machine")
+    parser.add_argument("--chunk", type=int, default=200_000, help="Choix par COPY")
+    parser.add_argument("--seed", type=int, default=42, help="Graine aleatoire")
+    args = parser.parse_args()
+
+    from database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        started = time.perf_counter()
+        seed(db, args.rows, args.machines, args.videos, args.days, args.prefix, args.chunk, args.seed)
+        print(f"{args.rows} choix generes en {time.perf_counter() - started:.1f} s")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+"""
+Profil de charge commun a seed_data.py et fleet.py.
+
+Noms des machines et des videos, popularite des boutons et frequentation
+par heure : les donnees generees et le parc simule utilisent les memes.
+"""
+
+from typing import List
+
+BUTTONS = "ABCDEFG"
+# Popularite relative des boutons
+BUTTON_WEIGHTS = (30, 22, 16, 12, 9, 7, 4)
+# Frequentation relative par heure de la journee (UTC)
+HOUR_WEIGHTS = (1, 1, 1, 1, 1, 1, 2, 4, 8, 12, 14, 15, 13, 14, 15, 15, 14, 12, 9, 5, 3, 2, 1, 1)
+
+
+def machine_names(prefix: str, count: int) -> List[str]:
+    """Noms des machines (prefix_000, prefix_001...)."""
+    return [f"{prefix}_{index:03d}" for index in range(count)]
+
+
+def video_paths(per_button: int) -> List[str]:
+    """Chemins des videos, `per_button` par bouton."""
+    return [
+        f"/videos/{button}/clip_{index:02d}.mp4"
+        for button in BUTTONS
+        for index in range(per_button)
+    ]
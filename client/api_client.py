@@ -4,46 +4,150 @@ Client HTTP pour communiquer avec l'API Video Analytics.
 Ce module remplace l'acces direct a la base de donnees.
 """
 
+import gzip
 import logging
-from typing import Optional
-from urllib.parse import urljoin
+import threading
+import uuid
+from datetime import datetime, timezone
+from json import dumps as json_dumps
+from pathlib import Path
+from typing import Dict, List, Optional
+from urllib.parse import quote, urljoin
 
 try:
     import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
     REQUESTS_AVAILABLE = True
 except ImportError:
     REQUESTS_AVAILABLE = False
     requests = None
 
+from outbox import BatchRejected, Outbox, OutboxFlusher
+
 logger = logging.getLogger(__name__)
 
 
 class APIClient:
     """Client pour l'API Video Analytics."""
 
-    def __init__(self, base_url: str, machine_name: str, timeout: float = 5.0):
+    def __init__(
+        self,
+        base_url: str,
+        machine_name: str,
+        timeout: float = 5.0,
+        outbox_path: Optional[Path] = None,
+        batch_size: int = 100,
+        flush_interval: float = 2.0,
+        max_backoff: float = 300.0,
+        retries: int = 2,
+        retry_backoff: float = 0.5,
+        gzip_min_size: int = 1024,
+        pool_size: int = 4
+    ):
         """
         Initialise le client API.
 
+        Les requetes passent par une session HTTP persistante : les
+        connexions (TCP, TLS) sont reutilisees d'un appel a l'autre.
+
         Args:
             base_url: URL de base de l'API (ex: http://server:8000)
             machine_name: Nom de cette borne
             timeout: Timeout des requetes en secondes
+            outbox_path: Fichier de la file d'attente hors ligne. Si None,
+                les choix sont envoyes directement (et perdus en cas d'echec).
+            batch_size: Nombre maximum de choix envoyes par lot
+            flush_interval: Delai entre deux envois de la file (secondes)
+            max_backoff: Delai maximum entre deux tentatives en echec
+            retries: Nouveaux essais d'une requete (connexion impossible,
+                502/503/504 pour les methodes idempotentes)
+            retry_backoff: Base du delai entre deux essais (secondes)
+            gzip_min_size: Taille a partir de laquelle le corps JSON est
+                compresse en gzip (octets, 0 = jamais)
+            pool_size: Connexions conservees par serveur
         """
         self.base_url = base_url.rstrip("/")
         self.machine_name = machine_name
         self.timeout = timeout
+        self.gzip_min_size = gzip_min_size
         self._enabled = REQUESTS_AVAILABLE
+        self._session = None
+        self._outbox: Optional[Outbox] = None
+        self._flusher: Optional[OutboxFlusher] = None
+        self._stats_lock = threading.Lock()
+        self._sent = {"requests": 0, "gzip_requests": 0, "body_bytes": 0, "wire_bytes": 0}
 
         if not self._enabled:
             logger.warning("requests non disponible - logging API desactive")
+            return
+
+        self._session = self._create_session(retries, retry_backoff, pool_size)
+        if outbox_path is not None:
+            self._outbox = Outbox(outbox_path)
+            self._flusher = OutboxFlusher(
+                self._outbox,
+                self._send_batch,
+                batch_size=batch_size,
+                interval=flush_interval,
+                max_backoff=max_backoff
+            )
+
+    @staticmethod
+    def _create_session(retries: int, retry_backoff: float, pool_size: int):
+        """
+        Cree la session HTTP partagee (keep-alive, pool, nouveaux essais).
+
+        Une requete non idempotente (POST) n'est reessayee que si la
+        connexion n'a pas pu etre etablie : elle n'a pas atteint le serveur.
+        """
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=0,
+            status=retries,
+            status_forcelist=(502, 503, 504),
+            backoff_factor=retry_backoff,
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def start(self) -> None:
+        """Demarre l'envoi en arriere-plan de la file d'attente."""
+        if self._flusher is not None and not self._flusher.is_alive():
+            pending = len(self._outbox)
+            if pending:
+                logger.info(f"{pending} choix en attente d'envoi")
+            self._flusher.start()
+
+    def close(self, timeout: float = 5.0) -> None:
+        """
+        Arrete l'envoi en arriere-plan.
+
+        Une derniere tentative d'envoi est faite ; les choix non envoyes
+        restent dans la file et seront envoyes au prochain demarrage.
+
+        Args:
+            timeout: Delai maximum d'attente de l'arret (secondes).
+        """
+        if self._flusher is not None and self._flusher.is_alive():
+            self._flusher.stop(timeout)
+        if self._outbox is not None and not self._flusher.is_alive():
+            self._outbox.close()
+        if self._session is not None:
+            self._session.close()
 
     def _make_request(
         self,
         method: str,
         endpoint: str,
         json: Optional[dict] = None,
-        params: Optional[dict] = None
+        params: Optional[dict] = None,
+        raise_rejected: bool = False
     ) -> Optional[dict]:
         """
         Effectue une requete HTTP.
@@ -53,26 +157,51 @@ class APIClient:
             endpoint: Endpoint relatif (ex: /choices)
             json: Corps de la requete en JSON
             params: Parametres de requete
+            raise_rejected: Lever BatchRejected sur une erreur 4xx
+                definitive (hors 408 et 429) au lieu de retourner None
 
         Returns:
             Reponse JSON ou None en cas d'erreur.
+
+        Raises:
+            BatchRejected: Requete refusee par le serveur (raise_rejected).
         """
         if not self._enabled:
             return None
 
         url = urljoin(self.base_url, endpoint)
 
+        body = None
+        headers = {}
+        if json is not None:
+            body = json_dumps(json).encode("utf-8")
+            headers["Content-Type"] = "application/json"
+        raw_size = len(body) if body else 0
+        if body and self.gzip_min_size and raw_size >= self.gzip_min_size:
+            body = gzip.compress(body, compresslevel=6)
+            headers["Content-Encoding"] = "gzip"
+
+        with self._stats_lock:
+            self._sent["requests"] += 1
+            self._sent["body_bytes"] += raw_size
+            self._sent["wire_bytes"] += len(body) if body else 0
+            if "Content-Encoding" in headers:
+                self._sent["gzip_requests"] += 1
+
         try:
-            response = requests.request(
+            response = self._session.request(
                 method=method,
                 url=url,
-                json=json,
+                data=body,
+                headers=headers,
                 params=params,
                 timeout=self.timeout
             )
 
             if response.status_code >= 400:
                 logger.error(f"Erreur API {response.status_code}: {response.text}")
+                if raise_rejected and 400 <= response.status_code < 500 and response.status_code not in (408, 429):
+                    raise BatchRejected(f"{response.status_code}: {response.text[:200]}")
                 return None
 
             if response.status_code == 204:
@@ -104,6 +233,10 @@ class APIClient:
         """
         Enregistre un choix utilisateur sur le serveur.
 
+        Avec une file d'attente, le choix est ecrit localement avec son
+        horodatage et envoye en arriere-plan : l'appel ne bloque jamais
+        sur le reseau.
+
         Args:
             choice: Lettre du bouton presse (A-G)
             video_path: Chemin de la video jouee
@@ -114,9 +247,17 @@ class APIClient:
         payload = {
             "choix": choice.upper(),
             "video": video_path,
-            "machine": self.machine_name
+            "machine": self.machine_name,
+            "event_time": datetime.now(timezone.utc).isoformat(),
+            "event_id": str(uuid.uuid4())
         }
 
+        if self._outbox is not None:
+            self._outbox.put(payload)
+            self._flusher.notify()
+            logger.debug(f"Choix mis en file: {choice} -> {video_path}")
+            return True
+
         result = self._make_request("POST", "/choices", json=payload)
 
         if result:
@@ -124,6 +265,38 @@ class APIClient:
             return True
         return False
 
+    def _send_batch(self, events: List[dict]) -> Optional[Dict[int, str]]:
+        """
+        Envoie un lot de choix au serveur (/choices/batch).
+
+        Args:
+            events: Choix a envoyer
+
+        Un lot renvoye apres une reponse perdue n'est pas compte deux fois :
+        le serveur ignore les event_id deja enregistres (statut duplicate).
+
+        Returns:
+            Choix rejetes par le serveur (position dans le lot -> raison),
+            a mettre de cote, ou None s'il faut reessayer le lot.
+
+        Raises:
+            BatchRejected: Lot refuse en entier (4xx), a ne pas renvoyer tel quel.
+        """
+        result = self._make_request("POST", "/choices/batch", json=events, raise_rejected=True)
+        if result is None:
+            return None
+
+        # Un choix rejete par le serveur ne sera jamais accepte : il est mis
+        # de cote par la file d'attente (outbox_rejected)
+        rejected = {
+            item["index"]: item.get("error") or item.get("status", "rejected")
+            for item in result.get("items", [])
+            if item.get("status") not in ("created", "accepted", "duplicate")
+        }
+
+        logger.debug(f"{result.get('created', 0)} choix envoyes")
+        return rejected
+
     def register_machine(
         self,
         description: Optional[str] = None,
@@ -153,6 +326,19 @@ class APIClient:
             return True
         return False
 
+    def send_heartbeat(self, payload: dict) -> bool:
+        """
+        Envoie un heartbeat (histogrammes de reactivite, voir telemetry.py).
+
+        Args:
+            payload: Contenu du heartbeat
+
+        Returns:
+            True si le serveur l'a accepte, False sinon.
+        """
+        endpoint = f"/machines/{quote(self.machine_name, safe='')}/heartbeat"
+        return self._make_request("POST", endpoint, json=payload) is not None
+
     def get_stats(self, days: int = 7) -> Optional[dict]:
         """
         Recupere les statistiques depuis le serveur.
@@ -169,7 +355,39 @@ class APIClient:
         }
         return self._make_request("GET", "/stats", params=params)
 
+    @property
+    def connection_stats(self) -> dict:
+        """
+        Statistiques de reutilisation des connexions HTTP.
+
+        Returns:
+            requests: requetes envoyees (hors nouveaux essais)
+            connections: connexions ouvertes (TCP, TLS)
+            reuse_ratio: part des requetes servies par une connexion existante
+            gzip_requests: requetes dont le corps a ete compresse
+            body_bytes / wire_bytes: taille des corps avant / apres compression
+        """
+        with self._stats_lock:
+            stats = dict(self._sent)
+
+        connections = 0
+        if self._session is not None:
+            pools = self._session.get_adapter(self.base_url).poolmanager.pools
+            connections = sum(pools[key].num_connections for key in pools.keys())
+
+        stats["connections"] = connections
+        requests_count = stats["requests"]
+        stats["reuse_ratio"] = (
+            round(max(0.0, 1 - connections / requests_count), 3) if requests_count else 0.0
+        )
+        return stats
+
     @property
     def is_enabled(self) -> bool:
         """Indique si le client API est actif."""
         return self._enabled
+
+    @property
+    def pending_choices(self) -> int:
+        """Nombre de choix en attente d'envoi."""
+        return len(self._outbox) if self._outbox is not None else 0
@@ -0,0 +1,147 @@
+"""
+Catalogue en memoire des videos de la borne.
+
+Le catalogue est construit au demarrage puis tenu a jour en surveillant
+la date de modification des dossiers A-G : une pression de bouton ne
+fait plus aucun acces disque pour trouver sa video.
+"""
+
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def get_latest_video(folder: Path, extensions: List[str]) -> Optional[Path]:
+    """
+    Trouve la video la plus recente dans un dossier.
+
+    Args:
+        folder: Chemin du dossier a analyser.
+        extensions: Extensions de fichiers video acceptees.
+
+    Returns:
+        Le chemin vers la video la plus recente, ou None si aucune.
+    """
+    latest: Optional[os.DirEntry] = None
+    latest_mtime = 0.0
+
+    # Un seul parcours du dossier, quelle que soit la liste d'extensions
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            if os.path.splitext(entry.name)[1] not in extensions:
+                continue
+            if not entry.is_file():
+                continue
+            mtime = entry.stat().st_mtime
+            if latest is None or mtime > latest_mtime:
+                latest, latest_mtime = entry, mtime
+
+    return Path(latest.path) if latest else None
+
+
+class VideoCatalog:
+    """Derniere video de chaque bouton, mise a jour par scrutation des dossiers."""
+
+    def __init__(
+        self,
+        root: Path,
+        commands: List[str],
+        extensions: List[str],
+        refresh_interval: float = 2.0
+    ):
+        """
+        Initialise le catalogue (vide, voir reload()).
+
+        Args:
+            root: Dossier racine des videos.
+            commands: Boutons geres (un sous-dossier par bouton).
+            extensions: Extensions de fichiers video acceptees.
+            refresh_interval: Delai minimum entre deux verifications (secondes).
+        """
+        self.root = Path(root)
+        self.commands = list(commands)
+        self.extensions = list(extensions)
+        self.refresh_interval = refresh_interval
+        self._latest: Dict[str, Optional[Path]] = {}
+        self._mtimes: Dict[str, Optional[float]] = {}
+        self._last_check = 0.0
+
+    def _scan(self, command: str, mtime: Optional[float]) -> None:
+        """
+        Relit le dossier d'un bouton.
+
+        Args:
+            command: Bouton (A-G).
+            mtime: Date de modification du dossier (None s'il est absent).
+        """
+        folder = self.root / command
+        self._mtimes[command] = mtime
+
+        if mtime is None:
+            logger.error(f"Dossier manquant: {folder}")
+            self._latest[command] = None
+            return
+
+        try:
+            latest = get_latest_video(folder, self.extensions)
+        except OSError as e:
+            logger.error(f"Erreur lecture dossier {folder}: {e}")
+            latest = None
+
+        if latest is None:
+            logger.warning(f"Aucune video dans {folder}")
+        elif latest != self._latest.get(command):
+            logger.info(f"Video {command}: {latest.name}")
+        self._latest[command] = latest
+
+    def _folder_mtime(self, command: str) -> Optional[float]:
+        """Date de modification du dossier d'un bouton (None s'il est absent)."""
+        try:
+            return (self.root / command).stat().st_mtime
+        except OSError:
+            return None
+
+    def reload(self) -> None:
+        """Reconstruit entierement le catalogue."""
+        for command in self.commands:
+            self._scan(command, self._folder_mtime(command))
+        self._last_check = time.monotonic()
+
+    def refresh(self) -> None:
+        """
+        Relit les dossiers modifies depuis la derniere verification.
+
+        Ne fait rien si la derniere verification date de moins de
+        refresh_interval. L'ajout, la suppression ou le renommage d'une
+        video modifie la date du dossier ; une video remplacee en place
+        n'est prise en compte qu'au prochain reload().
+        """
+        now = time.monotonic()
+        if now - self._last_check < self.refresh_interval:
+            return
+        self._last_check = now
+
+        for command in self.commands:
+            mtime = self._folder_mtime(command)
+            if mtime != self._mtimes.get(command):
+                self._scan(command, mtime)
+
+    def latest(self, command: str) -> Optional[Path]:
+        """
+        Retourne la video a jouer pour un bouton.
+
+        Args:
+            command: Bouton (A-G).
+
+        Returns:
+            Le chemin de la video la plus recente, ou None si aucune.
+        """
+        return self._latest.get(command)
+
+    def snapshot(self) -> Dict[str, Optional[Path]]:
+        """Retourne une copie du contenu du catalogue (bouton -> video)."""
+        return dict(self._latest)
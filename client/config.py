@@ -32,6 +32,13 @@ class VideoConfig:
     VALID_COMMANDS: List[str] = ["A", "B", "C", "D", "E", "F", "G"]
     SUPPORTED_EXTENSIONS: List[str] = [".mp4", ".mkv", ".avi", ".mov", ".webm"]
 
+    # Delai entre deux verifications des dossiers de videos (secondes)
+    CATALOG_REFRESH_INTERVAL: float = float(os.getenv("CATALOG_REFRESH_INTERVAL", "2"))
+
+    # Mode du lecteur : "process" (un MPV par video) ou "ipc" (MPV persistant)
+    PLAYER_MODE: str = os.getenv("PLAYER_MODE", "process")
+    MPV_SOCKET: Path = Path(os.getenv("MPV_SOCKET", "/tmp/mpv-kiosk.sock"))
+
     @classmethod
     def generic_path(cls) -> Path:
         """Retourne le chemin complet vers la video generique."""
@@ -43,12 +50,31 @@ class APIConfig:
     BASE_URL: str = os.getenv("API_URL", "http://localhost:8000")
     TIMEOUT: float = float(os.getenv("API_TIMEOUT", "5.0"))
 
+    # Session HTTP persistante : nouveaux essais et compression des corps
+    RETRIES: int = int(os.getenv("API_RETRIES", "2"))
+    RETRY_BACKOFF: float = float(os.getenv("API_RETRY_BACKOFF", "0.5"))
+    GZIP_MIN_SIZE: int = int(os.getenv("API_GZIP_MIN_SIZE", "1024"))
+
     # Identifiant de cette borne
     MACHINE_NAME: str = os.getenv("MACHINE_NAME", "borne_01")
     MACHINE_DESCRIPTION: str = os.getenv("MACHINE_DESCRIPTION", "")
     MACHINE_LOCATION: str = os.getenv("MACHINE_LOCATION", "")
 
 
+class OutboxConfig:
+    """Configuration de la file d'attente hors ligne."""
+    PATH: Path = Path(os.getenv("OUTBOX_PATH", "./outbox.sqlite3"))
+    BATCH_SIZE: int = int(os.getenv("OUTBOX_BATCH_SIZE", "100"))
+    FLUSH_INTERVAL: float = float(os.getenv("OUTBOX_FLUSH_INTERVAL", "2.0"))
+    MAX_BACKOFF: float = float(os.getenv("OUTBOX_MAX_BACKOFF", "300"))
+
+
+class TelemetryConfig:
+    """Configuration des mesures de reactivite."""
+    # Delai entre deux heartbeats envoyes au serveur (0 = desactive)
+    HEARTBEAT_INTERVAL: float = float(os.getenv("HEARTBEAT_INTERVAL", "60"))
+
+
 class LogConfig:
     """Configuration du logging."""
     LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
@@ -64,3 +90,9 @@ class AppConfig:
 
     # Delai avant de terminer un processus video
     STOP_DELAY: float = 0.3
+
+    # Delai minimum entre deux relances de la video generique (MPV arrete)
+    RESTART_DELAY: float = float(os.getenv("RESTART_DELAY", "2"))
+
+    # Periode maximale de la boucle principale (detection de fin de video)
+    LOOP_INTERVAL: float = float(os.getenv("LOOP_INTERVAL", "0.1"))
@@ -8,18 +8,24 @@ Les donnees sont envoyees au serveur API centralise.
 """
 
 import logging
+import selectors
 import signal
 import subprocess
 import sys
 import time
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional, Tuple
 
 import serial
 from serial import SerialException
 
-from config import SerialConfig, VideoConfig, AppConfig, LogConfig, APIConfig
+from config import (
+    SerialConfig, VideoConfig, AppConfig, LogConfig, APIConfig, OutboxConfig, TelemetryConfig
+)
 from api_client import APIClient
+from catalog import VideoCatalog
+from mpv_ipc import MPVIPCPlayer
+from telemetry import HeartbeatSender, telemetry
 
 # Configuration du logging
 logging.basicConfig(
@@ -42,23 +48,32 @@ class VideoPlayer:
     def __init__(self):
         """Initialise le lecteur video."""
         self._process: Optional[subprocess.Popen] = None
+        # Processus MPV arretes (SIGTERM) et echeance du SIGKILL (None = deja tue)
+        self._stopping: List[Tuple[subprocess.Popen, Optional[float]]] = []
 
     def stop(self) -> None:
-        """Arrete la video en cours de lecture."""
+        """
+        Arrete la video en cours de lecture sans attendre.
+
+        Le processus recoit SIGTERM ; s'il tourne encore apres
+        AppConfig.STOP_DELAY, process_events() le tue.
+        """
         if self._process and self._process.poll() is None:
             logger.debug("Arret de la video en cours")
-            self._process.terminate()
-            time.sleep(AppConfig.STOP_DELAY)
-            if self._process.poll() is None:
-                self._process.kill()
+            with telemetry.span("player_stop"):
+                self._process.terminate()
+            self._stopping.append((self._process, time.monotonic() + AppConfig.STOP_DELAY))
 
-    def play(self, video_path: Path, loop: bool = False) -> bool:
+    def play(self, video_path: Path, loop: bool = False, requested_at: Optional[float] = None) -> bool:
         """
         Lance la lecture d'une video.
 
         Args:
             video_path: Chemin vers le fichier video.
             loop: Si True, la video boucle indefiniment.
+            requested_at: Reception de l'appui (time.monotonic()). Sans
+                evenement de premiere image dans ce mode, button_to_play
+                est mesure jusqu'au lancement du processus MPV.
 
         Returns:
             True si la lecture a demarre, False sinon.
@@ -81,7 +96,6 @@ class VideoPlayer:
                 stdout=subprocess.DEVNULL,
                 stderr=subprocess.DEVNULL
             )
-            return True
         except FileNotFoundError:
             logger.error("MPV non installe ou non trouve dans le PATH")
             return False
@@ -89,6 +103,10 @@ class VideoPlayer:
             logger.error(f"Erreur lancement MPV: {e}")
             return False
 
+        if requested_at is not None:
+            telemetry.since("button_to_play", requested_at)
+        return True
+
     def play_generic(self) -> bool:
         """Lance la video generique en boucle."""
         generic_path = VideoConfig.generic_path()
@@ -97,26 +115,41 @@ class VideoPlayer:
             return False
         return self.play(generic_path, loop=True)
 
-    def wait_for_end(self, timeout: Optional[float] = None) -> bool:
-        """
-        Attend la fin de la video en cours.
+    def close(self) -> None:
+        """Arrete le lecteur et attend la fin des processus MPV."""
+        self.stop()
+        for process, deadline in self._stopping:
+            try:
+                process.wait(timeout=max(0.0, (deadline or 0.0) - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+        self._stopping.clear()
 
-        Args:
-            timeout: Delai maximum en secondes (None = infini).
+    def process_events(self) -> None:
+        """
+        Tue les processus MPV arretes qui tournent encore apres STOP_DELAY.
 
-        Returns:
-            True si la video s'est terminee normalement, False si timeout.
+        A appeler a chaque tour de boucle ; la fin de video est detectee
+        par is_playing.
         """
-        if not self._process:
-            return True
+        if not self._stopping:
+            return
+        now = time.monotonic()
+        stopping = []
+        for process, deadline in self._stopping:
+            if process.poll() is not None:
+                continue
+            if deadline is not None and now >= deadline:
+                process.kill()
+                deadline = None
+            stopping.append((process, deadline))
+        self._stopping = stopping
 
-        try:
-            self._process.wait(timeout=timeout)
-            return True
-        except subprocess.TimeoutExpired:
-            logger.warning("Timeout - arret force de la video")
-            self.stop()
-            return False
+    @property
+    def event_source(self) -> None:
+        """Pas de source d'evenements a surveiller pour ce lecteur."""
+        return None
 
     @property
     def is_playing(self) -> bool:
@@ -130,6 +163,7 @@ class SerialController:
     def __init__(self):
         """Initialise le controleur serie."""
         self._serial: Optional[serial.Serial] = None
+        self._buffer = b""
 
     def connect(self) -> bool:
         """
@@ -156,61 +190,66 @@ class SerialController:
             self._serial.close()
             logger.info("Port serie ferme")
 
-    def read_command(self) -> Optional[str]:
+    def fileno(self) -> int:
+        """Descripteur du port serie (pour un selecteur)."""
+        return self._serial.fileno()
+
+    def _parse(self, raw: bytes) -> Optional[str]:
         """
-        Lit une commande depuis le port serie.
+        Decode une ligne recue.
+
+        Args:
+            raw: Ligne brute lue sur le port serie.
 
         Returns:
             La commande lue (A-G) ou None si invalide/vide.
         """
-        if not self._serial or not self._serial.is_open:
-            return None
-
         try:
-            data = self._serial.readline().decode("utf-8").strip().upper()
-
-            if not data:
-                return None
-
-            if data not in VideoConfig.VALID_COMMANDS:
-                if data != "READY":
-                    logger.warning(f"Commande inconnue: {data}")
-                return None
-
-            logger.debug(f"Commande recue: {data}")
-            return data
-
+            data = raw.decode("utf-8").strip().upper()
         except UnicodeDecodeError:
             logger.warning("Erreur decodage donnees serie")
             return None
-        except SerialException as e:
-            logger.error(f"Erreur lecture serie: {e}")
+
+        if not data:
             return None
 
-    @property
-    def is_connected(self) -> bool:
-        """Indique si le port serie est connecte."""
-        return self._serial is not None and self._serial.is_open
+        if data not in VideoConfig.VALID_COMMANDS:
+            if data != "READY":
+                logger.warning(f"Commande inconnue: {data}")
+            return None
 
+        logger.debug(f"Commande recue: {data}")
+        return data
 
-def get_latest_video(folder: Path) -> Optional[Path]:
-    """
-    Trouve la video la plus recente dans un dossier.
+    def read_commands(self) -> List[str]:
+        """
+        Lit les commandes disponibles sans attendre de fin de ligne.
 
-    Args:
-        folder: Chemin du dossier a analyser.
+        A appeler lorsque le port est pret en lecture. Les lignes
+        incompletes sont conservees jusqu'a l'appel suivant. En cas
+        d'erreur (Arduino debranche), le port est ferme.
 
-    Returns:
-        Le chemin vers la video la plus recente, ou None si aucune.
-    """
-    videos = []
-    for ext in VideoConfig.SUPPORTED_EXTENSIONS:
-        videos.extend(folder.glob(f"*{ext}"))
+        Returns:
+            Les commandes completes recues (A-G), dans l'ordre.
+        """
+        if not self._serial or not self._serial.is_open:
+            return []
 
-    if not videos:
-        return None
+        try:
+            self._buffer += self._serial.read(self._serial.in_waiting or 1)
+        except (SerialException, OSError) as e:
+            logger.error(f"Erreur lecture serie: {e}")
+            self.disconnect()
+            return []
 
-    return max(videos, key=lambda f: f.stat().st_mtime)
+        *lines, self._buffer = self._buffer.split(b"\n")
+        commands = [self._parse(line) for line in lines]
+        return [command for command in commands if command]
+
+    @property
+    def is_connected(self) -> bool:
+        """Indique si le port serie est connecte."""
+        return self._serial is not None and self._serial.is_open
 
 
 class Application:
@@ -218,16 +257,42 @@ class Application:
 
     def __init__(self):
         """Initialise l'application."""
-        self.player = VideoPlayer()
+        if VideoConfig.PLAYER_MODE == "ipc":
+            self.player = MPVIPCPlayer(VideoConfig.MPV_SOCKET)
+        else:
+            self.player = VideoPlayer()
         self.serial = SerialController()
+        self.catalog = VideoCatalog(
+            root=VideoConfig.ROOT,
+            commands=VideoConfig.VALID_COMMANDS,
+            extensions=VideoConfig.SUPPORTED_EXTENSIONS,
+            refresh_interval=VideoConfig.CATALOG_REFRESH_INTERVAL
+        )
         self.api = APIClient(
             base_url=APIConfig.BASE_URL,
             machine_name=APIConfig.MACHINE_NAME,
-            timeout=APIConfig.TIMEOUT
+            timeout=APIConfig.TIMEOUT,
+            outbox_path=OutboxConfig.PATH,
+            batch_size=OutboxConfig.BATCH_SIZE,
+            flush_interval=OutboxConfig.FLUSH_INTERVAL,
+            max_backoff=OutboxConfig.MAX_BACKOFF,
+            retries=APIConfig.RETRIES,
+            retry_backoff=APIConfig.RETRY_BACKOFF,
+            gzip_min_size=APIConfig.GZIP_MIN_SIZE
         )
+        self.heartbeat: Optional[HeartbeatSender] = None
+        if TelemetryConfig.HEARTBEAT_INTERVAL > 0:
+            self.heartbeat = HeartbeatSender(
+                self.api.send_heartbeat,
+                interval=TelemetryConfig.HEARTBEAT_INTERVAL,
+                status=self._status
+            )
         self.running = False
         self._last_cmd: Optional[str] = None
         self._last_event_time: float = 0
+        self._playing_choice = False
+        # Prochaine relance possible de la video generique (time.monotonic())
+        self._generic_retry_at: float = 0
 
     def setup(self) -> bool:
         """
@@ -247,6 +312,14 @@ class Application:
         else:
             logger.warning("Serveur API non accessible - mode hors ligne")
 
+        # Envoi en arriere-plan des choix (y compris ceux en attente)
+        self.api.start()
+        if self.heartbeat is not None:
+            self.heartbeat.start()
+
+        # Catalogue des videos
+        self.catalog.reload()
+
         # Connexion au port serie
         if not self.serial.connect():
             return False
@@ -260,17 +333,36 @@ class Application:
     def cleanup(self) -> None:
         """Nettoie les ressources avant arret."""
         logger.info("Arret de l'application")
-        self.player.stop()
+        self.player.close()
         self.serial.disconnect()
-
-    def handle_command(self, command: str) -> None:
+        if self.heartbeat is not None and self.heartbeat.is_alive():
+            self.heartbeat.stop(timeout=1.0)
+        self.api.close()
+
+    def _status(self) -> dict:
+        """Etat de la borne joint a chaque heartbeat."""
+        return {
+            "mode": VideoConfig.PLAYER_MODE,
+            "pending": self.api.pending_choices,
+            "http": self.api.connection_stats
+        }
+
+    def handle_command(self, command: str, received_at: Optional[float] = None) -> None:
         """
         Traite une commande recue.
 
+        Ne bloque pas : la video est lancee, le choix est mis en file
+        d'envoi, et le retour a la video generique est gere par
+        check_playback(). Chaque etape est chronometree (telemetry.py).
+
         Args:
             command: La commande a traiter (A-G).
+            received_at: Instant de reception de la ligne serie
+                (time.monotonic()), par defaut maintenant.
         """
         now = time.time()
+        if received_at is None:
+            received_at = time.monotonic()
 
         # Anti-spam
         if now - self._last_event_time < AppConfig.MIN_INTERVAL:
@@ -281,46 +373,101 @@ class Application:
         if command == self._last_cmd:
             return
 
-        folder = VideoConfig.ROOT / command
-
-        if not folder.is_dir():
-            logger.error(f"Dossier manquant: {folder}")
-            return
-
-        latest_video = get_latest_video(folder)
+        with telemetry.span("catalog_lookup"):
+            latest_video = self.catalog.latest(command)
 
         if not latest_video:
-            logger.warning(f"Aucune video dans {folder}")
+            logger.warning(f"Aucune video pour le bouton {command}")
             return
 
-        # Lecture de la video selectionnee
-        if self.player.play(latest_video):
-            # Log sur le serveur API
-            self.api.log_choice(command, str(latest_video))
+        # Lecture de la video selectionnee ; le lecteur mesure button_to_play
+        # jusqu'a la premiere image (mode ipc)
+        with telemetry.span("player_play"):
+            started = self.player.play(latest_video, requested_at=received_at)
 
-            # Attendre la fin de la video
-            self.player.wait_for_end()
+        if started:
+            self._playing_choice = True
 
-            # Retour a la video generique
-            self.player.play_generic()
+            # Log sur le serveur API (file d'attente, non bloquant)
+            with telemetry.span("log_choice"):
+                self.api.log_choice(command, str(latest_video))
 
             self._last_cmd = command
             self._last_event_time = now
 
+    def check_playback(self) -> None:
+        """
+        Revient a la video generique a la fin d'une video de choix.
+
+        Relance aussi la video generique si le lecteur s'est arrete pendant
+        l'attente (MPV tue ou plante), au plus toutes les
+        AppConfig.RESTART_DELAY secondes.
+        """
+        if self.player.is_playing:
+            return
+        if self._playing_choice:
+            self._playing_choice = False
+        else:
+            now = time.monotonic()
+            if now < self._generic_retry_at:
+                return
+            self._generic_retry_at = now + AppConfig.RESTART_DELAY
+            logger.warning("Lecteur arrete - relance de la video generique")
+        self.player.play_generic()
+
     def run(self) -> None:
-        """Boucle principale de l'application."""
+        """
+        Boucle principale de l'application.
+
+        Le port serie (et le socket IPC de MPV en mode ipc) est surveille
+        par un selecteur : une commande est traitee des son arrivee, y
+        compris pendant la lecture d'une video. La fin de la video est
+        verifiee a chaque tour de boucle (au plus toutes les
+        AppConfig.LOOP_INTERVAL secondes).
+        """
         self.running = True
         logger.info(f"Application demarree - Machine: {APIConfig.MACHINE_NAME}")
 
-        while self.running:
-            try:
-                command = self.serial.read_command()
-                if command:
-                    self.handle_command(command)
-
-            except KeyboardInterrupt:
-                logger.info("Arret demande par l'utilisateur")
-                self.running = False
+        with selectors.DefaultSelector() as selector:
+            selector.register(self.serial.fileno(), selectors.EVENT_READ, "serial")
+            player_source = None
+
+            while self.running:
+                try:
+                    # Le socket du lecteur change si MPV est relance
+                    if self.player.event_source is not player_source:
+                        if player_source is not None:
+                            selector.unregister(player_source)
+                        player_source = self.player.event_source
+                        if player_source is not None:
+                            selector.register(player_source, selectors.EVENT_READ, "player")
+
+                    for key, _ in selector.select(timeout=AppConfig.LOOP_INTERVAL):
+                        if key.data == "player":
+                            self.player.process_events()
+                        else:
+                            # Reference des mesures : arrivee des donnees serie
+                            received_at = time.monotonic()
+                            with telemetry.span("serial_read"):
+                                commands = self.serial.read_commands()
+                            for command in commands:
+                                self.handle_command(command, received_at)
+
+                    # Lecteur sans socket (mode process) : echeances d'arret
+                    if player_source is None:
+                        self.player.process_events()
+
+                    if not self.serial.is_connected:
+                        logger.error("Port serie perdu - arret de l'application")
+                        self.running = False
+                        break
+
+                    self.check_playback()
+                    self.catalog.refresh()
+
+                except KeyboardInterrupt:
+                    logger.info("Arret demande par l'utilisateur")
+                    self.running = False
 
 
 def main() -> int:
@@ -337,8 +484,16 @@ def main() -> int:
         logger.info("Signal recu, arret en cours...")
         app.running = False
 
+    # SIGHUP : relecture complete du catalogue des videos
+    def reload_handler(_signum, _frame):
+        logger.info("Signal SIGHUP recu, relecture du catalogue")
+        app.catalog.reload()
+        for command, video in app.catalog.snapshot().items():
+            logger.info(f"  {command}: {video.name if video else '(aucune)'}")
+
     signal.signal(signal.SIGTERM, signal_handler)
     signal.signal(signal.SIGINT, signal_handler)
+    signal.signal(signal.SIGHUP, reload_handler)
 
     try:
         if not app.setup():
@@ -346,7 +501,7 @@ def main() -> int:
             return 1
 
         app.run()
-        return 0
+        return 0 if app.serial.is_connected else 1
 
     except Exception as e:
         logger.exception(f"Erreur fatale: {e}")
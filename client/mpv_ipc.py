@@ -0,0 +1,295 @@
+"""
+Lecteur video base sur une instance MPV persistante.
+
+Une seule instance de MPV est lancee au demarrage et pilotee via son
+serveur IPC JSON (--input-ipc-server). Le passage de la video generique
+a une video de choix est quasi instantane : pas de nouveau processus,
+pas d'ecran noir entre deux videos.
+"""
+
+import json
+import logging
+import socket
+import subprocess
+import time
+from pathlib import Path
+from typing import Optional
+
+from config import VideoConfig, AppConfig
+from telemetry import telemetry
+
+logger = logging.getLogger(__name__)
+
+
+class MPVIPCPlayer:
+    """Gestionnaire de lecture video avec une instance MPV pilotee en IPC."""
+
+    # Delai maximum d'apparition du socket IPC au lancement de MPV
+    CONNECT_TIMEOUT: float = 5.0
+
+    def __init__(self, socket_path: Path):
+        """
+        Initialise le lecteur video.
+
+        Args:
+            socket_path: Chemin du socket IPC de MPV.
+        """
+        self.socket_path = Path(socket_path)
+        self._process: Optional[subprocess.Popen] = None
+        self._socket: Optional[socket.socket] = None
+        self._buffer = b""
+        self._request_id = 0
+        self._playing = False
+        self._pending_loads = 0
+        self._current_entry: Optional[int] = None
+        # Instant du dernier loadfile, jusqu'a l'affichage de sa premiere image
+        self._load_started: Optional[float] = None
+        # Reception de l'appui qui a demande ce loadfile (button_to_play)
+        self._requested_at: Optional[float] = None
+
+    def _start(self) -> bool:
+        """
+        Lance MPV en mode inactif et se connecte a son socket IPC.
+
+        Un MPV precedent encore en vie (socket IPC en erreur) est arrete
+        avant le lancement : une seule instance a l'ecran.
+
+        Returns:
+            True si MPV est pret, False sinon.
+        """
+        self._disconnect()
+        self._terminate()
+        if self.socket_path.exists():
+            self.socket_path.unlink()
+
+        cmd = [
+            "mpv", "--fs", "--no-terminal", "--idle=yes", "--force-window=yes",
+            f"--input-ipc-server={self.socket_path}"
+        ]
+        try:
+            self._process = subprocess.Popen(
+                cmd,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL
+            )
+        except FileNotFoundError:
+            logger.error("MPV non installe ou non trouve dans le PATH")
+            return False
+        except OSError as e:
+            logger.error(f"Erreur lancement MPV: {e}")
+            return False
+
+        deadline = time.monotonic() + self.CONNECT_TIMEOUT
+        while time.monotonic() < deadline and self._process.poll() is None:
+            try:
+                sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                sock.connect(str(self.socket_path))
+            except OSError:
+                sock.close()
+                time.sleep(0.05)
+                continue
+
+            sock.setblocking(False)
+            self._socket = sock
+            logger.info(f"MPV demarre (IPC: {self.socket_path})")
+            return True
+
+        logger.error("Impossible de se connecter au socket IPC de MPV")
+        self.close()
+        return False
+
+    def _disconnect(self) -> None:
+        """Ferme le socket IPC et reinitialise l'etat de lecture."""
+        if self._socket:
+            self._socket.close()
+            self._socket = None
+        self._buffer = b""
+        self._playing = False
+        self._pending_loads = 0
+        self._current_entry = None
+        self._load_started = None
+        self._requested_at = None
+
+    def _terminate(self) -> None:
+        """Arrete le processus MPV s'il tourne encore (SIGTERM puis SIGKILL) et attend sa fin."""
+        if self._process is None or self._process.poll() is not None:
+            return
+        logger.warning("Arret de l'instance MPV precedente")
+        self._process.terminate()
+        try:
+            self._process.wait(timeout=AppConfig.STOP_DELAY)
+        except subprocess.TimeoutExpired:
+            self._process.kill()
+            self._process.wait()
+
+    def _command(self, *args) -> bool:
+        """
+        Envoie une commande a MPV (sans attendre la reponse).
+
+        Args:
+            args: Nom de la commande et ses arguments.
+
+        Returns:
+            True si la commande a ete envoyee, False sinon.
+        """
+        if not self._socket:
+            return False
+
+        self._request_id += 1
+        message = {"command": list(args), "request_id": self._request_id}
+        try:
+            self._socket.sendall(json.dumps(message).encode("utf-8") + b"\n")
+            return True
+        except BlockingIOError:
+            # Tampon plein : MPV ne lit plus ses commandes
+            logger.error("Socket IPC de MPV sature")
+            return False
+        except OSError as e:
+            logger.error(f"Erreur IPC MPV: {e}")
+            self._disconnect()
+            return False
+
+    def _handle_message(self, message: dict) -> None:
+        """
+        Met a jour l'etat de lecture a partir d'un message de MPV.
+
+        Args:
+            message: Message JSON recu (evenement ou reponse).
+        """
+        event = message.get("event")
+
+        if event is None:
+            if message.get("error", "success") != "success":
+                logger.warning(f"Commande MPV refusee: {message.get('error')}")
+            return
+
+        if event == "start-file":
+            # Les start-file arrivent dans l'ordre des loadfile envoyes
+            self._pending_loads = max(0, self._pending_loads - 1)
+            self._current_entry = message.get("playlist_entry_id")
+
+        elif event == "playback-restart":
+            # Premiere image de la derniere video chargee
+            if self._load_started is not None and not self._pending_loads:
+                telemetry.since("mpv_first_frame", self._load_started)
+                self._load_started = None
+                if self._requested_at is not None:
+                    telemetry.since("button_to_play", self._requested_at)
+                    self._requested_at = None
+
+        elif event == "end-file":
+            # Ignore la fin d'une video remplacee par un loadfile plus recent
+            if self._pending_loads or message.get("playlist_entry_id") != self._current_entry:
+                return
+            if message.get("reason") == "error":
+                logger.error(f"Erreur de lecture MPV: {message.get('file_error')}")
+            if message.get("reason") in ("eof", "error", "quit"):
+                self._playing = False
+
+    def process_events(self) -> None:
+        """Lit et traite les messages disponibles sur le socket IPC."""
+        if not self._socket:
+            return
+
+        while True:
+            try:
+                data = self._socket.recv(65536)
+            except BlockingIOError:
+                break
+            except OSError as e:
+                logger.error(f"Erreur IPC MPV: {e}")
+                self._disconnect()
+                return
+
+            if not data:
+                logger.warning("MPV s'est arrete")
+                self._disconnect()
+                return
+            self._buffer += data
+
+        *lines, self._buffer = self._buffer.split(b"\n")
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                self._handle_message(json.loads(line))
+            except ValueError:
+                logger.warning(f"Message MPV invalide: {line!r}")
+
+    def stop(self) -> None:
+        """Arrete la video en cours (MPV reste lance, en attente)."""
+        if self._playing:
+            logger.debug("Arret de la video en cours")
+            self._command("stop")
+            self._playing = False
+
+    def close(self) -> None:
+        """Quitte MPV."""
+        self._command("quit")
+        self._disconnect()
+        if self._process and self._process.poll() is None:
+            try:
+                self._process.wait(timeout=AppConfig.STOP_DELAY)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+                self._process.wait()
+        if self.socket_path.exists():
+            self.socket_path.unlink()
+
+    def play(self, video_path: Path, loop: bool = False, requested_at: Optional[float] = None) -> bool:
+        """
+        Lance la lecture d'une video dans l'instance MPV.
+
+        Args:
+            video_path: Chemin vers le fichier video.
+            loop: Si True, la video boucle indefiniment.
+            requested_at: Reception de l'appui (time.monotonic()) : la
+                duree button_to_play est mesuree jusqu'a la premiere image
+                (evenement playback-restart de ce loadfile).
+
+        Returns:
+            True si la lecture a demarre, False sinon.
+        """
+        if not video_path.exists():
+            logger.error(f"Video introuvable: {video_path}")
+            return False
+
+        if not self._socket or self._process.poll() is not None:
+            if not self._start():
+                return False
+
+        logger.info(f"Lecture: {video_path.name}")
+        if not (
+            self._command("set_property", "loop-file", "inf" if loop else "no")
+            and self._command("loadfile", str(video_path.resolve()), "replace")
+        ):
+            return False
+
+        self._pending_loads += 1
+        self._playing = True
+        self._load_started = time.monotonic()
+        # Un appui remplace par un loadfile plus recent n'est pas mesure
+        self._requested_at = requested_at
+        return True
+
+    def play_generic(self) -> bool:
+        """Lance la video generique en boucle."""
+        generic_path = VideoConfig.generic_path()
+        if not generic_path.exists():
+            logger.error(f"Video generique introuvable: {generic_path}")
+            return False
+        return self.play(generic_path, loop=True)
+
+    @property
+    def event_source(self) -> Optional[socket.socket]:
+        """Socket IPC a surveiller avec un selecteur (None si MPV arrete)."""
+        return self._socket
+
+    @property
+    def is_playing(self) -> bool:
+        """Indique si une video est en cours de lecture."""
+        return (
+            self._playing
+            and self._process is not None
+            and self._process.poll() is None
+        )
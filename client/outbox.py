@@ -0,0 +1,278 @@
+"""
+File d'attente persistante des choix a envoyer au serveur.
+
+Les choix sont d'abord ecrits dans une base SQLite locale, puis envoyes
+par lots par un thread d'arriere-plan. Aucun choix n'est perdu si le
+serveur est injoignable : ils sont renvoyes au retour du reseau.
+
+Chaque choix recoit un event_id (UUID) a sa mise en file : un lot renvoye
+apres une reponse perdue est dedoublonne par le serveur. Un lot refuse
+(BatchRejected) est coupe en deux jusqu'a isoler les choix en cause, mis de
+cote dans la table outbox_rejected.
+"""
+
+import json
+import logging
+import random
+import sqlite3
+import threading
+import uuid
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class BatchRejected(Exception):
+    """Lot refuse par le serveur (4xx) : le renvoyer a l'identique echouerait encore."""
+
+
+class Outbox:
+    """File d'attente append-only stockee dans SQLite."""
+
+    def __init__(self, path: Path):
+        """
+        Ouvre (ou cree) la file d'attente.
+
+        Args:
+            path: Chemin du fichier SQLite.
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " payload TEXT NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS outbox_rejected ("
+            " id INTEGER PRIMARY KEY,"
+            " payload TEXT NOT NULL,"
+            " error TEXT,"
+            " rejected_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP)"
+        )
+        self._assign_event_ids()
+        self._conn.commit()
+
+    def _assign_event_ids(self) -> None:
+        """Donne un event_id aux evenements mis en file par une version precedente."""
+        rows = self._conn.execute("SELECT id, payload FROM outbox").fetchall()
+        for row_id, payload in rows:
+            event = json.loads(payload)
+            if isinstance(event, dict) and "event_id" not in event:
+                event["event_id"] = str(uuid.uuid4())
+                self._conn.execute(
+                    "UPDATE outbox SET payload = ? WHERE id = ?",
+                    (json.dumps(event), row_id)
+                )
+
+    def put(self, payload: dict) -> None:
+        """
+        Ajoute un evenement a la file.
+
+        Un event_id est ajoute s'il manque : il reste le meme a chaque
+        renvoi, ce qui permet au serveur d'ignorer les doublons.
+
+        Args:
+            payload: Evenement au format de l'API (/choices).
+        """
+        payload = {**payload, "event_id": payload.get("event_id") or str(uuid.uuid4())}
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO outbox (payload) VALUES (?)",
+                (json.dumps(payload),)
+            )
+            self._conn.commit()
+
+    def peek(self, limit: int) -> List[Tuple[int, dict]]:
+        """
+        Retourne les evenements les plus anciens sans les retirer.
+
+        Args:
+            limit: Nombre maximum d'evenements.
+
+        Returns:
+            Liste de couples (identifiant, evenement).
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, payload FROM outbox ORDER BY id LIMIT ?",
+                (limit,)
+            ).fetchall()
+        return [(row_id, json.loads(payload)) for row_id, payload in rows]
+
+    def ack(self, ids: List[int]) -> None:
+        """
+        Retire les evenements envoyes de la file.
+
+        Args:
+            ids: Identifiants retournes par peek().
+        """
+        if not ids:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "DELETE FROM outbox WHERE id = ?",
+                [(row_id,) for row_id in ids]
+            )
+            self._conn.commit()
+
+    def quarantine(self, ids: List[int], error: str) -> None:
+        """
+        Met de cote des evenements refuses par le serveur (outbox_rejected).
+
+        Args:
+            ids: Identifiants retournes par peek().
+            error: Raison du refus.
+        """
+        if not ids:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO outbox_rejected (id, payload, error) "
+                "SELECT id, payload, ? FROM outbox WHERE id = ?",
+                [(error, row_id) for row_id in ids]
+            )
+            self._conn.executemany(
+                "DELETE FROM outbox WHERE id = ?",
+                [(row_id,) for row_id in ids]
+            )
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        """Nombre d'evenements en attente."""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def close(self) -> None:
+        """Ferme la base SQLite."""
+        with self._lock:
+            self._conn.close()
+
+
+class OutboxFlusher(threading.Thread):
+    """Thread qui vide la file d'attente par lots vers le serveur."""
+
+    def __init__(
+        self,
+        outbox: Outbox,
+        send_batch: Callable[[List[dict]], Optional[Dict[int, str]]],
+        batch_size: int = 100,
+        interval: float = 2.0,
+        max_backoff: float = 300.0
+    ):
+        """
+        Initialise le thread d'envoi.
+
+        Args:
+            outbox: File d'attente a vider.
+            send_batch: Fonction d'envoi d'un lot. Retourne les evenements
+                refuses un par un par le serveur (position dans le lot ->
+                raison) si le lot a ete traite et peut etre retire de la
+                file, None s'il faut reessayer ; leve BatchRejected si le
+                serveur refuse le lot en entier.
+            batch_size: Nombre maximum d'evenements par lot.
+            interval: Delai entre deux verifications de la file (secondes).
+            max_backoff: Delai maximum entre deux tentatives en echec.
+        """
+        super().__init__(name="outbox-flusher", daemon=True)
+        self.outbox = outbox
+        self.send_batch = send_batch
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_backoff = max_backoff
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._backoff = 0.0
+
+    def notify(self) -> None:
+        """Signale qu'un nouvel evenement est disponible."""
+        self._wakeup.set()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """
+        Arrete le thread apres une derniere tentative d'envoi.
+
+        Args:
+            timeout: Delai maximum d'attente de l'arret (secondes).
+        """
+        self._stopping.set()
+        self._wakeup.set()
+        self.join(timeout)
+
+    def flush(self) -> bool:
+        """
+        Envoie tous les evenements en attente.
+
+        Returns:
+            True si la file est vide, False si un envoi a echoue.
+        """
+        while True:
+            batch = self.outbox.peek(self.batch_size)
+            if not batch:
+                return True
+
+            if not self._send(batch):
+                return False
+            if len(batch) < self.batch_size:
+                return True
+
+    def _send(self, batch: List[Tuple[int, dict]]) -> bool:
+        """
+        Envoie un lot et le retire de la file.
+
+        Un lot refuse est coupe en deux jusqu'a isoler les evenements en
+        cause, mis de cote : ils ne bloquent plus la file. Les evenements
+        refuses un par un dans un lot accepte sont mis de cote de la meme
+        facon.
+
+        Returns:
+            False si l'envoi a echoue (a reessayer).
+        """
+        try:
+            rejected = self.send_batch([payload for _, payload in batch])
+            if rejected is None:
+                return False
+        except BatchRejected as e:
+            if len(batch) > 1:
+                middle = len(batch) // 2
+                return self._send(batch[:middle]) and self._send(batch[middle:])
+            self.outbox.quarantine([batch[0][0]], str(e))
+            logger.error(f"Choix refuse par le serveur, mis de cote: {batch[0][1]} ({e})")
+            return True
+
+        for index, error in rejected.items():
+            row_id, payload = batch[index]
+            self.outbox.quarantine([row_id], error)
+            logger.error(f"Choix refuse par le serveur, mis de cote: {payload} ({error})")
+        self.outbox.ack([row_id for index, (row_id, _) in enumerate(batch) if index not in rejected])
+        return True
+
+    def run(self) -> None:
+        """Boucle d'envoi avec backoff exponentiel en cas d'echec."""
+        while not self._stopping.is_set():
+            if self._backoff:
+                # En echec, les nouveaux choix ne declenchent pas de nouvel essai
+                self._stopping.wait(self._backoff * random.uniform(0.8, 1.2))
+            else:
+                self._wakeup.wait(self.interval)
+                self._wakeup.clear()
+
+            try:
+                ok = self.flush()
+            except Exception as e:
+                logger.error(f"Erreur envoi file d'attente: {e}")
+                ok = False
+
+            if ok:
+                self._backoff = 0.0
+            else:
+                self._backoff = min(self.max_backoff, max(self.interval, self._backoff * 2))
+                logger.warning(
+                    f"{len(self.outbox)} choix en attente - "
+                    f"nouvel essai dans {self._backoff:.1f}s"
+                )
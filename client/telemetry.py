@@ -0,0 +1,200 @@
+"""
+Mesure de la reactivite de la borne.
+
+Chaque etape du traitement d'un appui (lecture serie, recherche de la
+video, arret et lancement du lecteur, mise en file du choix) est chronometree
+et agregee en histogrammes. Les histogrammes sont envoyes au serveur dans
+un heartbeat periodique (POST /machines/{name}/heartbeat) puis remis a
+zero : le serveur compare ainsi la reactivite de toutes les bornes.
+
+Etapes mesurees :
+    button_to_play : reception de la ligne serie -> premiere image affichee
+                     (mode ipc) ; -> processus MPV lance (mode process)
+    serial_read    : lecture et decodage des lignes serie
+    catalog_lookup : recherche de la derniere video du bouton
+    player_stop    : arret de la video en cours (mode process)
+    player_play    : lancement de la video (processus MPV ou loadfile IPC)
+    mpv_first_frame: loadfile -> premiere image affichee (mode ipc)
+    log_choice     : mise en file (ou envoi) du choix
+"""
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+# Bornes superieures des histogrammes (ms), identiques cote serveur
+BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class StageHistogram:
+    """Histogramme des durees d'une etape (ms)."""
+
+    __slots__ = ("counts", "total", "maximum")
+
+    def __init__(self):
+        # Une case par borne, plus une case au-dela de la derniere
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def observe(self, ms: float) -> None:
+        """Ajoute une duree."""
+        index = 0
+        while index < len(BUCKETS_MS) and ms > BUCKETS_MS[index]:
+            index += 1
+        self.counts[index] += 1
+        self.total += ms
+        self.maximum = max(self.maximum, ms)
+
+    def merge(self, data: dict) -> None:
+        """Ajoute un histogramme serialise (voir to_dict)."""
+        self.counts = [a + b for a, b in zip(self.counts, data["b"])]
+        self.total += data["sum"]
+        self.maximum = max(self.maximum, data["max"])
+
+    def to_dict(self) -> dict:
+        """Forme compacte envoyee au serveur."""
+        return {
+            "n": sum(self.counts),
+            "sum": round(self.total, 2),
+            "max": round(self.maximum, 2),
+            "b": list(self.counts)
+        }
+
+
+class Telemetry:
+    """Histogrammes par etape, partages entre threads."""
+
+    def __init__(self):
+        """Initialise des histogrammes vides."""
+        self._stages: Dict[str, StageHistogram] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage: str, ms: float) -> None:
+        """
+        Enregistre une duree.
+
+        Args:
+            stage: Nom de l'etape.
+            ms: Duree en millisecondes.
+        """
+        with self._lock:
+            histogram = self._stages.get(stage)
+            if histogram is None:
+                histogram = self._stages[stage] = StageHistogram()
+            histogram.observe(ms)
+
+    def since(self, stage: str, start: float) -> None:
+        """Enregistre la duree ecoulee depuis `start` (time.monotonic())."""
+        self.observe(stage, (time.monotonic() - start) * 1000)
+
+    @contextmanager
+    def span(self, stage: str) -> Iterator[None]:
+        """Chronometre le bloc `with` comme une etape."""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.since(stage, start)
+
+    def take(self) -> Dict[str, dict]:
+        """
+        Retourne les histogrammes et les remet a zero.
+
+        Returns:
+            Histogrammes serialises par etape (vide si aucune mesure).
+        """
+        with self._lock:
+            stages, self._stages = self._stages, {}
+        return {stage: histogram.to_dict() for stage, histogram in stages.items()}
+
+    def restore(self, stages: Dict[str, dict]) -> None:
+        """Reintegre des histogrammes pris par take() (envoi en echec)."""
+        with self._lock:
+            for stage, data in stages.items():
+                histogram = self._stages.get(stage)
+                if histogram is None:
+                    histogram = self._stages[stage] = StageHistogram()
+                histogram.merge(data)
+
+
+# Instance partagee par l'application et les lecteurs
+telemetry = Telemetry()
+
+
+class HeartbeatSender(threading.Thread):
+    """Thread qui envoie periodiquement les histogrammes au serveur."""
+
+    def __init__(
+        self,
+        send: Callable[[dict], bool],
+        interval: float = 60.0,
+        status: Optional[Callable[[], dict]] = None,
+        source: Telemetry = telemetry
+    ):
+        """
+        Initialise le thread d'envoi.
+
+        Args:
+            send: Fonction d'envoi d'un heartbeat. Retourne True si le
+                serveur l'a accepte.
+            interval: Delai entre deux heartbeats (secondes).
+            status: Fonction retournant des champs a ajouter au heartbeat
+                (mode du lecteur, choix en attente...).
+            source: Histogrammes a envoyer.
+        """
+        super().__init__(name="heartbeat", daemon=True)
+        self.send = send
+        self.interval = interval
+        self.status = status
+        self.source = source
+        self._stopping = threading.Event()
+        self._started_at = time.monotonic()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """
+        Arrete le thread.
+
+        Args:
+            timeout: Delai maximum d'attente de l'arret (secondes).
+        """
+        self._stopping.set()
+        self.join(timeout)
+
+    def beat(self) -> bool:
+        """
+        Envoie un heartbeat.
+
+        Les histogrammes non envoyes sont conserves pour le suivant.
+
+        Returns:
+            True si le serveur a accepte le heartbeat.
+        """
+        stages = self.source.take()
+        payload = {
+            "interval": self.interval,
+            "uptime": round(time.monotonic() - self._started_at, 1),
+            "buckets": list(BUCKETS_MS),
+            "stages": stages,
+            **(self.status() if self.status else {})
+        }
+        ok = False
+        try:
+            ok = self.send(payload)
+        finally:
+            if not ok:
+                self.source.restore(stages)
+        return ok
+
+    def run(self) -> None:
+        """Boucle d'envoi."""
+        while not self._stopping.wait(self.interval):
+            try:
+                self.beat()
+            except Exception as e:
+                logger.error(f"Erreur envoi heartbeat: {e}")
+
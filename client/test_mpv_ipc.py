@@ -0,0 +1,212 @@
+"""
+Tests du lecteur MPV pilote en IPC (mpv_ipc.py).
+
+Un faux MPV (script Python place en tete du PATH) ecoute sur le socket
+IPC, repond aux commandes et envoie les evenements start-file,
+playback-restart et end-file comme MPV.
+
+    cd client && python -m pytest -q test_mpv_ipc.py
+"""
+
+import os
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+import main
+from config import AppConfig, OutboxConfig, TelemetryConfig, VideoConfig
+from mpv_ipc import MPVIPCPlayer
+from telemetry import telemetry
+
+FAKE_MPV = '''#!{python}
+import json, os, signal, socket, sys, threading
+
+path = next(arg.split("=", 1)[1] for arg in sys.argv if arg.startswith("--input-ipc-server="))
+duration = float(os.environ.get("FAKE_MPV_DURATION", "0.3"))
+if os.environ.get("FAKE_MPV_IGNORE_TERM"):
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+server.bind(path)
+server.listen(1)
+lock = threading.Lock()
+state = {{"conn": None, "loop": False, "entry": 0}}
+
+
+def send(message):
+    with lock:
+        try:
+            state["conn"].sendall(json.dumps(message).encode() + b"\\n")
+        except OSError:
+            pass
+
+
+def finish(entry):
+    if entry == state["entry"]:
+        send({{"event": "end-file", "reason": "eof", "playlist_entry_id": entry}})
+
+
+# Comme MPV : reste lance quand un client se deconnecte
+while True:
+    state["conn"], _ = server.accept()
+    buffer = b""
+    while True:
+        try:
+            data = state["conn"].recv(65536)
+        except OSError:
+            break
+        if not data:
+            break
+        buffer += data
+        *lines, buffer = buffer.split(b"\\n")
+        for line in lines:
+            message = json.loads(line)
+            command = message["command"]
+            send({{"request_id": message.get("request_id"), "error": "success"}})
+            if command[0] == "set_property" and command[1] == "loop-file":
+                state["loop"] = command[2] == "inf"
+            elif command[0] == "loadfile":
+                if state["entry"]:
+                    send({{"event": "end-file", "reason": "stop", "playlist_entry_id": state["entry"]}})
+                state["entry"] += 1
+                send({{"event": "start-file", "playlist_entry_id": state["entry"]}})
+                send({{"event": "playback-restart"}})
+                if not state["loop"]:
+                    threading.Timer(duration, finish, (state["entry"],)).start()
+            elif command[0] == "stop":
+                send({{"event": "end-file", "reason": "stop", "playlist_entry_id": state["entry"]}})
+            elif command[0] == "quit":
+                os._exit(0)
+'''
+
+
+@pytest.fixture
+def videos(tmp_path, monkeypatch):
+    """Faux MPV dans le PATH et dossier de videos (generique + un choix)."""
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    fake = bin_dir / "mpv"
+    fake.write_text(FAKE_MPV.format(python=sys.executable))
+    fake.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+
+    root = tmp_path / "videos"
+    (root / "A").mkdir(parents=True)
+    (root / "generic.mp4").write_bytes(b"")
+    (root / "A" / "choice.mp4").write_bytes(b"")
+    monkeypatch.setattr(VideoConfig, "ROOT", root)
+    monkeypatch.setattr(VideoConfig, "GENERIC_NAME", "generic.mp4")
+    return root
+
+
+@pytest.fixture
+def player(tmp_path, videos):
+    player = MPVIPCPlayer(tmp_path / "mpv.sock")
+    yield player
+    player.close()
+
+
+def _wait(condition, player, timeout: float = 3.0) -> bool:
+    """Traite les evenements de MPV jusqu'a ce que `condition()` soit vraie."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        player.process_events()
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_play_measures_first_frame(player, videos):
+    telemetry.take()
+    assert player.play(videos / "A" / "choice.mp4", requested_at=time.monotonic())
+    assert player.is_playing
+
+    stages = {}
+    assert _wait(lambda: stages.update(telemetry.take()) or "button_to_play" in stages, player)
+    assert stages["mpv_first_frame"]["n"] == 1
+    assert stages["button_to_play"]["n"] == 1
+
+
+def test_end_of_file_returns_to_generic(tmp_path, videos, monkeypatch):
+    monkeypatch.setattr(VideoConfig, "PLAYER_MODE", "ipc")
+    monkeypatch.setattr(VideoConfig, "MPV_SOCKET", tmp_path / "mpv.sock")
+    monkeypatch.setattr(OutboxConfig, "PATH", tmp_path / "outbox.sqlite3")
+    monkeypatch.setattr(TelemetryConfig, "HEARTBEAT_INTERVAL", 0)
+    app = main.Application()
+    app.catalog.reload()
+    try:
+        assert app.player.play_generic()
+        app.handle_command("A")
+        assert app._playing_choice
+
+        # Fin de la video de choix (end-file eof) : retour a la generique
+        assert _wait(lambda: not app.player.is_playing, app.player)
+        app.check_playback()
+        assert not app._playing_choice
+        assert app.player.is_playing
+
+        # La generique boucle : pas de end-file eof
+        assert not _wait(lambda: not app.player.is_playing, app.player, timeout=0.6)
+    finally:
+        app.player.close()
+        app.api.close()
+
+
+def test_mpv_death_restarts_idle_loop(tmp_path, videos, monkeypatch):
+    monkeypatch.setattr(VideoConfig, "PLAYER_MODE", "ipc")
+    monkeypatch.setattr(VideoConfig, "MPV_SOCKET", tmp_path / "mpv.sock")
+    monkeypatch.setattr(OutboxConfig, "PATH", tmp_path / "outbox.sqlite3")
+    monkeypatch.setattr(TelemetryConfig, "HEARTBEAT_INTERVAL", 0)
+    monkeypatch.setattr(AppConfig, "RESTART_DELAY", 0.5)
+    app = main.Application()
+    try:
+        assert app.player.play_generic()
+        first = app.player._process
+
+        first.kill()
+        assert _wait(lambda: app.player.event_source is None, app.player)
+        assert not app.player.is_playing
+
+        app.check_playback()
+        second = app.player._process
+        assert second is not first and second.poll() is None
+        assert app.player.is_playing
+
+        # Relances limitees a une toutes les RESTART_DELAY secondes
+        second.kill()
+        assert _wait(lambda: app.player.event_source is None, app.player)
+        app.check_playback()
+        assert app.player._process is second
+        time.sleep(0.5)
+        app.check_playback()
+        assert app.player._process is not second
+        assert app.player.is_playing
+    finally:
+        app.player.close()
+        app.api.close()
+
+
+def test_stale_socket_kills_previous_mpv(player, videos, monkeypatch):
+    monkeypatch.setenv("FAKE_MPV_IGNORE_TERM", "1")
+    assert player.play_generic()
+    first = player._process
+
+    # Socket IPC en erreur, processus toujours vivant
+    player._disconnect()
+    assert player.play(videos / "A" / "choice.mp4")
+    second = player._process
+
+    assert second is not first
+    assert first.poll() is not None
+    assert second.poll() is None
+
+
+def test_close_quits_mpv(player, videos):
+    assert player.play_generic()
+    process = player._process
+    player.close()
+    assert process.poll() is not None
+    assert not Path(player.socket_path).exists()
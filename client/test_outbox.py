@@ -0,0 +1,64 @@
+"""
+Tests de la file d'attente hors ligne (outbox.py).
+
+    cd client && python -m pytest -q test_outbox.py
+"""
+
+import sqlite3
+
+from outbox import BatchRejected, Outbox, OutboxFlusher
+
+
+def _rejected(path) -> list:
+    """Evenements mis de cote (choix, raison)."""
+    with sqlite3.connect(path) as conn:
+        rows = conn.execute("SELECT payload, error FROM outbox_rejected ORDER BY id").fetchall()
+    return [(payload, error) for payload, error in rows]
+
+
+def _outbox(tmp_path, choices: str) -> Outbox:
+    outbox = Outbox(tmp_path / "outbox.sqlite3")
+    for choix in choices:
+        outbox.put({"choix": choix, "video": f"/videos/{choix}/1.mp4", "machine": "borne_01"})
+    return outbox
+
+
+def test_items_rejected_in_accepted_batch_are_quarantined(tmp_path):
+    outbox = _outbox(tmp_path, "ABZC")
+    sent = []
+
+    def send_batch(events):
+        sent.append([event["choix"] for event in events])
+        return {index: "choix: invalide" for index, event in enumerate(events) if event["choix"] == "Z"}
+
+    assert OutboxFlusher(outbox, send_batch).flush()
+
+    assert sent == [["A", "B", "Z", "C"]]
+    assert len(outbox) == 0
+    rejected = _rejected(tmp_path / "outbox.sqlite3")
+    assert len(rejected) == 1
+    assert '"Z"' in rejected[0][0]
+    assert rejected[0][1] == "choix: invalide"
+
+
+def test_rejected_batch_is_split_to_isolate_bad_event(tmp_path):
+    outbox = _outbox(tmp_path, "ABZC")
+
+    def send_batch(events):
+        if any(event["choix"] == "Z" for event in events):
+            raise BatchRejected("422")
+        return {}
+
+    assert OutboxFlusher(outbox, send_batch).flush()
+
+    assert len(outbox) == 0
+    assert [error for _, error in _rejected(tmp_path / "outbox.sqlite3")] == ["422"]
+
+
+def test_failed_send_keeps_events(tmp_path):
+    outbox = _outbox(tmp_path, "AB")
+
+    assert not OutboxFlusher(outbox, lambda events: None).flush()
+
+    assert len(outbox) == 2
+    assert _rejected(tmp_path / "outbox.sqlite3") == []
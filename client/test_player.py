@@ -0,0 +1,69 @@
+"""
+Tests du lecteur video en mode process (main.VideoPlayer).
+
+Un faux MPV (script shell place en tete du PATH) attend sans fin et
+ignore SIGTERM : seul le SIGKILL envoye apres STOP_DELAY l'arrete.
+
+    cd client && python -m pytest -q test_player.py
+"""
+
+import os
+import time
+
+import pytest
+
+from config import AppConfig
+from main import VideoPlayer
+
+FAKE_MPV = """#!/bin/sh
+trap '' TERM
+while true; do sleep 0.05; done
+"""
+
+
+@pytest.fixture
+def player(tmp_path, monkeypatch):
+    """Lecteur avec un faux MPV qui ignore SIGTERM."""
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    fake = bin_dir / "mpv"
+    fake.write_text(FAKE_MPV)
+    fake.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.setattr(AppConfig, "STOP_DELAY", 0.3)
+
+    video = tmp_path / "choice.mp4"
+    video.write_bytes(b"")
+    player = VideoPlayer()
+    assert player.play(video)
+    yield player
+    player.close()
+
+
+def test_stop_does_not_wait(player):
+    process = player._process
+    start = time.monotonic()
+    player.stop()
+    assert time.monotonic() - start < 0.1
+    assert process.poll() is None
+
+
+def test_process_events_kills_after_stop_delay(player):
+    process = player._process
+    player.stop()
+
+    player.process_events()
+    assert process.poll() is None
+
+    time.sleep(AppConfig.STOP_DELAY)
+    player.process_events()
+    process.wait(timeout=1)
+    player.process_events()
+    assert player._stopping == []
+
+
+def test_close_waits_for_stopped_process(player):
+    process = player._process
+    player.close()
+    assert process.poll() is not None
+    assert player._stopping == []
@@ -53,7 +53,13 @@ function App() {
         <Charts stats={stats} loading={statsLoading} />
 
         {/* Data Table */}
-        <DataTable choices={choices} total={total} loading={choicesLoading} />
+        <DataTable
+          choices={choices}
+          total={total}
+          loading={choicesLoading}
+          machine={selectedMachine}
+          days={days}
+        />
       </main>
 
       {/* Footer */}
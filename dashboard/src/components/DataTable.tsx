@@ -1,14 +1,17 @@
 import { useState } from 'react'
 import type { Choice } from '../types'
 import { exportToXlsx, exportToCsv } from '../services/export'
+import { apiUrl } from '../services/api'
 
 interface DataTableProps {
   choices: Choice[]
   total: number
   loading: boolean
+  machine: string
+  days: number
 }
 
-export function DataTable({ choices, total, loading }: DataTableProps) {
+export function DataTable({ choices, total, loading, machine, days }: DataTableProps) {
   const [sortField, setSortField] = useState<keyof Choice>('event_time')
   const [sortOrder, setSortOrder] = useState<'asc' | 'desc'>('desc')
 
@@ -37,6 +40,11 @@ export function DataTable({ choices, total, loading }: DataTableProps) {
     exportToCsv(choices, 'video_analytics')
   }
 
+  // Export complet genere par le serveur (toutes les lignes de la periode)
+  const fullExportParams = new URLSearchParams({ format: 'csv', days: String(days) })
+  if (machine) fullExportParams.set('machine', machine)
+  const fullExportUrl = apiUrl('/choices/export', fullExportParams)
+
   const SortIcon = ({ field }: { field: keyof Choice }) => {
     if (sortField !== field) return <span className="text-gray-300 ml-1">↕</span>
     return <span className="ml-1">{sortOrder === 'asc' ? '↑' : '↓'}</span>
@@ -83,6 +91,16 @@ export function DataTable({ choices, total, loading }: DataTableProps) {
             </svg>
             Export CSV
           </button>
+          <a
+            href={fullExportUrl}
+            download
+            className="px-4 py-2 bg-gray-700 text-white rounded-md hover:bg-gray-800 transition-colors flex items-center gap-2"
+          >
+            <svg className="w-4 h-4" fill="none" stroke="currentColor" viewBox="0 0 24 24">
+              <path strokeLinecap="round" strokeLinejoin="round" strokeWidth={2} d="M12 10v6m0 0l-3-3m3 3l3-3m2 8H7a2 2 0 01-2-2V5a2 2 0 012-2h5.586a1 1 0 01.707.293l5.414 5.414a1 1 0 01.293.707V19a2 2 0 01-2 2z" />
+            </svg>
+            Export complet
+          </a>
         </div>
       </div>
 
@@ -0,0 +1,12 @@
+/// <reference types="vite/client" />
+
+// Base des appels a l'API : proxy /api en developpement (Vite, nginx),
+// VITE_API_URL en production
+export const API_BASE_URL: string = import.meta.env.DEV
+  ? '/api'
+  : (import.meta.env.VITE_API_URL || '/api').replace(/\/+$/, '')
+
+export function apiUrl(path: string, params?: URLSearchParams): string {
+  const query = params?.toString()
+  return `${API_BASE_URL}${path}${query ? `?${query}` : ''}`
+}
@@ -1,20 +1,6 @@
 -- Schema de la base de donnees Lecture Video
 -- Ce fichier est execute automatiquement par Docker au premier demarrage
 
--- Table des choix utilisateurs
-CREATE TABLE IF NOT EXISTS user_choices (
-    id SERIAL PRIMARY KEY,
-    choix CHAR(1) NOT NULL,
-    video TEXT NOT NULL,
-    event_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    machine TEXT NOT NULL
-);
-
--- Index pour les requetes frequentes
-CREATE INDEX IF NOT EXISTS idx_user_choices_event_time ON user_choices(event_time);
-CREATE INDEX IF NOT EXISTS idx_user_choices_machine ON user_choices(machine);
-CREATE INDEX IF NOT EXISTS idx_user_choices_choix ON user_choices(choix);
-
 -- Table des machines (bornes)
 CREATE TABLE IF NOT EXISTS machines (
     id SERIAL PRIMARY KEY,
@@ -22,9 +8,103 @@ CREATE TABLE IF NOT EXISTS machines (
     description TEXT,
     location TEXT,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    last_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    last_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    -- Suppression logique : les choix de la machine restent dans l'historique
+    deleted_at TIMESTAMP
 );
 
--- Index pour la recherche par nom
-CREATE INDEX IF NOT EXISTS idx_machines_name ON machines(name);
+-- La recherche par nom utilise l'index de la contrainte UNIQUE
 CREATE INDEX IF NOT EXISTS idx_machines_last_seen ON machines(last_seen);
+
+-- Chemins des videos jouees (references par user_choices.video_id)
+CREATE TABLE IF NOT EXISTS videos (
+    id SERIAL PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Table des choix utilisateurs, partitionnee par mois sur event_time.
+-- Les partitions mensuelles sont creees par l'API (partitions.py) ; la
+-- partition par defaut recoit les choix hors des mois crees. La machine et
+-- la video sont stockees par identifiant (tables machines et videos).
+CREATE TABLE IF NOT EXISTS user_choices (
+    id SERIAL,
+    choix CHAR(1) NOT NULL,
+    video_id INTEGER NOT NULL REFERENCES videos(id),
+    event_time TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    machine_id INTEGER NOT NULL REFERENCES machines(id),
+    -- Identifiant genere par la borne : les renvois sont ignores (ON CONFLICT)
+    event_id UUID,
+    PRIMARY KEY (id, event_time)
+) PARTITION BY RANGE (event_time);
+
+CREATE TABLE IF NOT EXISTS user_choices_default PARTITION OF user_choices DEFAULT;
+
+-- Index pour les requetes frequentes (crees sur chaque partition).
+-- Toutes les requetes filtrent sur event_time, seul ou avec machine_id / choix,
+-- et trient par (event_time, id) ; les colonnes incluses permettent les
+-- agregats en parcours d'index seul.
+CREATE INDEX IF NOT EXISTS idx_user_choices_event_time_id
+    ON user_choices(event_time, id) INCLUDE (machine_id, choix);
+CREATE INDEX IF NOT EXISTS idx_user_choices_machine_event_time
+    ON user_choices(machine_id, event_time, id) INCLUDE (choix);
+CREATE INDEX IF NOT EXISTS idx_user_choices_choix_event_time
+    ON user_choices(choix, event_time, id) INCLUDE (machine_id);
+-- Deduplication : un index unique d'une table partitionnee contient event_time
+CREATE UNIQUE INDEX IF NOT EXISTS uq_user_choices_event_id
+    ON user_choices(event_id, event_time);
+
+-- Agregats des choix par heure / jour, machine et bouton (utilises par /stats)
+CREATE TABLE IF NOT EXISTS choice_rollups_hourly (
+    bucket TIMESTAMP NOT NULL,
+    machine TEXT NOT NULL,
+    choix VARCHAR(1) NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    last_event TIMESTAMP NOT NULL,
+    PRIMARY KEY (bucket, machine, choix)
+);
+
+CREATE TABLE IF NOT EXISTS choice_rollups_daily (
+    bucket TIMESTAMP NOT NULL,
+    machine TEXT NOT NULL,
+    choix VARCHAR(1) NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    last_event TIMESTAMP NOT NULL,
+    PRIMARY KEY (bucket, machine, choix)
+);
+
+-- Lectures par jour, bouton et video, toutes machines (/stats/videos)
+CREATE TABLE IF NOT EXISTS video_rollups_daily (
+    bucket TIMESTAMP NOT NULL,
+    choix VARCHAR(1) NOT NULL,
+    video_id INTEGER NOT NULL REFERENCES videos(id),
+    count INTEGER NOT NULL DEFAULT 0,
+    last_event TIMESTAMP NOT NULL,
+    PRIMARY KEY (bucket, choix, video_id)
+);
+
+-- Evolution d'une video dans le temps (/stats/videos/timeline)
+CREATE INDEX IF NOT EXISTS ix_video_rollups_daily_video_bucket
+    ON video_rollups_daily(video_id, bucket);
+
+-- Lectures par machine (machine en tete : une plage contigue par machine)
+CREATE TABLE IF NOT EXISTS video_machine_rollups_daily (
+    machine TEXT NOT NULL,
+    bucket TIMESTAMP NOT NULL,
+    choix VARCHAR(1) NOT NULL,
+    video_id INTEGER NOT NULL REFERENCES videos(id),
+    count INTEGER NOT NULL DEFAULT 0,
+    last_event TIMESTAMP NOT NULL,
+    PRIMARY KEY (machine, bucket, choix, video_id)
+);
+
+-- Choix par machine, bouton, jour de la semaine (0 = lundi) et heure locale
+-- (fuseau STATS_TIMEZONE), sur tout l'historique (/stats/heatmap)
+CREATE TABLE IF NOT EXISTS choice_heatmap (
+    machine TEXT NOT NULL,
+    choix VARCHAR(1) NOT NULL,
+    weekday SMALLINT NOT NULL,
+    hour SMALLINT NOT NULL,
+    count INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (machine, choix, weekday, hour)
+);
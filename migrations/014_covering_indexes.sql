@@ -0,0 +1,38 @@
+-- Migration : index composites et couvrants de user_choices
+--
+-- Remplace les index mono-colonne (choix, machine, event_time, id) par des
+-- index adaptes aux requetes de l'API : filtre sur event_time, seul ou avec
+-- machine / choix, tri par (event_time, id). L'index sur id est couvert par
+-- la cle primaire (id, event_time).
+--
+-- Sur une table partitionnee, CREATE INDEX CONCURRENTLY n'est pas possible
+-- sur la table mere : executer pendant une periode creuse.
+--
+--     psql -d video_analytics -f migrations/014_covering_indexes.sql
+
+BEGIN;
+
+-- Index crees par database.sql
+DROP INDEX IF EXISTS idx_user_choices_event_time;
+DROP INDEX IF EXISTS idx_user_choices_machine;
+DROP INDEX IF EXISTS idx_user_choices_choix;
+DROP INDEX IF EXISTS idx_user_choices_event_time_id;
+DROP INDEX IF EXISTS idx_machines_name;
+
+-- Index crees par SQLAlchemy (create_all)
+DROP INDEX IF EXISTS ix_user_choices_id;
+DROP INDEX IF EXISTS ix_user_choices_event_time;
+DROP INDEX IF EXISTS ix_user_choices_machine;
+DROP INDEX IF EXISTS ix_user_choices_choix;
+DROP INDEX IF EXISTS ix_machines_id;
+
+CREATE INDEX idx_user_choices_event_time_id
+    ON user_choices(event_time, id) INCLUDE (machine, choix);
+CREATE INDEX IF NOT EXISTS idx_user_choices_machine_event_time
+    ON user_choices(machine, event_time, id) INCLUDE (choix);
+CREATE INDEX IF NOT EXISTS idx_user_choices_choix_event_time
+    ON user_choices(choix, event_time, id) INCLUDE (machine);
+
+COMMIT;
+
+ANALYZE user_choices;
@@ -0,0 +1,76 @@
+-- Migration : machine et video de user_choices stockees par identifiant
+--
+-- Remplace les colonnes texte user_choices.machine et user_choices.video par
+-- machine_id (machines.id) et video_id (videos.id). Les machines absentes de
+-- la table machines sont creees a partir de l'historique.
+--
+-- A executer API arretee, apres la migration 014 et sur une table deja
+-- partitionnee (une table non partitionnee est convertie directement par
+-- `python partitions.py migrate`).
+--
+--     psql -d video_analytics -f migrations/015_normalize_machine_video.sql
+
+BEGIN;
+
+-- machines.name est limite a 100 caracteres (comme les noms acceptes par
+-- l'API) : un nom plus long de l'historique arrete la migration avant
+-- toute modification, a renommer puis relancer
+DO $$
+DECLARE
+    too_long TEXT;
+BEGIN
+    SELECT string_agg(DISTINCT machine, ', ') INTO too_long
+    FROM user_choices WHERE length(machine) > 100;
+    IF too_long IS NOT NULL THEN
+        RAISE EXCEPTION 'Noms de machine de plus de 100 caracteres dans user_choices.machine : %', too_long
+            USING HINT = 'Raccourcir ces noms (UPDATE user_choices SET machine = ...) puis relancer la migration';
+    END IF;
+END $$;
+
+CREATE TABLE IF NOT EXISTS videos (
+    id SERIAL PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO machines (name, created_at, last_seen)
+SELECT machine, min(event_time), max(event_time) FROM user_choices GROUP BY machine
+ON CONFLICT (name) DO NOTHING;
+
+INSERT INTO videos (path)
+SELECT DISTINCT video FROM user_choices
+ON CONFLICT (path) DO NOTHING;
+
+-- Les index reconstruits apres la mise a jour des lignes
+DROP INDEX IF EXISTS idx_user_choices_event_time_id;
+DROP INDEX IF EXISTS idx_user_choices_machine_event_time;
+DROP INDEX IF EXISTS idx_user_choices_choix_event_time;
+
+ALTER TABLE user_choices ADD COLUMN machine_id INTEGER, ADD COLUMN video_id INTEGER;
+
+UPDATE user_choices c
+SET machine_id = m.id, video_id = v.id
+FROM machines m, videos v
+WHERE m.name = c.machine AND v.path = c.video;
+
+ALTER TABLE user_choices
+    ALTER COLUMN machine_id SET NOT NULL,
+    ALTER COLUMN video_id SET NOT NULL,
+    ADD FOREIGN KEY (machine_id) REFERENCES machines(id),
+    ADD FOREIGN KEY (video_id) REFERENCES videos(id),
+    DROP COLUMN machine,
+    DROP COLUMN video;
+
+CREATE INDEX idx_user_choices_event_time_id
+    ON user_choices(event_time, id) INCLUDE (machine_id, choix);
+CREATE INDEX idx_user_choices_machine_event_time
+    ON user_choices(machine_id, event_time, id) INCLUDE (choix);
+CREATE INDEX idx_user_choices_choix_event_time
+    ON user_choices(choix, event_time, id) INCLUDE (machine_id);
+
+COMMIT;
+
+-- L'espace des colonnes supprimees et des anciennes versions des lignes
+-- n'est rendu qu'apres reecriture de la table (verrou exclusif) :
+--     VACUUM FULL ANALYZE user_choices;
+ANALYZE user_choices;
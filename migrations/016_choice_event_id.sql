@@ -0,0 +1,21 @@
+-- Migration : identifiant unique des choix envoyes par les bornes
+--
+-- Les bornes generent un event_id (UUID) a la mise en file de chaque choix.
+-- Un lot renvoye apres une reponse perdue (timeout) est ignore par
+-- l'insertion (ON CONFLICT DO NOTHING) au lieu d'etre compte deux fois.
+-- Les choix deja enregistres gardent un event_id NULL.
+--
+-- Sur une table partitionnee, l'index unique doit contenir la cle de
+-- partition (event_time) et ne peut pas etre cree CONCURRENTLY : executer
+-- pendant une periode creuse, avant de deployer la nouvelle API.
+--
+--     psql -d video_analytics -f migrations/016_choice_event_id.sql
+
+BEGIN;
+
+ALTER TABLE user_choices ADD COLUMN IF NOT EXISTS event_id UUID;
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_user_choices_event_id
+    ON user_choices(event_id, event_time);
+
+COMMIT;
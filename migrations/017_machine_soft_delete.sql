@@ -0,0 +1,10 @@
+-- Migration : suppression logique des machines
+--
+-- user_choices.machine_id reference machines(id) (migration 015) : une
+-- machine ayant des choix ne peut plus etre supprimee. DELETE
+-- /machines/{name} renseigne deleted_at ; la machine disparait des listes,
+-- ses choix et statistiques sont conserves.
+--
+--     psql -d video_analytics -f migrations/017_machine_soft_delete.sql
+
+ALTER TABLE machines ADD COLUMN IF NOT EXISTS deleted_at TIMESTAMP;
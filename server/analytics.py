@@ -0,0 +1,299 @@
+"""
+Segments colonnes des jours clos, pour les statistiques longue duree.
+
+Chaque jour termine de user_choices est exporte une fois dans un fichier
+NumPy compresse (AAAA-MM-JJ.npz) :
+- time : horodatages en microsecondes depuis l'epoch (int64, UTC) ;
+- machine, video : codes (int32) dans les dictionnaires machines/videos du
+  segment ;
+- choix : index du bouton dans BUTTONS (int8).
+
+Au chargement, chaque segment est reduit par des noyaux vectorises
+(bincount) a une matrice machine x bouton. Les matrices de tous les jours
+forment un cube jour x machine x bouton en memoire : une periode d'un an
+se resume par quelques sommes NumPy, sans requete en base. Les jours non
+exportes (jour courant, jours invalides) sont lus dans les agregats
+journaliers et fusionnes (GET /stats/history).
+
+Un choix ajoute ou supprime dans un jour deja exporte invalide son segment,
+qui sera reexporte. Les choix inseres directement en base (scripts) ne
+sont pas vus : supprimer les segments concernes.
+
+NumPy est optionnel : sans lui, le moteur est desactive.
+"""
+
+import io
+import logging
+import os
+import threading
+from datetime import date, datetime, time, timedelta
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from models import Machine, UserChoice, Video
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+BUTTONS = "ABCDEFG"
+EPOCH = datetime(1970, 1, 1)
+
+# Totaux d'une periode : par bouton, par machine (nombre, dernier choix), par jour
+Totals = Tuple[Dict[str, int], Dict[str, Tuple[int, datetime]], Dict[date, int]]
+
+
+def _to_micros(moment: datetime) -> int:
+    """Horodatage naif UTC -> microsecondes depuis l'epoch."""
+    return (moment - EPOCH) // timedelta(microseconds=1)
+
+
+def _from_micros(value: int) -> datetime:
+    """Microsecondes depuis l'epoch -> horodatage naif UTC."""
+    return EPOCH + timedelta(microseconds=int(value))
+
+
+class SegmentStore:
+    """Segments colonnes par jour et cube jour x machine x bouton."""
+
+    def __init__(self, directory: Path, delay_days: int = 1):
+        """
+        Initialise le magasin (charge par load()).
+
+        Args:
+            directory: Dossier des fichiers .npz.
+            delay_days: Jours clos non exportes, pour les choix arrivant en
+                retard (bornes hors ligne).
+        """
+        self.directory = Path(directory)
+        self.delay_days = delay_days
+        self._lock = threading.Lock()
+
+        # Matrice de chaque jour : (machines du segment, comptes m x b, dernier choix par machine)
+        self._days: Dict[date, Tuple[List[str], "np.ndarray", "np.ndarray"]] = {}
+        # Jours modifies depuis leur lecture par export()
+        self._stale: Set[date] = set()
+
+        # Cube reconstruit a la demande apres un chargement ou une invalidation
+        self._cube: Optional[Tuple[Dict[date, int], Dict[str, int], "np.ndarray", "np.ndarray"]] = None
+
+    def _path(self, day: date) -> Path:
+        """Fichier du segment d'un jour."""
+        return self.directory / f"{day.isoformat()}.npz"
+
+    @property
+    def days(self) -> Set[date]:
+        """Jours disponibles en segments."""
+        with self._lock:
+            return set(self._days)
+
+    def load(self) -> int:
+        """
+        Charge les segments presents dans le dossier.
+
+        Returns:
+            Nombre de segments charges.
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        loaded = 0
+        for path in sorted(self.directory.glob("*.npz")):
+            try:
+                day = date.fromisoformat(path.stem)
+                with np.load(path) as segment:
+                    self._add(day, segment)
+                loaded += 1
+            except (ValueError, OSError, KeyError) as e:
+                logger.warning(f"Segment ignore {path.name}: {e}")
+        return loaded
+
+    def _add(self, day: date, segment) -> None:
+        """Reduit un segment a sa matrice machine x bouton."""
+        machines = [str(name) for name in segment["machines"]]
+        codes = segment["machine"].astype(np.int64)
+        buttons = segment["choix"].astype(np.int64)
+        times = segment["time"]
+
+        counts = np.bincount(
+            codes * len(BUTTONS) + buttons, minlength=len(machines) * len(BUTTONS)
+        ).reshape(len(machines), len(BUTTONS))
+        last = np.full(len(machines), -1, dtype=np.int64)
+        np.maximum.at(last, codes, times)
+
+        with self._lock:
+            self._days[day] = (machines, counts, last)
+            self._cube = None
+
+    def invalidate(self, days: Iterable[date]) -> None:
+        """
+        Retire les segments de jours modifies (choix en retard, suppression).
+
+        Args:
+            days: Jours dont les choix ont change.
+        """
+        with self._lock:
+            exported = [day for day in set(days) if day in self._days]
+            self._stale.update(days)
+            for day in exported:
+                del self._days[day]
+                self._cube = None
+        for day in exported:
+            self._path(day).unlink(missing_ok=True)
+
+    def export(self, db: Session, today: Optional[date] = None) -> int:
+        """
+        Exporte les jours clos qui n'ont pas encore de segment.
+
+        Args:
+            db: Session de base de donnees (moteur synchrone).
+            today: Jour courant (UTC par defaut).
+
+        Returns:
+            Nombre de segments ecrits.
+        """
+        today = today or datetime.utcnow().date()
+        first = db.execute(select(UserChoice.event_time).order_by(UserChoice.event_time).limit(1)).scalar()
+        if first is None:
+            return 0
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        written = 0
+        day = first.date()
+        last_day = today - timedelta(days=self.delay_days)
+        while day < last_day:
+            if day not in self._days:
+                self._export_day(db, day)
+                written += 1
+            day += timedelta(days=1)
+        return written
+
+    def _export_day(self, db: Session, day: date) -> None:
+        """Ecrit le segment d'un jour (ecriture atomique)."""
+        with self._lock:
+            self._stale.discard(day)
+
+        start = datetime.combine(day, time())
+        rows = db.execute(
+            select(UserChoice.event_time, Machine.name, UserChoice.choix, Video.path)
+            .join(Machine, Machine.id == UserChoice.machine_id)
+            .join(Video, Video.id == UserChoice.video_id)
+            .where(UserChoice.event_time >= start, UserChoice.event_time < start + timedelta(days=1))
+            .order_by(UserChoice.event_time)
+        ).all()
+
+        machines, machine_codes = np.unique(
+            np.array([row[1] for row in rows], dtype=str), return_inverse=True
+        )
+        videos, video_codes = np.unique(
+            np.array([row[3] for row in rows], dtype=str), return_inverse=True
+        )
+        segment = {
+            "time": np.array([_to_micros(row[0]) for row in rows], dtype=np.int64),
+            "machine": machine_codes.astype(np.int32),
+            "choix": np.array([BUTTONS.index(row[2]) for row in rows], dtype=np.int8),
+            "video": video_codes.astype(np.int32),
+            "machines": machines,
+            "videos": videos,
+        }
+
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, **segment)
+        path = self._path(day)
+        temporary = path.with_suffix(".tmp")
+        temporary.write_bytes(buffer.getvalue())
+        os.replace(temporary, path)
+
+        with self._lock:
+            stale = day in self._stale
+        if stale:
+            # Modifie pendant l'export : sera reexporte au prochain passage
+            path.unlink(missing_ok=True)
+            return
+        self._add(day, segment)
+
+    def _build_cube(self):
+        """Empile les matrices des jours en un cube jour x machine x bouton."""
+        with self._lock:
+            if self._cube is not None:
+                return self._cube
+            days = sorted(self._days)
+            names = sorted({name for machines, _, _ in self._days.values() for name in machines})
+            machine_index = {name: index for index, name in enumerate(names)}
+            counts = np.zeros((len(days), len(names), len(BUTTONS)), dtype=np.int64)
+            last = np.full((len(days), len(names)), -1, dtype=np.int64)
+            for row, day in enumerate(days):
+                machines, day_counts, day_last = self._days[day]
+                columns = [machine_index[name] for name in machines]
+                counts[row, columns] = day_counts
+                last[row, columns] = day_last
+            self._cube = ({day: row for row, day in enumerate(days)}, machine_index, counts, last)
+            return self._cube
+
+    def totals(self, start: date, end: date, machine: Optional[str] = None) -> Tuple[Totals, Set[date]]:
+        """
+        Totaux d'une periode sur les segments disponibles.
+
+        Args:
+            start: Premier jour (inclus).
+            end: Dernier jour (inclus).
+            machine: Filtre optionnel sur la machine.
+
+        Returns:
+            (totaux par bouton, par machine et par jour ; jours de la
+            periode sans segment, a lire en base).
+        """
+        day_index, machine_index, counts, last = self._build_cube()
+        period = [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+        rows = [day_index[day] for day in period if day in day_index]
+        missing = {day for day in period if day not in day_index}
+
+        counts = counts[rows]
+        last = last[rows]
+        names = list(machine_index)
+        if machine is not None:
+            if machine not in machine_index:
+                return ({}, {}, {}), missing
+            column = machine_index[machine]
+            counts = counts[:, column:column + 1]
+            last = last[:, column:column + 1]
+            names = [machine]
+
+        per_button = counts.sum(axis=(0, 1))
+        per_machine = counts.sum(axis=(0, 2))
+        machine_last = last.max(axis=0) if len(rows) else np.full(len(names), -1)
+        per_day = counts.sum(axis=(1, 2))
+
+        by_button = {BUTTONS[b]: int(n) for b, n in enumerate(per_button) if n}
+        by_machine = {
+            names[m]: (int(n), _from_micros(machine_last[m]))
+            for m, n in enumerate(per_machine) if n
+        }
+        days = [day for day in period if day in day_index]
+        by_day = {day: int(n) for day, n in zip(days, per_day) if n}
+        return (by_button, by_machine, by_day), missing
+
+
+def merge(totals: Totals, rows: Iterable) -> Totals:
+    """
+    Ajoute des lignes (day, machine, choix, count, last_event) aux totaux.
+
+    Args:
+        totals: Totaux des segments.
+        rows: Agregats journaliers des jours sans segment.
+
+    Returns:
+        Totaux fusionnes.
+    """
+    by_button, by_machine, by_day = dict(totals[0]), dict(totals[1]), dict(totals[2])
+    for day, machine, choix, count, last_event in rows:
+        by_button[choix] = by_button.get(choix, 0) + count
+        previous_count, previous_last = by_machine.get(machine, (0, last_event))
+        by_machine[machine] = (previous_count + count, max(previous_last, last_event))
+        by_day[day] = by_day.get(day, 0) + count
+    return by_button, by_machine, by_day
@@ -0,0 +1,157 @@
+"""
+Cache en memoire des reponses de statistiques.
+
+Les bornes et le dashboard interrogent /stats et ses variantes avec quelques
+combinaisons de parametres seulement. Les reponses sont conservees (LRU +
+TTL) et invalidees a chaque ingestion qui les concerne.
+
+Chaque perimetre (une machine, ou toutes) a sa propre generation. Une
+reponse filtree sur une machine est invalidee des qu'un choix de cette
+machine arrive. Une reponse sur toutes les machines serait invalidee a
+chaque choix de la flotte et ne serait jamais servie : elle reste valide
+au plus `max_staleness` secondes apres le premier choix qui la modifie.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+
+class StatsCache:
+    """Cache LRU avec expiration, invalide par machine."""
+
+    def __init__(self, maxsize: int = 256, ttl: float = 30.0, max_staleness: float = 1.0):
+        """
+        Initialise le cache.
+
+        Args:
+            maxsize: Nombre maximum d'entrees (les moins utilisees sont evincees).
+            ttl: Duree de vie d'une entree en secondes.
+            max_staleness: Retard max d'une reponse sur toutes les machines
+                apres une ingestion (secondes, 0 = invalidation immediate).
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_staleness = max_staleness
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Invalidations completes, et ingestions par machine (None = toutes)
+        self._epoch = 0
+        self._generations: Dict[Optional[str], int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def generation(self, scope: Optional[str] = None) -> Tuple[int, int]:
+        """
+        Compteur d'invalidations d'un perimetre, a lire avant de calculer une reponse.
+
+        Args:
+            scope: Machine dont depend la reponse (None = toutes).
+        """
+        with self._lock:
+            return self._epoch, self._generations.get(scope, 0)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        Retourne la valeur en cache, ou None si absente ou expiree.
+
+        Args:
+            key: Cle de la requete (endpoint et parametres).
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def set(
+        self,
+        key: Hashable,
+        value: Any,
+        generation: Tuple[int, int],
+        scope: Optional[str] = None
+    ) -> None:
+        """
+        Met une valeur en cache.
+
+        Si une ingestion a eu lieu pendant son calcul (la valeur pourrait
+        ne pas inclure les derniers choix), la valeur est ignoree pour une
+        machine, et conservee `max_staleness` secondes pour toutes les
+        machines. Elle est toujours ignoree apres une invalidation complete.
+
+        Args:
+            key: Cle de la requete.
+            value: Reponse a conserver.
+            generation: Valeur de `generation(scope)` lue avant le calcul.
+            scope: Machine dont depend la reponse (None = toutes).
+        """
+        with self._lock:
+            epoch, count = generation
+            ttl = self.ttl
+            if epoch != self._epoch:
+                return
+            if count != self._generations.get(scope, 0):
+                if scope is not None or self.max_staleness <= 0:
+                    return
+                ttl = min(ttl, self.max_staleness)
+
+            self._entries[key] = (time.monotonic() + ttl, scope, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, machine: Optional[str] = None) -> None:
+        """
+        Supprime les entrees affectees par une modification.
+
+        Args:
+            machine: Machine modifiee. Les entrees limitees a cette machine
+                sont supprimees, celles de toutes les machines expirent au
+                plus tard dans `max_staleness` secondes, les autres sont
+                conservees. None invalide tout le cache.
+        """
+        with self._lock:
+            if machine is None:
+                self._epoch += 1
+                self.invalidations += len(self._entries)
+                self._entries.clear()
+                return
+
+            for scope in (machine, None):
+                self._generations[scope] = self._generations.get(scope, 0) + 1
+            deadline = time.monotonic() + self.max_staleness
+            stale = []
+            for key, (expires, scope, value) in self._entries.items():
+                if scope == machine or (scope is None and self.max_staleness <= 0):
+                    stale.append(key)
+                elif scope is None and expires > deadline:
+                    self._entries[key] = (deadline, scope, value)
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+
+    def stats(self) -> dict:
+        """Retourne les compteurs du cache."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "max_staleness": self.max_staleness,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations
+            }
@@ -0,0 +1,86 @@
+"""
+Decompression des corps de requete envoyes en gzip.
+
+Les bornes compressent les corps JSON volumineux (lots de /choices/batch)
+avec l'en-tete Content-Encoding: gzip. Ce middleware ASGI les decompresse
+avant les routes, qui recoivent le JSON d'origine. La taille decompressee
+est bornee pour ne pas accepter de "bombe" gzip.
+"""
+
+import zlib
+
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+
+class GzipRequestMiddleware:
+    """Middleware ASGI : decompresse les corps Content-Encoding: gzip."""
+
+    def __init__(self, app: ASGIApp, max_size: int = 10 * 1024 * 1024):
+        """
+        Initialise le middleware.
+
+        Args:
+            app: Application ASGI.
+            max_size: Taille maximale d'un corps decompresse (octets).
+        """
+        self.app = app
+        self.max_size = max_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = [(key, value) for key, value in scope["headers"]]
+        encoding = next((value for key, value in headers if key == b"content-encoding"), b"")
+        if encoding.strip().lower() != b"gzip":
+            await self.app(scope, receive, send)
+            return
+
+        # Decompression au fil de la lecture, avec arret des la limite depassee
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        chunks = []
+        size = 0
+        more_body = True
+        try:
+            while more_body:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    return
+                more_body = message.get("more_body", False)
+                chunk = decompressor.decompress(message.get("body", b""), self.max_size + 1 - size)
+                size += len(chunk)
+                if size > self.max_size or decompressor.unconsumed_tail:
+                    await self._reject(scope, receive, send, 413, "Corps de requete trop volumineux")
+                    return
+                chunks.append(chunk)
+            if not decompressor.eof:
+                raise zlib.error("flux gzip incomplet")
+        except zlib.error:
+            await self._reject(scope, receive, send, 400, "Corps gzip invalide")
+            return
+
+        body = b"".join(chunks)
+        # Scope modifie en place : le routeur y ecrit la route, lue ensuite
+        # par le middleware des metriques (une copie la masquerait)
+        scope["headers"] = [
+            (key, value) for key, value in headers
+            if key not in (b"content-encoding", b"content-length")
+        ] + [(b"content-length", str(len(body)).encode())]
+
+        sent = False
+
+        async def replay() -> Message:
+            nonlocal sent
+            if not sent:
+                sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        await self.app(scope, replay, send)
+
+    @staticmethod
+    async def _reject(scope: Scope, receive: Receive, send: Send, status: int, detail: str) -> None:
+        """Repond par une erreur au format des erreurs de l'API."""
+        await JSONResponse({"detail": detail}, status_code=status)(scope, receive, send)
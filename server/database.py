@@ -4,6 +4,7 @@ Configuration de la connexion a la base de donnees.
 
 import os
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
 
 # Charge les variables d'environnement
@@ -20,11 +21,33 @@ DB_NAME = os.getenv("DB_NAME", "video_analytics")
 DB_USER = os.getenv("DB_USER", "postgres")
 DB_PASSWORD = os.getenv("DB_PASSWORD", "")
 
+# Pool de connexions (par processus uvicorn)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+POOL_OPTIONS = {
+    "pool_pre_ping": True,
+    "pool_size": DB_POOL_SIZE,
+    "max_overflow": DB_MAX_OVERFLOW,
+    "pool_recycle": DB_POOL_RECYCLE,
+    "pool_timeout": DB_POOL_TIMEOUT,
+}
+
 DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+ASYNC_DATABASE_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 
-engine = create_engine(DATABASE_URL, pool_pre_ping=True)
+# Moteur synchrone : scripts de maintenance (rollups.py, ...)
+engine = create_engine(DATABASE_URL, **POOL_OPTIONS)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Moteur asynchrone : routes de l'API
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **POOL_OPTIONS)
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine, autoflush=False, expire_on_commit=False
+)
+
 
 def get_db():
     """Generateur de session pour FastAPI Depends."""
@@ -35,7 +58,20 @@ def get_db():
         db.close()
 
 
+async def get_async_db():
+    """Generateur de session asynchrone pour FastAPI Depends."""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
 def init_db():
     """Initialise les tables de la base de donnees."""
     from models import Base
     Base.metadata.create_all(bind=engine)
+
+
+async def init_async_db():
+    """Initialise les tables de la base de donnees (moteur asynchrone)."""
+    from models import Base
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
@@ -0,0 +1,131 @@
+"""
+Reactivite des bornes, recue par heartbeat.
+
+Chaque borne envoie periodiquement les histogrammes de duree de ses
+etapes (client/telemetry.py) : appui -> lecture, lancement du lecteur,
+mise en file du choix... Les histogrammes sont conserves en memoire par
+machine (24 h par defaut) puis fusionnes pour comparer les bornes entre
+elles et reperer les plus lentes (GET /stats/latency).
+"""
+
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Deque, Dict, List, Optional, Tuple
+
+# Bornes superieures des histogrammes (ms), identiques cote borne
+BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# Histogramme fusionne : (comptes par case, somme ms, max ms)
+Histogram = Tuple[List[int], float, float]
+
+
+def quantile(counts: List[int], q: float, maximum: float) -> float:
+    """
+    Estime un quantile a partir des comptes par case.
+
+    Interpolation lineaire dans la case du quantile ; au-dela de la
+    derniere borne, le maximum observe est retourne.
+
+    Args:
+        counts: Comptes par case (len(BUCKETS_MS) + 1).
+        q: Quantile (0-1).
+        maximum: Duree maximale observee (ms).
+
+    Returns:
+        Duree estimee (ms), 0 si aucun compte.
+    """
+    total = sum(counts)
+    if not total:
+        return 0.0
+    rank = q * total
+    seen = 0
+    for index, count in enumerate(counts):
+        if count and seen + count >= rank:
+            if index == len(BUCKETS_MS):
+                return maximum
+            lower = BUCKETS_MS[index - 1] if index else 0
+            upper = BUCKETS_MS[index]
+            return min(maximum, lower + (upper - lower) * (rank - seen) / count)
+        seen += count
+    return maximum
+
+
+class FleetLatency:
+    """Histogrammes de reactivite des bornes, par machine et par etape."""
+
+    def __init__(self, retention_minutes: int = 1440):
+        """
+        Initialise un historique vide.
+
+        Args:
+            retention_minutes: Duree de conservation des heartbeats.
+        """
+        self.retention = timedelta(minutes=retention_minutes)
+        self._beats: Dict[str, Deque[Tuple[datetime, Dict[str, Histogram]]]] = {}
+        self._status: Dict[str, dict] = {}
+
+    def record(self, machine: str, stages: Dict[str, Histogram], status: dict, received_at: datetime) -> None:
+        """
+        Enregistre un heartbeat.
+
+        Args:
+            machine: Nom de la borne.
+            stages: Histogramme de chaque etape depuis le heartbeat precedent.
+            status: Etat de la borne (mode du lecteur, choix en attente...).
+            received_at: Instant de reception.
+        """
+        beats = self._beats.setdefault(machine, deque())
+        if stages:
+            beats.append((received_at, stages))
+        self._status[machine] = {**status, "last_heartbeat": received_at}
+        self._prune(beats, received_at)
+
+    def _prune(self, beats: Deque, now: datetime) -> None:
+        """Retire les heartbeats plus anciens que la retention."""
+        while beats and beats[0][0] < now - self.retention:
+            beats.popleft()
+
+    def remove_machine(self, machine: str) -> None:
+        """Oublie une machine (supprimee)."""
+        self._beats.pop(machine, None)
+        self._status.pop(machine, None)
+
+    def status(self, machine: str) -> dict:
+        """Dernier etat connu d'une borne (vide si jamais recu)."""
+        return self._status.get(machine, {})
+
+    def summary(self, stage: str, minutes: int) -> Tuple[Optional[Histogram], Dict[str, Histogram]]:
+        """
+        Fusionne les histogrammes d'une etape sur les dernieres minutes.
+
+        Args:
+            stage: Nom de l'etape.
+            minutes: Fenetre (minutes).
+
+        Returns:
+            (histogramme de tout le parc, histogramme par machine). Les
+            machines sans mesure de l'etape sont absentes.
+        """
+        now = datetime.utcnow()
+        cutoff = now - timedelta(minutes=minutes)
+        fleet: Optional[Histogram] = None
+        machines: Dict[str, Histogram] = {}
+
+        for machine, beats in self._beats.items():
+            self._prune(beats, now)
+            merged: Optional[Histogram] = None
+            for received_at, stages in beats:
+                if received_at < cutoff or stage not in stages:
+                    continue
+                merged = _merge(merged, stages[stage])
+            if merged is not None:
+                machines[machine] = merged
+                fleet = _merge(fleet, merged)
+        return fleet, machines
+
+
+def _merge(left: Optional[Histogram], right: Histogram) -> Histogram:
+    """Somme de deux histogrammes."""
+    if left is None:
+        return list(right[0]), right[1], right[2]
+    return [a + b for a, b in zip(left[0], right[0])], left[1] + right[1], max(left[2], right[2])
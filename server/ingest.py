@@ -0,0 +1,386 @@
+"""
+Ecriture differee des choix (write-behind) avec commit groupe.
+
+En mode buffered, les routes d'ingestion ne tiennent plus de transaction :
+les choix valides sont places dans une file bornee en memoire, et une tache
+de fond les ecrit par lots (toutes les INGEST_FLUSH_MS millisecondes ou des
+que INGEST_FLUSH_SIZE choix attendent) avec une seule insertion
+multi-lignes et une seule mise a jour de last_seen par machine. Le debit
+depend alors de la taille des lots et non plus de la latence d'un commit.
+
+Durabilite :
+- sync : la requete attend le commit du lot qui contient ses choix et
+  recoit leurs identifiants (commit groupe entre requetes concurrentes).
+- async : la requete est acquittee (202) des la mise en file ; les choix
+  sont perdus si le processus est tue avant l'ecriture.
+
+Lot en echec : une erreur passagere (base indisponible) fait echouer les
+requetes en attente (sync) ou remet le lot en tete de file (async). Une
+erreur de donnees coupe le lot en deux jusqu'a isoler les choix fautifs :
+les autres sont ecrits, les choix fautifs sont refuses (sync) ou mis en
+quarantaine dans rejected.jsonl (async). Les renvois partiels sont sans
+effet grace a l'event_id.
+
+File pleine : les nouveaux choix sont refuses (IngestQueueFull -> 503) et
+restent dans la file hors ligne des bornes, qui les renverront. A l'arret,
+la file est videe en base avant la fermeture ; les choix acquittes qui
+n'ont pas pu etre ecrits sont sauves dans pending.jsonl et remis en file au
+demarrage suivant.
+"""
+
+import asyncio
+import json
+import logging
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Awaitable, Callable, Deque, List, Optional, Tuple, Union
+
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Delai max entre deux essais d'ecriture en echec (mode async, secondes)
+MAX_RETRY_DELAY = 30.0
+
+# Classes SQLSTATE des erreurs passageres : connexion, conflit de
+# transaction, ressources, arret du serveur, erreur systeme
+TRANSIENT_SQLSTATES = ("08", "40", "53", "57", "58")
+
+# Ecriture d'un lot : retourne (identifiant, insere) de chaque choix, dans l'ordre
+Writer = Callable[[List[dict]], Awaitable[List[Tuple[int, bool]]]]
+
+
+class IngestQueueFull(Exception):
+    """La file d'ecriture est pleine (ou fermee) : le client doit reessayer."""
+
+
+class RowRejected(Exception):
+    """Choix refuse par la base (erreur de donnees) : un renvoi echouerait aussi."""
+
+
+# Resultat d'un choix : (identifiant, insere) ou refus
+Result = Union[Tuple[int, bool], RowRejected]
+
+
+def is_transient(error: Exception) -> bool:
+    """
+    Indique si une erreur d'ecriture peut disparaitre en reessayant.
+
+    Args:
+        error: Exception levee par l'ecriture d'un lot.
+
+    Returns:
+        True pour une erreur de connexion ou de ressources, False pour une
+        erreur liee aux donnees du lot.
+    """
+    if isinstance(error, DBAPIError):
+        if error.connection_invalidated:
+            return True
+        code = getattr(error.orig, "pgcode", None) or getattr(error.orig, "sqlstate", None)
+        if code:
+            return code[:2] in TRANSIENT_SQLSTATES
+    return isinstance(error, (OperationalError, InterfaceError, OSError, asyncio.TimeoutError))
+
+
+class IngestBuffer:
+    """File bornee de choix ecrits en base par une tache de fond."""
+
+    def __init__(
+        self,
+        writer: Writer,
+        max_size: int = 10000,
+        flush_interval: float = 0.05,
+        flush_size: int = 500,
+        durability: str = "sync",
+        spool_dir: Optional[Path] = None
+    ):
+        """
+        Initialise une file vide (la tache d'ecriture demarre avec start()).
+
+        Args:
+            writer: Coroutine ecrivant un lot de choix en une transaction.
+            max_size: Nombre maximum de choix en attente.
+            flush_interval: Attente max avant l'ecriture d'un lot (secondes).
+            flush_size: Nombre de choix declenchant une ecriture immediate.
+            durability: "sync" (attendre le commit) ou "async" (acquitter
+                des la mise en file).
+            spool_dir: Dossier des choix non ecrits a l'arret (pending.jsonl)
+                et des choix refuses par la base (rejected.jsonl). None =
+                journalises seulement.
+        """
+        if durability not in ("sync", "async"):
+            raise ValueError(f"Durabilite inconnue: {durability}")
+        self.writer = writer
+        self.max_size = max_size
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.durability = durability
+        self.spool_dir = spool_dir
+
+        # Chaque entree : choix d'une requete et futur de son commit (sync)
+        self._entries: Deque[Tuple[List[dict], Optional[asyncio.Future]]] = deque()
+        self._pending = 0
+        self._wake = asyncio.Event()
+        self._full = asyncio.Event()
+        self._closing = False
+        self._task: Optional[asyncio.Task] = None
+
+        self.flushes = 0
+        self.written = 0
+        self.rejected = 0
+        self.failures = 0
+        self.quarantined = 0
+        self.spooled = 0
+
+    @property
+    def pending(self) -> int:
+        """Nombre de choix en attente d'ecriture."""
+        return self._pending
+
+    def start(self) -> None:
+        """Remet en file les choix sauves au dernier arret et demarre la tache d'ecriture."""
+        rows = self._load_pending()
+        if rows:
+            self._entries.append((rows, None))
+            self._pending += len(rows)
+            metrics.INGEST_QUEUE.set(self._pending)
+            logger.info(f"{len(rows)} choix non ecrits au dernier arret remis en file")
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def submit(self, rows: List[dict]) -> Optional[List[Result]]:
+        """
+        Place des choix dans la file.
+
+        Args:
+            rows: Choix valides (cles choix, video, machine, event_time, event_id).
+
+        Returns:
+            (identifiant, insere) ou RowRejected pour chaque choix apres
+            commit (durabilite sync), None en durabilite async.
+
+        Raises:
+            IngestQueueFull: File pleine ou en cours d'arret.
+            Exception: Echec de l'ecriture du lot (durabilite sync).
+        """
+        if self._closing or self._pending + len(rows) > self.max_size:
+            self.rejected += len(rows)
+            metrics.INGEST_REJECTED.inc(len(rows))
+            raise IngestQueueFull()
+
+        future = asyncio.get_running_loop().create_future() if self.durability == "sync" else None
+        self._entries.append((rows, future))
+        self._pending += len(rows)
+        metrics.INGEST_QUEUE.set(self._pending)
+        self._wake.set()
+        if self._pending >= self.flush_size:
+            self._full.set()
+
+        if future is None:
+            return None
+        return await future
+
+    async def close(self) -> None:
+        """Refuse les nouveaux choix, ecrit ceux qui restent en file et sauve les autres."""
+        self._closing = True
+        self._wake.set()
+        self._full.set()
+        if self._task is not None:
+            await self._task
+            self._task = None
+
+    async def _run(self) -> None:
+        """Boucle d'ecriture : attend un lot plein ou le delai, puis ecrit."""
+        delay = 0.0
+        while True:
+            if not self._entries:
+                if self._closing:
+                    return
+                self._wake.clear()
+                await self._wake.wait()
+                continue
+
+            # Laisser le lot se remplir, au plus flush_interval
+            if self._pending < self.flush_size and not self._closing:
+                self._full.clear()
+                try:
+                    await asyncio.wait_for(self._full.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+            if await self._flush():
+                delay = 0.0
+            else:
+                delay = min(MAX_RETRY_DELAY, max(self.flush_interval, delay * 2))
+                await asyncio.sleep(delay)
+
+    def _take(self) -> List[Tuple[List[dict], Optional[asyncio.Future]]]:
+        """Retire de la file les entrees d'un lot (au moins une)."""
+        batch = []
+        size = 0
+        while self._entries and (not batch or size + len(self._entries[0][0]) <= self.flush_size):
+            rows, future = self._entries.popleft()
+            batch.append((rows, future))
+            size += len(rows)
+        return batch
+
+    async def _flush(self) -> bool:
+        """
+        Ecrit un lot en une transaction.
+
+        Returns:
+            False si l'ecriture a echoue (erreur passagere).
+        """
+        batch = self._take()
+        rows = [row for entry_rows, _ in batch for row in entry_rows]
+
+        try:
+            results = await self._write(rows)
+        except Exception as e:
+            self.failures += 1
+            # Requetes en attente (sync) : echec, les bornes renverront
+            for entry_rows, future in batch:
+                if future is not None:
+                    self._pending -= len(entry_rows)
+                    if not future.done():
+                        future.set_exception(e)
+            # Choix deja acquittes (async ou sauves au dernier arret) : remis
+            # en tete de file
+            self._entries.extendleft(reversed([entry for entry in batch if entry[1] is None]))
+            metrics.INGEST_QUEUE.set(self._pending)
+            logger.error(f"Echec d'ecriture d'un lot de {len(rows)} choix: {e}")
+            if self._closing:
+                self._spool_pending(e)
+                return True
+            return False
+
+        self._pending -= len(rows)
+        self.flushes += 1
+        self.written += sum(1 for result in results if not isinstance(result, RowRejected))
+        metrics.INGEST_QUEUE.set(self._pending)
+        metrics.INGEST_FLUSH_SIZE.observe(len(rows))
+
+        start = 0
+        for entry_rows, future in batch:
+            entry_results = results[start:start + len(entry_rows)]
+            if future is None:
+                self._quarantine([
+                    (row, result) for row, result in zip(entry_rows, entry_results)
+                    if isinstance(result, RowRejected)
+                ])
+            elif not future.done():
+                future.set_result(entry_results)
+            start += len(entry_rows)
+        return True
+
+    async def _write(self, rows: List[dict]) -> List[Result]:
+        """
+        Ecrit des choix, en coupant le lot en deux sur une erreur de donnees.
+
+        Args:
+            rows: Choix a ecrire.
+
+        Returns:
+            (identifiant, insere) ou RowRejected pour chaque choix, dans l'ordre.
+
+        Raises:
+            Exception: Erreur passagere (les moities deja ecrites le restent,
+                un renvoi est dedoublonne par event_id).
+        """
+        try:
+            return list(await self.writer(rows))
+        except Exception as e:
+            if is_transient(e):
+                raise
+            if len(rows) == 1:
+                return [RowRejected(str(e).splitlines()[0])]
+            middle = len(rows) // 2
+            return await self._write(rows[:middle]) + await self._write(rows[middle:])
+
+    def _quarantine(self, rejected: List[Tuple[dict, RowRejected]]) -> None:
+        """Sauve les choix acquittes refuses par la base (rejected.jsonl)."""
+        if not rejected:
+            return
+        self.quarantined += len(rejected)
+        metrics.INGEST_QUARANTINED.inc(len(rejected))
+        for row, error in rejected:
+            logger.error(f"Choix refuse par la base, mis en quarantaine: {error}")
+        self._append("rejected.jsonl", [
+            {"row": _dump_row(row), "error": str(error)} for row, error in rejected
+        ])
+
+    def _spool_pending(self, error: Exception) -> None:
+        """
+        Vide la file a l'arret apres un echec d'ecriture.
+
+        Les requetes en attente (sync) echouent ; les choix acquittes sont
+        sauves dans pending.jsonl.
+
+        Args:
+            error: Erreur de la derniere ecriture.
+        """
+        rows = []
+        for entry_rows, future in self._entries:
+            if future is None:
+                rows.extend(entry_rows)
+            elif not future.done():
+                future.set_exception(error)
+        self._entries.clear()
+        self._pending = 0
+        metrics.INGEST_QUEUE.set(0)
+        if not rows:
+            return
+        self.spooled += len(rows)
+        logger.error(f"Arret : {len(rows)} choix acquittes non ecrits, sauves pour le prochain demarrage")
+        self._append("pending.jsonl", [_dump_row(row) for row in rows])
+
+    def _append(self, name: str, records: List[dict]) -> None:
+        """Ajoute des lignes JSON a un fichier du dossier de sauvegarde."""
+        lines = [json.dumps(record) for record in records]
+        if self.spool_dir is None:
+            # Pas de dossier : les choix restent recuperables dans le journal
+            for line in lines:
+                logger.error(f"{name}: {line}")
+            return
+        self.spool_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.spool_dir / name, "a", encoding="utf-8") as spool:
+            spool.write("".join(line + "\n" for line in lines))
+
+    def _load_pending(self) -> List[dict]:
+        """Lit et supprime les choix sauves au dernier arret (pending.jsonl)."""
+        if self.spool_dir is None:
+            return []
+        path = self.spool_dir / "pending.jsonl"
+        if not path.exists():
+            return []
+        with open(path, encoding="utf-8") as spool:
+            rows = [_load_row(json.loads(line)) for line in spool if line.strip()]
+        path.unlink()
+        return rows
+
+    def stats(self) -> dict:
+        """Etat de la file (exposee par /health)."""
+        return {
+            "durability": self.durability,
+            "pending": self._pending,
+            "max_size": self.max_size,
+            "flushes": self.flushes,
+            "written": self.written,
+            "rejected": self.rejected,
+            "failures": self.failures,
+            "quarantined": self.quarantined,
+            "spooled": self.spooled
+        }
+
+
+def _dump_row(row: dict) -> dict:
+    """Choix au format JSON (event_time en ISO 8601)."""
+    return {**row, "event_time": row["event_time"].isoformat()}
+
+
+def _load_row(record: dict) -> dict:
+    """Choix relu depuis le format JSON de _dump_row."""
+    return {**record, "event_time": datetime.fromisoformat(record["event_time"])}
@@ -0,0 +1,127 @@
+"""
+Diffusion en direct des choix (Server-Sent Events).
+
+Le hub garde en memoire les derniers choix et alimente les compteurs
+glissants de realtime.py ; les machines actives sont lues dans le registre
+des machines (registry.py). Il est alimente a chaque
+ingestion et diffuse chaque nouveau choix a tous les abonnes : les
+dashboards ne font plus aucune requete en base.
+
+Le hub est propre a chaque processus : l'API doit tourner avec un seul
+worker uvicorn pour que tous les abonnes voient tous les choix.
+"""
+
+import asyncio
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Iterable, List, Set
+
+from realtime import SlidingWindow
+from registry import MachineRegistry
+
+WINDOW = timedelta(hours=1)
+
+
+class LiveHub:
+    """Fan-out en memoire des nouveaux choix vers les abonnes."""
+
+    def __init__(
+        self,
+        window: SlidingWindow,
+        registry: MachineRegistry,
+        recent_size: int = 20,
+        queue_size: int = 256
+    ):
+        """
+        Initialise le hub.
+
+        Args:
+            window: Compteurs par minute alimentes par le hub.
+            registry: Registre des machines (derniere activite).
+            recent_size: Nombre de choix recents conserves.
+            queue_size: Taille de la file de chaque abonne.
+        """
+        self.window = window
+        self.registry = registry
+        self.queue_size = queue_size
+        self._recent: deque = deque(maxlen=recent_size)
+        self._subscribers: Set[asyncio.Queue] = set()
+
+    def seed(self, recent: Iterable[dict]) -> None:
+        """
+        Initialise l'etat depuis la base au demarrage.
+
+        Les compteurs glissants sont initialises separement (window.seed).
+
+        Args:
+            recent: Derniers choix (du plus recent au plus ancien).
+        """
+        self._recent.extend(reversed(list(recent)))
+
+    def publish(self, events: List[dict]) -> None:
+        """
+        Enregistre et diffuse de nouveaux choix.
+
+        Args:
+            events: Choix enregistres (cles choix, machine, time).
+        """
+        for event in sorted(events, key=lambda e: e["time"]):
+            self.window.add(event["machine"], event["choix"], event["time"])
+            self._recent.append(event)
+
+        count = self.choices_last_hour
+        for queue in list(self._subscribers):
+            for event in events:
+                message = {**event, "choices_last_hour": count}
+                try:
+                    queue.put_nowait(message)
+                except asyncio.QueueFull:
+                    # Abonne trop lent : on vide sa file et on le resynchronise
+                    while not queue.empty():
+                        queue.get_nowait()
+                    queue.put_nowait(None)
+                    break
+
+    def discard(self, machine: str, choix: str, event_time: datetime) -> None:
+        """
+        Retire un choix supprime des compteurs.
+
+        Args:
+            machine: Machine du choix supprime.
+            choix: Bouton du choix supprime.
+            event_time: Horodatage du choix supprime.
+        """
+        self.window.add(machine, choix, event_time, count=-1)
+
+    @property
+    def choices_last_hour(self) -> int:
+        """Nombre de choix sur la derniere heure (a la minute pres)."""
+        return self.window.total(WINDOW // timedelta(minutes=1))
+
+    def snapshot(self) -> dict:
+        """Etat courant, au format de /stats/live."""
+        now = datetime.utcnow()
+        return {
+            "recent_choices": [
+                {**event, "time": event["time"].isoformat()}
+                for event in reversed(self._recent)
+                if event["time"] >= now - WINDOW
+            ],
+            "active_machines": self.registry.active(now - WINDOW),
+            "choices_last_hour": self.choices_last_hour
+        }
+
+    def subscribe(self) -> asyncio.Queue:
+        """Cree la file d'un nouvel abonne (None = resynchronisation)."""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        """Supprime un abonne."""
+        self._subscribers.discard(queue)
+
+    @property
+    def subscribers(self) -> int:
+        """Nombre d'abonnes connectes."""
+        return len(self._subscribers)
@@ -4,27 +4,132 @@ API FastAPI pour la gestion des donnees video analytics.
 Ce serveur centralise les donnees de toutes les bornes video.
 """
 
+import asyncio
+import csv
+import io
+import json
+import logging
 import os
-from datetime import datetime, timedelta
-from typing import Optional
+import uuid
+from collections import Counter
+from datetime import date, datetime, time, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
 
-from fastapi import FastAPI, Depends, HTTPException, Query
+from fastapi import FastAPI, Body, Depends, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy import func, desc
-from sqlalchemy.orm import Session
-
-from database import get_db, init_db, engine
-from models import Base, UserChoice, Machine
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import ValidationError
+from sqlalchemy import func, desc, or_, select, text, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PARQUET_AVAILABLE = True
+except ImportError:
+    PARQUET_AVAILABLE = False
+
+import analytics
+import heartbeats
+import metrics
+import partitions
+import rollups
+import stats
+from cache import StatsCache
+from compression import GzipRequestMiddleware
+from ingest import IngestBuffer, IngestQueueFull, Result, RowRejected
+from live import LiveHub
+from realtime import SlidingWindow
+from registry import MachineRegistry
+from database import (
+    get_async_db, init_async_db, AsyncSessionLocal, SessionLocal, async_engine, engine
+)
+from models import UserChoice, Machine, Video, ChoiceRollupDaily
+from names import NameCache
 from schemas import (
     ChoiceCreate, ChoiceResponse, ChoiceListResponse,
+    ChoiceBatchItemResult, ChoiceBatchResponse,
     MachineCreate, MachineUpdate, MachineResponse,
-    StatsResponse, ChoiceStatItem, MachineStatItem, DailyStatItem,
-    HealthResponse
+    HeartbeatCreate, LatencyItem, LatencyResponse,
+    StatsResponse, ChoiceStatItem, MachineStatItem,
+    VideoStatItem, VideoStatsResponse, VideoTimelineResponse, DailyStatItem, HeatmapResponse,
+    RealtimeStatsResponse, RealtimeRateResponse, RateItem,
+    CacheStatsResponse, HealthResponse
 )
 
+logger = logging.getLogger(__name__)
+
 # Version de l'API
 API_VERSION = "1.0.0"
 
+# Nombre maximum d'evenements acceptes par lot
+MAX_BATCH_SIZE = 1000
+
+# Nombre de lignes lues par lot lors d'un export
+EXPORT_CHUNK_SIZE = 5000
+
+# Identifiants des chemins de video (user_choices.video_id)
+video_ids = NameCache(Video, "path")
+
+# Cache des reponses de /stats
+stats_cache = StatsCache(
+    maxsize=int(os.getenv("STATS_CACHE_SIZE", "256")),
+    ttl=float(os.getenv("STATS_CACHE_TTL", "30")),
+    max_staleness=float(os.getenv("STATS_CACHE_MAX_STALENESS", "1"))
+)
+
+# Intervalle de maintenance des partitions de user_choices (secondes)
+PARTITION_MAINTENANCE_INTERVAL = float(os.getenv("PARTITION_MAINTENANCE_INTERVAL", "86400"))
+
+# Compteurs par minute des dernieres 24 h (/stats/realtime)
+REALTIME_WINDOW = 1440
+realtime_window = SlidingWindow(REALTIME_WINDOW)
+
+# Segments colonnes des jours clos (/stats/history), desactives sans dossier
+ANALYTICS_DIR = os.getenv("ANALYTICS_DIR", "")
+ANALYTICS_EXPORT_INTERVAL = float(os.getenv("ANALYTICS_EXPORT_INTERVAL", "3600"))
+analytics_store: Optional[analytics.SegmentStore] = None
+if ANALYTICS_DIR and analytics.NUMPY_AVAILABLE:
+    analytics_store = analytics.SegmentStore(
+        Path(ANALYTICS_DIR),
+        delay_days=int(os.getenv("ANALYTICS_DELAY_DAYS", "1"))
+    )
+elif ANALYTICS_DIR:
+    logger.warning("ANALYTICS_DIR ignore : numpy non installe")
+
+# Machines connues et derniere activite, ecrite en base periodiquement
+machine_registry = MachineRegistry()
+MACHINE_FLUSH_INTERVAL = float(os.getenv("MACHINE_FLUSH_INTERVAL", "10"))
+
+# Diffusion en direct des choix (/stats/live et /stats/live/stream)
+live_hub = LiveHub(
+    realtime_window,
+    machine_registry,
+    queue_size=int(os.getenv("LIVE_QUEUE_SIZE", "256"))
+)
+
+# Intervalle des commentaires keep-alive du flux SSE (secondes)
+LIVE_KEEPALIVE = float(os.getenv("LIVE_KEEPALIVE", "15"))
+
+# Reactivite des bornes recue par heartbeat (/stats/latency)
+fleet_latency = heartbeats.FleetLatency(int(os.getenv("HEARTBEAT_RETENTION_MINUTES", "1440")))
+
+# Ecriture des choix : direct (une transaction par requete) ou buffered
+# (file en memoire ecrite par lots, voir ingest.py)
+INGEST_MODE = os.getenv("INGEST_MODE", "direct")
+ingest_buffer: Optional[IngestBuffer] = None
+if INGEST_MODE == "buffered":
+    ingest_buffer = IngestBuffer(
+        lambda rows: _write_buffered(rows),
+        max_size=int(os.getenv("INGEST_QUEUE_SIZE", "10000")),
+        flush_interval=float(os.getenv("INGEST_FLUSH_MS", "50")) / 1000,
+        flush_size=int(os.getenv("INGEST_FLUSH_SIZE", "500")),
+        durability=os.getenv("INGEST_DURABILITY", "sync"),
+        spool_dir=Path(os.getenv("INGEST_SPOOL_DIR", "./ingest_spool"))
+    )
+
 # Creation de l'application FastAPI
 app = FastAPI(
     title="Video Analytics API",
@@ -43,20 +148,133 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Corps de requete compresses par les bornes (Content-Encoding: gzip)
+app.add_middleware(
+    GzipRequestMiddleware,
+    max_size=int(os.getenv("GZIP_MAX_BODY_SIZE", str(10 * 1024 * 1024)))
+)
+
+# Metriques Prometheus (/metrics) : latence par route, requetes SQL, pools
+app.middleware("http")(metrics.http_middleware)
+metrics.instrument_engine(async_engine.sync_engine)
+metrics.instrument_engine(engine)
+
 
 @app.on_event("startup")
 async def startup_event():
     """Initialise la base de donnees au demarrage."""
-    Base.metadata.create_all(bind=engine)
+    await init_async_db()
+
+    # Partitions du mois courant et des suivants avant toute insertion
+    await asyncio.to_thread(_maintain_partitions)
+    asyncio.create_task(_partition_maintenance_loop())
+
+    # Agregats encore vides (premier demarrage, nouvelle table) : calcul
+    # depuis l'historique, sans toucher aux agregats deja remplis
+    async with AsyncSessionLocal() as db:
+        built = await db.run_sync(rollups.backfill)
+        if built:
+            await db.commit()
+            logger.info(f"Agregats calcules depuis l'historique: {', '.join(built)}")
+
+        await machine_registry.load(db)
+        await _seed_live_hub(db)
+    asyncio.create_task(_machine_flush_loop())
+
+    if analytics_store is not None:
+        count = await asyncio.to_thread(analytics_store.load)
+        logger.info(f"{count} segments d'analyse charges")
+        asyncio.create_task(_analytics_export_loop())
+
+    if ingest_buffer is not None:
+        ingest_buffer.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Ecrit les choix encore en file et l'activite des machines avant l'arret."""
+    if ingest_buffer is not None:
+        await ingest_buffer.close()
+    await _flush_machines()
+
+
+def _maintain_partitions() -> None:
+    """Cree les partitions a venir et applique la retention (moteur synchrone)."""
+    db = SessionLocal()
+    try:
+        partitions.maintain(db)
+    finally:
+        db.close()
+
+
+async def _partition_maintenance_loop() -> None:
+    """Relance la maintenance des partitions a intervalle regulier."""
+    while True:
+        await asyncio.sleep(PARTITION_MAINTENANCE_INTERVAL)
+        try:
+            await asyncio.to_thread(_maintain_partitions)
+        except Exception:
+            logger.exception("Echec de la maintenance des partitions")
+
+
+def _export_segments() -> None:
+    """Exporte les jours clos en segments colonnes (moteur synchrone)."""
+    db = SessionLocal()
+    try:
+        written = analytics_store.export(db)
+        if written:
+            logger.info(f"{written} segments d'analyse exportes")
+    finally:
+        db.close()
+
+
+async def _analytics_export_loop() -> None:
+    """Exporte les jours clos au demarrage puis a intervalle regulier."""
+    while True:
+        try:
+            await asyncio.to_thread(_export_segments)
+        except Exception:
+            logger.exception("Echec de l'export des segments d'analyse")
+        await asyncio.sleep(ANALYTICS_EXPORT_INTERVAL)
+
+
+async def _flush_machines() -> None:
+    """Ecrit en base le last_seen des machines actives depuis l'ecriture precedente."""
+    async with AsyncSessionLocal() as db:
+        await machine_registry.flush(db)
+
+
+async def _machine_flush_loop() -> None:
+    """Ecrit l'activite des machines a intervalle regulier."""
+    while True:
+        await asyncio.sleep(MACHINE_FLUSH_INTERVAL)
+        try:
+            await _flush_machines()
+        except Exception:
+            logger.exception("Echec de l'ecriture de last_seen des machines")
+
+
+async def _seed_live_hub(db: AsyncSession) -> None:
+    """Charge l'activite recente dans le hub et les compteurs glissants."""
+    now = datetime.utcnow()
+    one_hour_ago = now - timedelta(hours=1)
+    window_start = now - timedelta(minutes=REALTIME_WINDOW)
+
+    recent = (await db.execute(_recent_choices_query(one_hour_ago))).all()
+    realtime_window.seed((await db.execute(_minute_counts_query(window_start))).all())
+
+    live_hub.seed(
+        [{"choix": c.choix, "machine": c.machine, "time": c.event_time} for c in recent]
+    )
 
 
 # ========== Health Check ==========
 
 @app.get("/health", response_model=HealthResponse, tags=["System"])
-def health_check(db: Session = Depends(get_db)):
+async def health_check(db: AsyncSession = Depends(get_async_db)):
     """Verifie l'etat du serveur et de la base de donnees."""
     try:
-        db.execute("SELECT 1")
+        await db.execute(text("SELECT 1"))
         db_status = "connected"
     except Exception:
         db_status = "disconnected"
@@ -64,156 +282,707 @@ def health_check(db: Session = Depends(get_db)):
     return HealthResponse(
         status="ok",
         database=db_status,
-        version=API_VERSION
+        version=API_VERSION,
+        ingest=ingest_buffer.stats() if ingest_buffer is not None else None
     )
 
 
+# Fenetre du debit d'ingestion par machine de /metrics (minutes)
+INGEST_RATE_WINDOW = 5
+
+
+@app.get("/metrics", response_class=PlainTextResponse, tags=["System"])
+async def get_metrics():
+    """Metriques au format texte Prometheus (requetes, base, ingestion)."""
+    metrics.observe_pool("async", async_engine.pool)
+    metrics.observe_pool("sync", engine.pool)
+    metrics.INGEST_RATE.replace({
+        (name,): round(count / INGEST_RATE_WINDOW, 2)
+        for name, count in _machine_totals(INGEST_RATE_WINDOW).items()
+    })
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+def _machine_totals(minutes: int) -> Dict[str, int]:
+    """Nombre de choix par machine sur les dernieres minutes (compteurs glissants)."""
+    totals: Dict[str, int] = {}
+    for (name, _), count in realtime_window.totals(minutes).items():
+        totals[name] = totals.get(name, 0) + count
+    return totals
+
+
 # ========== Choices Endpoints ==========
 
+def _choice_select():
+    """Colonnes d'un choix, avec les noms de machine et de video (jointures)."""
+    return (
+        select(
+            UserChoice.id,
+            UserChoice.choix,
+            Video.path.label("video"),
+            Machine.name.label("machine"),
+            UserChoice.event_time
+        )
+        .join(Video, Video.id == UserChoice.video_id)
+        .join(Machine, Machine.id == UserChoice.machine_id)
+    )
+
+
+def _choices_query(machine: Optional[str], choix: Optional[str], days: int):
+    """Choix des `days` derniers jours, filtres par machine et bouton (/choices et export)."""
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    query = _choice_select().where(UserChoice.event_time >= cutoff)
+    if machine:
+        query = query.where(Machine.name == machine)
+    if choix:
+        query = query.where(UserChoice.choix == choix.upper())
+    return query
+
+
+def _count_query(query):
+    """Nombre de lignes d'une requete de _choices_query."""
+    return select(func.count()).select_from(query.subquery())
+
+
+def _page_query(query, after: Optional[tuple] = None, offset: int = 0, limit: int = 100):
+    """Page d'une requete de _choices_query, du plus recent au plus ancien (index event_time, id)."""
+    if after:
+        query = query.where(tuple_(UserChoice.event_time, UserChoice.id) < tuple_(*after))
+    return query.order_by(desc(UserChoice.event_time), desc(UserChoice.id)).offset(offset).limit(limit)
+
+
+def _recent_choices_query(since: datetime, limit: int = 20):
+    """Derniers choix depuis `since` (flux en direct au demarrage)."""
+    return (
+        _choice_select()
+        .where(UserChoice.event_time >= since)
+        .order_by(desc(UserChoice.event_time))
+        .limit(limit)
+    )
+
+
+def _minute_counts_query(since: datetime):
+    """Nombre de choix par minute, machine et bouton depuis `since` (compteurs glissants)."""
+    minute = func.date_trunc("minute", UserChoice.event_time)
+    return (
+        select(minute, Machine.name, UserChoice.choix, func.count(UserChoice.id))
+        .join(Machine, Machine.id == UserChoice.machine_id)
+        .where(UserChoice.event_time >= since)
+        .group_by(minute, Machine.name, UserChoice.choix)
+    )
+
+
+def _existing_choices_query(keys: List[Tuple[str, datetime]]):
+    """Identifiants des choix deja enregistres, par (event_id, event_time)."""
+    return select(UserChoice.event_id, UserChoice.id).where(
+        tuple_(UserChoice.event_id, UserChoice.event_time).in_(keys)
+    )
+
+
+def _choice_row(choice: ChoiceCreate, now: datetime) -> dict:
+    """Choix valide au format de _store_choices (event_id genere s'il manque)."""
+    return {
+        "choix": choice.choix.upper(),
+        "video": choice.video,
+        "machine": choice.machine,
+        "event_time": choice.event_time or now,
+        "event_id": str(choice.event_id or uuid.uuid4())
+    }
+
+
+async def _store_choices(db: AsyncSession, rows: List[dict], now: datetime) -> List[Tuple[int, bool]]:
+    """
+    Ecrit des choix valides en une transaction.
+
+    Insertion multi-lignes et agregats de /stats, puis activite des
+    machines (registre en memoire), diffusion en direct et invalidation du
+    cache. Seules les machines inconnues font une requete sur machines.
+
+    Un choix deja enregistre (meme event_id et event_time, renvoi d'une
+    borne dont la reponse a ete perdue) n'est pas insere a nouveau : seuls
+    les choix effectivement inseres sont comptes dans les agregats.
+
+    Args:
+        db: Session de base de donnees.
+        rows: Choix (cles choix, video, machine, event_time, event_id).
+        now: Instant de reception (last_seen des machines).
+
+    Returns:
+        (identifiant, insere) de chaque choix, dans l'ordre de rows.
+    """
+    machines = await machine_registry.resolve(db, [row["machine"] for row in rows], now)
+    videos = await video_ids.resolve(db, [row["video"] for row in rows])
+    created = dict((await db.execute(
+        pg_insert(UserChoice)
+        .on_conflict_do_nothing(index_elements=[UserChoice.event_id, UserChoice.event_time])
+        .returning(UserChoice.event_id, UserChoice.id),
+        [
+            {
+                "choix": row["choix"],
+                "video_id": videos[row["video"]],
+                "machine_id": machines[row["machine"]],
+                "event_time": row["event_time"],
+                "event_id": row["event_id"]
+            }
+            for row in rows
+        ]
+    )).tuples().all())
+
+    # Un event_id present deux fois dans le lot n'est insere qu'une fois
+    inserted = []
+    seen = set()
+    for row in rows:
+        inserted.append(row["event_id"] in created and row["event_id"] not in seen)
+        seen.add(row["event_id"])
+    fresh = [row for row, new in zip(rows, inserted) if new]
+    duplicates = [row for row, new in zip(rows, inserted) if not new]
+
+    existing = {}
+    missing = [row for row in duplicates if row["event_id"] not in created]
+    if missing:
+        existing = dict((await db.execute(_existing_choices_query(
+            [(row["event_id"], row["event_time"]) for row in missing]
+        ))).tuples().all())
+
+    await db.run_sync(rollups.add_choices, [
+        {**row, "video_id": videos[row["video"]]} for row in fresh
+    ])
+    await db.commit()
+    video_ids.remember(videos)
+    machine_registry.touch(machines, now)
+    if analytics_store is not None and fresh:
+        analytics_store.invalidate({row["event_time"].date() for row in fresh})
+
+    for name in {row["machine"] for row in fresh}:
+        stats_cache.invalidate(name)
+    live_hub.publish([
+        {"choix": row["choix"], "machine": row["machine"], "time": row["event_time"]}
+        for row in fresh
+    ])
+    for name, count in Counter(row["machine"] for row in fresh).items():
+        metrics.CHOICES_INGESTED.inc(count, machine=name)
+    for name, count in Counter(row["machine"] for row in duplicates).items():
+        metrics.CHOICES_DUPLICATE.inc(count, machine=name)
+
+    return [
+        (created.get(row["event_id"]) or existing.get(row["event_id"]), new)
+        for row, new in zip(rows, inserted)
+    ]
+
+
+async def _write_buffered(rows: List[dict]) -> List[Tuple[int, bool]]:
+    """Ecrit un lot de la file d'ecriture differee (session dediee)."""
+    async with AsyncSessionLocal() as db:
+        return await _store_choices(db, rows, datetime.utcnow())
+
+
+async def _ingest(db: AsyncSession, rows: List[dict], now: datetime) -> Optional[List[Result]]:
+    """
+    Enregistre des choix valides selon INGEST_MODE.
+
+    Returns:
+        (identifiant, insere) de chaque choix, ou RowRejected pour un choix
+        refuse par la base (ecriture differee), None si l'ecriture est
+        differee sans attente du commit (INGEST_DURABILITY=async).
+
+    Raises:
+        HTTPException: 503 si la file d'ecriture est pleine.
+    """
+    if ingest_buffer is None:
+        return await _store_choices(db, rows, now)
+    try:
+        return await ingest_buffer.submit(rows)
+    except IngestQueueFull:
+        raise HTTPException(
+            status_code=503,
+            detail="File d'ecriture pleine, reessayez plus tard",
+            headers={"Retry-After": "1"}
+        )
+    except Exception:
+        logger.exception("Echec de l'ecriture differee")
+        raise HTTPException(status_code=503, detail="Echec de l'ecriture, reessayez plus tard")
+
+
 @app.post("/choices", response_model=ChoiceResponse, status_code=201, tags=["Choices"])
-def create_choice(choice: ChoiceCreate, db: Session = Depends(get_db)):
+async def create_choice(
+    choice: ChoiceCreate,
+    response: Response,
+    db: AsyncSession = Depends(get_async_db)
+):
     """
     Enregistre un nouveau choix utilisateur.
 
     Cette endpoint est appelee par les bornes a chaque pression de bouton.
+    En ecriture differee sans attente du commit, repond 202 sans id. Un
+    choix deja enregistre (meme event_id) repond 200 avec son id.
     """
-    # Mettre a jour last_seen de la machine
-    machine = db.query(Machine).filter(Machine.name == choice.machine).first()
-    if machine:
-        machine.last_seen = datetime.utcnow()
+    now = datetime.utcnow()
+    row = _choice_row(choice, now)
+
+    ids = await _ingest(db, [row], now)
+    choice_id = None
+    if ids is None:
+        response.status_code = 202
+    elif isinstance(ids[0], RowRejected):
+        raise HTTPException(status_code=422, detail=f"Choix refuse par la base: {ids[0]}")
     else:
-        # Auto-enregistrement de la machine si inconnue
-        machine = Machine(name=choice.machine)
-        db.add(machine)
-
-    # Creer le choix
-    db_choice = UserChoice(
-        choix=choice.choix.upper(),
-        video=choice.video,
-        machine=choice.machine
+        choice_id, created = ids[0]
+        if not created:
+            response.status_code = 200
+
+    return ChoiceResponse(
+        id=choice_id,
+        choix=row["choix"],
+        video=row["video"],
+        machine=row["machine"],
+        event_time=row["event_time"]
+    )
+
+
+@app.post("/choices/batch", response_model=ChoiceBatchResponse, tags=["Choices"])
+async def create_choices_batch(
+    response: Response,
+    events: List[Dict[str, Any]] = Body(..., min_length=1, max_length=MAX_BATCH_SIZE),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Enregistre un lot de choix en une seule transaction.
+
+    Chaque element est valide individuellement : les elements invalides sont
+    rejetes sans bloquer le reste du lot. Les elements valides sont inseres
+    avec une seule requete multi-lignes ; last_seen est tenu en memoire
+    (registry.py). En ecriture differee sans attente du commit, le
+    lot est acquitte en 202 (statut "accepted", sans id). Les choix deja
+    enregistres (meme event_id) ont le statut "duplicate" et l'id existant.
+    """
+    now = datetime.utcnow()
+    results: List[ChoiceBatchItemResult] = []
+    rows = []
+
+    for index, raw in enumerate(events):
+        try:
+            choice = ChoiceCreate.model_validate(raw)
+        except ValidationError as e:
+            error = e.errors()[0]
+            field = ".".join(str(part) for part in error["loc"])
+            results.append(ChoiceBatchItemResult(
+                index=index,
+                status="rejected",
+                error=f"{field}: {error['msg']}" if field else error["msg"]
+            ))
+            continue
+
+        rows.append(_choice_row(choice, now))
+        results.append(ChoiceBatchItemResult(index=index, status="created"))
+
+    duplicates = 0
+    refused = 0
+    if rows:
+        ids = await _ingest(db, rows, now)
+        if ids is None:
+            response.status_code = 202
+            for result in results:
+                if result.status == "created":
+                    result.status = "accepted"
+        else:
+            stored = iter(ids)
+            for result in results:
+                if result.status == "created":
+                    stored_result = next(stored)
+                    if isinstance(stored_result, RowRejected):
+                        result.status = "rejected"
+                        result.error = f"Choix refuse par la base: {stored_result}"
+                        refused += 1
+                        continue
+                    result.id, created = stored_result
+                    if not created:
+                        result.status = "duplicate"
+                        duplicates += 1
+
+    return ChoiceBatchResponse(
+        created=len(rows) - duplicates - refused,
+        rejected=len(results) - len(rows) + refused,
+        duplicates=duplicates,
+        items=results
     )
-    db.add(db_choice)
-    db.commit()
-    db.refresh(db_choice)
 
-    return db_choice
+
+def _parse_cursor(cursor: str) -> tuple:
+    """Decode un curseur de pagination "event_time,id"."""
+    try:
+        event_time, choice_id = cursor.rsplit(",", 1)
+        return datetime.fromisoformat(event_time), int(choice_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Curseur invalide")
+
+
+async def _estimate_count(db: AsyncSession, statement) -> int:
+    """Estime le nombre de lignes d'une requete via le planificateur (EXPLAIN)."""
+    compiled = statement.compile(
+        dialect=db.bind.dialect, compile_kwargs={"literal_binds": True}
+    )
+    plan = await db.scalar(text(f"EXPLAIN (FORMAT JSON) {compiled}"))
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
 
 
 @app.get("/choices", response_model=ChoiceListResponse, tags=["Choices"])
-def list_choices(
+async def list_choices(
     machine: Optional[str] = Query(None, description="Filtrer par machine"),
     choix: Optional[str] = Query(None, description="Filtrer par bouton (A-G)"),
     days: int = Query(7, ge=1, le=365, description="Nombre de jours"),
     limit: int = Query(100, ge=1, le=1000),
     offset: int = Query(0, ge=0),
-    db: Session = Depends(get_db)
+    after: Optional[str] = Query(
+        None, description="Curseur de pagination (next_cursor de la page precedente)"
+    ),
+    total: str = Query(
+        "exact", pattern="^(exact|estimate|none)$",
+        description="Calcul du total : exact, estimate (planificateur) ou none"
+    ),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Liste les choix avec filtres et pagination."""
-    query = db.query(UserChoice)
+    """
+    Liste les choix avec filtres et pagination.
 
-    # Filtres
-    cutoff = datetime.utcnow() - timedelta(days=days)
-    query = query.filter(UserChoice.event_time >= cutoff)
+    Pour parcourir un long historique, utiliser `after` avec le
+    `next_cursor` de la page precedente plutot que `offset` : chaque page
+    coute alors le meme prix quelle que soit sa profondeur. `total=estimate`
+    ou `total=none` evite le comptage complet a chaque page.
+    """
+    query = _choices_query(machine, choix, days)
 
-    if machine:
-        query = query.filter(UserChoice.machine == machine)
-    if choix:
-        query = query.filter(UserChoice.choix == choix.upper())
+    # Total
+    if total == "exact":
+        count = await db.scalar(_count_query(query))
+    elif total == "estimate":
+        count = await _estimate_count(db, query)
+    else:
+        count = None
+
+    # Pagination par curseur (index event_time, id)
+    cursor = _parse_cursor(after) if after else None
+    items = (await db.execute(_page_query(query, cursor, offset, limit))).all()
+
+    next_cursor = None
+    if len(items) == limit:
+        last = items[-1]
+        next_cursor = f"{last.event_time.isoformat()},{last.id}"
+
+    return ChoiceListResponse(
+        total=count,
+        total_estimated=total == "estimate",
+        next_cursor=next_cursor,
+        items=items
+    )
+
+
+EXPORT_COLUMNS = ["id", "choix", "video", "machine", "event_time"]
+
+EXPORT_MEDIA_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+class _ChunkSink(io.RawIOBase):
+    """Fichier en ecriture seule dont le contenu est recupere au fil de l'eau."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        """Retourne et oublie les octets ecrits depuis le dernier appel."""
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+async def _export_rows(statement):
+    """Lit les lignes a exporter par lots, via un curseur cote serveur."""
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(statement.execution_options(yield_per=EXPORT_CHUNK_SIZE))
+        async for chunk in result.partitions():
+            yield chunk
+
+
+async def _export_csv(statement):
+    """Genere l'export au format CSV."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    async for chunk in _export_rows(statement):
+        for row in chunk:
+            writer.writerow([row.id, row.choix, row.video, row.machine, row.event_time.isoformat()])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+async def _export_ndjson(statement):
+    """Genere l'export au format NDJSON (un objet JSON par ligne)."""
+    async for chunk in _export_rows(statement):
+        yield "".join(
+            json.dumps({
+                "id": row.id,
+                "choix": row.choix,
+                "video": row.video,
+                "machine": row.machine,
+                "event_time": row.event_time.isoformat()
+            }) + "\n"
+            for row in chunk
+        )
+
+
+async def _export_parquet(statement):
+    """Genere l'export au format Parquet (un row group par lot)."""
+    schema = pa.schema([
+        ("id", pa.int64()),
+        ("choix", pa.string()),
+        ("video", pa.dictionary(pa.int32(), pa.string())),
+        ("machine", pa.dictionary(pa.int32(), pa.string())),
+        ("event_time", pa.timestamp("us")),
+    ])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression="zstd")
+    async for chunk in _export_rows(statement):
+        columns = list(zip(*chunk))
+        writer.write_table(pa.Table.from_arrays(
+            [
+                pa.array(columns[0], pa.int64()),
+                pa.array(columns[1], pa.string()),
+                pa.array(columns[2], pa.string()).dictionary_encode(),
+                pa.array(columns[3], pa.string()).dictionary_encode(),
+                pa.array(columns[4], pa.timestamp("us")),
+            ],
+            schema=schema
+        ))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+@app.get("/choices/export", tags=["Choices"])
+async def export_choices(
+    format: str = Query("csv", pattern="^(csv|ndjson|parquet)$", description="csv, ndjson ou parquet"),
+    machine: Optional[str] = Query(None, description="Filtrer par machine"),
+    choix: Optional[str] = Query(None, description="Filtrer par bouton (A-G)"),
+    days: int = Query(7, ge=1, le=365, description="Nombre de jours")
+):
+    """
+    Exporte tous les choix filtres, sans limite de nombre.
 
-    # Total et pagination
-    total = query.count()
-    items = query.order_by(desc(UserChoice.event_time)).offset(offset).limit(limit).all()
+    Les lignes sont lues par lots avec un curseur cote serveur et envoyees
+    au fur et a mesure : la memoire utilisee ne depend pas de la taille
+    de l'export.
+    """
+    if format == "parquet" and not PARQUET_AVAILABLE:
+        raise HTTPException(status_code=501, detail="Export Parquet indisponible (pyarrow non installe)")
+
+    statement = _choices_query(machine, choix, days).order_by(UserChoice.event_time, UserChoice.id)
 
-    return ChoiceListResponse(total=total, items=items)
+    generators = {"csv": _export_csv, "ndjson": _export_ndjson, "parquet": _export_parquet}
+    filename = f"choices_{datetime.utcnow():%Y%m%d_%H%M%S}.{format}"
+
+    return StreamingResponse(
+        generators[format](statement),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
 
 
 @app.get("/choices/{choice_id}", response_model=ChoiceResponse, tags=["Choices"])
-def get_choice(choice_id: int, db: Session = Depends(get_db)):
+async def get_choice(choice_id: int, db: AsyncSession = Depends(get_async_db)):
     """Recupere un choix par son ID."""
-    choice = db.query(UserChoice).filter(UserChoice.id == choice_id).first()
+    choice = (await db.execute(_choice_select().where(UserChoice.id == choice_id))).first()
     if not choice:
         raise HTTPException(status_code=404, detail="Choix non trouve")
     return choice
 
 
 @app.delete("/choices/{choice_id}", status_code=204, tags=["Choices"])
-def delete_choice(choice_id: int, db: Session = Depends(get_db)):
+async def delete_choice(choice_id: int, db: AsyncSession = Depends(get_async_db)):
     """Supprime un choix par son ID."""
-    choice = db.query(UserChoice).filter(UserChoice.id == choice_id).first()
-    if not choice:
+    found = (await db.execute(
+        select(UserChoice, Machine.name)
+        .join(Machine, Machine.id == UserChoice.machine_id)
+        .where(UserChoice.id == choice_id)
+    )).first()
+    if not found:
         raise HTTPException(status_code=404, detail="Choix non trouve")
-    db.delete(choice)
-    db.commit()
+    choice, machine = found
+    await db.delete(choice)
+    await db.flush()
+    await db.run_sync(rollups.remove_choice, choice, machine)
+    await db.commit()
+    stats_cache.invalidate(machine)
+    live_hub.discard(machine, choice.choix, choice.event_time)
+    if analytics_store is not None:
+        analytics_store.invalidate([choice.event_time.date()])
 
 
 # ========== Machines Endpoints ==========
 
 @app.post("/machines", response_model=MachineResponse, status_code=201, tags=["Machines"])
-def create_machine(machine: MachineCreate, db: Session = Depends(get_db)):
-    """Enregistre une nouvelle machine."""
-    existing = db.query(Machine).filter(Machine.name == machine.name).first()
-    if existing:
+async def create_machine(machine: MachineCreate, db: AsyncSession = Depends(get_async_db)):
+    """Enregistre une nouvelle machine (ou reactive une machine supprimee)."""
+    db_machine = await db.scalar(select(Machine).where(Machine.name == machine.name))
+    if db_machine is not None and db_machine.deleted_at is None:
         raise HTTPException(status_code=409, detail="Machine deja enregistree")
 
-    db_machine = Machine(**machine.model_dump())
-    db.add(db_machine)
-    db.commit()
-    db.refresh(db_machine)
+    if db_machine is None:
+        db_machine = Machine(**machine.model_dump())
+        db.add(db_machine)
+    else:
+        for key, value in machine.model_dump().items():
+            setattr(db_machine, key, value)
+        db_machine.deleted_at = None
+    await db.commit()
+    await db.refresh(db_machine)
+    machine_registry.remember(db_machine)
+    stats_cache.invalidate()
 
     return db_machine
 
 
+def _active_machine(name: str):
+    """Requete d'une machine non supprimee, par son nom."""
+    return select(Machine).where(Machine.name == name, Machine.deleted_at.is_(None))
+
+
+def _machine_response(machine: Machine) -> MachineResponse:
+    """Machine avec sa derniere activite en memoire (pas encore ecrite en base)."""
+    response = MachineResponse.model_validate(machine)
+    last_seen = machine_registry.last_seen(machine.name)
+    if last_seen is not None and last_seen > response.last_seen:
+        response.last_seen = last_seen
+    return response
+
+
 @app.get("/machines", response_model=list[MachineResponse], tags=["Machines"])
-def list_machines(db: Session = Depends(get_db)):
+async def list_machines(db: AsyncSession = Depends(get_async_db)):
     """Liste toutes les machines enregistrees."""
-    return db.query(Machine).order_by(Machine.name).all()
+    machines = (await db.scalars(
+        select(Machine).where(Machine.deleted_at.is_(None)).order_by(Machine.name)
+    )).all()
+    return [_machine_response(machine) for machine in machines]
 
 
 @app.get("/machines/{machine_name}", response_model=MachineResponse, tags=["Machines"])
-def get_machine(machine_name: str, db: Session = Depends(get_db)):
+async def get_machine(machine_name: str, db: AsyncSession = Depends(get_async_db)):
     """Recupere une machine par son nom."""
-    machine = db.query(Machine).filter(Machine.name == machine_name).first()
+    machine = await db.scalar(_active_machine(machine_name))
     if not machine:
         raise HTTPException(status_code=404, detail="Machine non trouvee")
-    return machine
+    return _machine_response(machine)
 
 
 @app.put("/machines/{machine_name}", response_model=MachineResponse, tags=["Machines"])
-def update_machine(
+async def update_machine(
     machine_name: str,
     update: MachineUpdate,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Met a jour une machine."""
-    machine = db.query(Machine).filter(Machine.name == machine_name).first()
+    machine = await db.scalar(_active_machine(machine_name))
     if not machine:
         raise HTTPException(status_code=404, detail="Machine non trouvee")
 
     for key, value in update.model_dump(exclude_unset=True).items():
         setattr(machine, key, value)
 
-    db.commit()
-    db.refresh(machine)
-    return machine
+    await db.commit()
+    await db.refresh(machine)
+    return _machine_response(machine)
 
 
 @app.delete("/machines/{machine_name}", status_code=204, tags=["Machines"])
-def delete_machine(machine_name: str, db: Session = Depends(get_db)):
-    """Supprime une machine."""
-    machine = db.query(Machine).filter(Machine.name == machine_name).first()
+async def delete_machine(machine_name: str, db: AsyncSession = Depends(get_async_db)):
+    """
+    Supprime une machine.
+
+    Suppression logique (deleted_at) : la machine disparait des listes,
+    mais ses choix (references par machine_id) et ses statistiques sont
+    conserves. Elle est reactivee si elle envoie de nouveau des choix ou
+    si elle est enregistree a nouveau.
+    """
+    machine = await db.scalar(_active_machine(machine_name))
     if not machine:
         raise HTTPException(status_code=404, detail="Machine non trouvee")
-    db.delete(machine)
-    db.commit()
+    machine.deleted_at = datetime.utcnow()
+    await db.commit()
+    stats_cache.invalidate()
+    machine_registry.forget(machine_name)
+    fleet_latency.remove_machine(machine_name)
+
+
+@app.post("/machines/{machine_name}/heartbeat", status_code=204, tags=["Machines"])
+async def machine_heartbeat(
+    machine_name: str,
+    heartbeat: HeartbeatCreate,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Recoit le heartbeat d'une borne.
+
+    Le heartbeat contient les histogrammes de duree des etapes d'un appui
+    depuis le precedent (client/telemetry.py). last_seen est mis a jour en
+    memoire ; une machine inconnue est auto-enregistree, comme pour /choices.
+    """
+    if tuple(heartbeat.buckets) != heartbeats.BUCKETS_MS:
+        raise HTTPException(status_code=422, detail="Bornes d'histogramme differentes du serveur")
+    size = len(heartbeats.BUCKETS_MS) + 1
+    if any(len(stage.b) != size for stage in heartbeat.stages.values()):
+        raise HTTPException(status_code=422, detail=f"Histogramme attendu sur {size} cases")
+
+    now = datetime.utcnow()
+    machines = await machine_registry.resolve(db, [machine_name], now)
+    await db.commit()
+    machine_registry.touch(machines, now)
+
+    stages = {
+        name: (stage.b, stage.sum, stage.max)
+        for name, stage in heartbeat.stages.items()
+        if stage.n
+    }
+    http = heartbeat.http or {}
+    fleet_latency.record(
+        machine_name,
+        stages,
+        {
+            "mode": heartbeat.mode,
+            "pending": heartbeat.pending,
+            "connection_reuse": http.get("reuse_ratio")
+        },
+        now
+    )
+    for name, (counts, total, _) in stages.items():
+        metrics.KIOSK_STAGE_LATENCY.add(counts, total / 1000, machine=machine_name, stage=name)
 
 
 # ========== Statistics Endpoints ==========
 
 @app.get("/stats", response_model=StatsResponse, tags=["Statistics"])
-def get_stats(
+async def get_stats(
     machine: Optional[str] = Query(None, description="Filtrer par machine"),
     days: int = Query(7, ge=1, le=365, description="Periode en jours"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Recupere les statistiques d'utilisation.
@@ -223,122 +992,368 @@ def get_stats(
     - Repartition par bouton
     - Repartition par machine
     - Activite journaliere
+
+    Le filtre `machine` s'applique a toutes les repartitions.
     """
+    cache_key = ("stats", machine, days)
+    cached = stats_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    generation = stats_cache.generation(machine)
+
     cutoff = datetime.utcnow() - timedelta(days=days)
 
-    # Base query
-    base_query = db.query(UserChoice).filter(UserChoice.event_time >= cutoff)
-    if machine:
-        base_query = base_query.filter(UserChoice.machine == machine)
+    # Toutes les repartitions en une requete, sur les agregats
+    # horaires/journaliers
+    rows = (await db.execute(stats.breakdown(cutoff, machine))).all()
+    response = stats.assemble(rows)
 
-    # Total choices
-    total_choices = base_query.count()
+    stats_cache.set(cache_key, response, generation, scope=machine)
+    return response
 
-    # Total machines
-    total_machines = db.query(Machine).count()
 
-    # Choices by button
-    button_stats = (
-        base_query
-        .with_entities(UserChoice.choix, func.count(UserChoice.id))
-        .group_by(UserChoice.choix)
-        .order_by(desc(func.count(UserChoice.id)))
-        .all()
-    )
+def _day_runs(days) -> List[Tuple[date, date]]:
+    """
+    Regroupe des jours en plages contigues.
 
-    choices_by_button = [
-        ChoiceStatItem(
-            choix=row[0],
-            count=row[1],
-            percentage=round(row[1] / total_choices * 100, 1) if total_choices > 0 else 0
-        )
-        for row in button_stats
-    ]
+    Args:
+        days: Ensemble de jours.
 
-    # Choices by machine
-    machine_stats = (
-        db.query(UserChoice)
-        .filter(UserChoice.event_time >= cutoff)
-        .with_entities(
-            UserChoice.machine,
-            func.count(UserChoice.id),
-            func.max(UserChoice.event_time)
+    Returns:
+        Liste triee de (premier jour, dernier jour) inclus.
+    """
+    runs: List[Tuple[date, date]] = []
+    for day in sorted(days):
+        if runs and day - runs[-1][1] == timedelta(days=1):
+            runs[-1] = (runs[-1][0], day)
+        else:
+            runs.append((day, day))
+    return runs
+
+
+@app.get("/stats/history", response_model=StatsResponse, tags=["Statistics"])
+async def get_history_stats(
+    start: date = Query(..., description="Premier jour (AAAA-MM-JJ, UTC)"),
+    end: Optional[date] = Query(None, description="Dernier jour inclus (defaut : aujourd'hui)"),
+    machine: Optional[str] = Query(None, description="Filtrer par machine"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Statistiques d'une periode en jours calendaires, sur plusieurs annees.
+
+    Meme format que /stats. Les jours clos sont lus dans les segments
+    colonnes en memoire (ANALYTICS_DIR) ; les autres jours (jour courant,
+    jours pas encore exportes) dans les agregats journaliers.
+    """
+    end = end or datetime.utcnow().date()
+    if end < start:
+        raise HTTPException(status_code=422, detail="end doit etre posterieur a start")
+    if (end - start).days > 3660:
+        raise HTTPException(status_code=422, detail="Periode limitee a 10 ans")
+
+    if analytics_store is not None:
+        totals, missing = analytics_store.totals(start, end, machine)
+    else:
+        totals = ({}, {}, {})
+        missing = {start + timedelta(days=offset) for offset in range((end - start).days + 1)}
+
+    if missing:
+        # Jours entiers : les agregats journaliers suffisent (cle primaire)
+        statement = (
+            select(
+                ChoiceRollupDaily.bucket, ChoiceRollupDaily.machine, ChoiceRollupDaily.choix,
+                ChoiceRollupDaily.count, ChoiceRollupDaily.last_event
+            )
+            .where(or_(*(
+                ChoiceRollupDaily.bucket.between(datetime.combine(first, time()), datetime.combine(last, time()))
+                for first, last in _day_runs(missing)
+            )))
         )
-        .group_by(UserChoice.machine)
-        .order_by(desc(func.count(UserChoice.id)))
-        .all()
+        if machine:
+            statement = statement.where(ChoiceRollupDaily.machine == machine)
+        rows = (await db.execute(statement)).all()
+        totals = analytics.merge(totals, [(bucket.date(), *rest) for bucket, *rest in rows])
+
+    return stats.from_totals(*totals, total_machines=len(machine_registry))
+
+
+def _days_start(days: int) -> datetime:
+    """Debut des `days` derniers jours calendaires (jour courant inclus)."""
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    return today - timedelta(days=days - 1)
+
+
+@app.get("/stats/videos", response_model=VideoStatsResponse, tags=["Statistics"])
+async def get_video_stats(
+    days: int = Query(7, ge=1, le=365, description="Periode en jours (jour courant inclus)"),
+    machine: Optional[str] = Query(None, description="Filtrer par machine"),
+    choix: Optional[str] = Query(None, pattern="^[A-G]$", description="Filtrer par bouton"),
+    limit: int = Query(10, ge=1, le=100, description="Nombre de videos"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Videos les plus jouees sur les derniers jours.
+
+    Lu dans l'agregat journalier par video : le temps de reponse depend de
+    la periode et non de l'historique.
+    """
+    cache_key = ("videos", machine, choix, days, limit)
+    cached = stats_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    generation = stats_cache.generation(machine)
+
+    rows = (await db.execute(stats.top_videos(_days_start(days), machine, choix, limit))).all()
+    total = rows[0].total if rows else 0
+    response = VideoStatsResponse(
+        days=days,
+        total_plays=total,
+        videos=[
+            VideoStatItem(
+                video=row.path,
+                choix=row.choix,
+                plays=row.plays,
+                percentage=round(row.plays / total * 100, 1) if total > 0 else 0,
+                last_played=row.last_played
+            )
+            for row in rows
+        ]
     )
 
-    choices_by_machine = [
-        MachineStatItem(
-            machine=row[0],
-            total_choices=row[1],
-            last_activity=row[2]
-        )
-        for row in machine_stats
-    ]
+    stats_cache.set(cache_key, response, generation, scope=machine)
+    return response
 
-    # Daily activity
-    daily_stats = (
-        base_query
-        .with_entities(
-            func.date(UserChoice.event_time).label("date"),
-            func.count(UserChoice.id)
-        )
-        .group_by(func.date(UserChoice.event_time))
-        .order_by(func.date(UserChoice.event_time))
-        .all()
+
+@app.get("/stats/videos/timeline", response_model=VideoTimelineResponse, tags=["Statistics"])
+async def get_video_timeline(
+    video: str = Query(..., description="Chemin de la video"),
+    days: int = Query(30, ge=1, le=365, description="Periode en jours (jour courant inclus)"),
+    machine: Optional[str] = Query(None, description="Filtrer par machine"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Lectures d'une video par jour sur les derniers jours."""
+    cache_key = ("video_timeline", video, machine, days)
+    cached = stats_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    generation = stats_cache.generation(machine)
+
+    video_id = video_ids.get(video)
+    if video_id is None:
+        video_id = await db.scalar(select(Video.id).where(Video.path == video))
+        if video_id is None:
+            raise HTTPException(status_code=404, detail="Video non trouvee")
+        video_ids.remember({video: video_id})
+
+    rows = (await db.execute(stats.video_timeline(video_id, _days_start(days), machine))).all()
+    response = VideoTimelineResponse(
+        video=video,
+        days=days,
+        total_plays=sum(row.count for row in rows),
+        daily=[DailyStatItem(date=str(row.day), count=row.count) for row in rows]
     )
 
-    daily_activity = [
-        DailyStatItem(date=str(row[0]), count=row[1])
-        for row in daily_stats
-    ]
+    stats_cache.set(cache_key, response, generation, scope=machine)
+    return response
+
+
+@app.get("/stats/heatmap", response_model=HeatmapResponse, tags=["Statistics"])
+async def get_heatmap(
+    machine: Optional[str] = Query(None, description="Filtrer par machine"),
+    choix: Optional[str] = Query(None, pattern="^[A-G]$", description="Filtrer par bouton"),
+    days: Optional[int] = Query(None, ge=1, le=365, description="Derniers jours (defaut : tout l'historique)"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Activite par jour de la semaine et heure locale (STATS_TIMEZONE).
 
-    return StatsResponse(
-        total_choices=total_choices,
-        total_machines=total_machines,
-        choices_by_button=choices_by_button,
-        choices_by_machine=choices_by_machine,
-        daily_activity=daily_activity
+    Sans `days`, servie par le cube jour x heure maintenu a l'ingestion ;
+    avec `days`, calculee sur les agregats horaires de la periode.
+    """
+    cache_key = ("heatmap", machine, choix, days)
+    cached = stats_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    generation = stats_cache.generation(machine)
+
+    # Jours calendaires du fuseau des cases, pas de UTC
+    since = rollups.local_days_start(days) if days else None
+    counts = stats.heatmap_matrix((await db.execute(stats.heatmap(machine, choix, since))).all())
+    response = HeatmapResponse(
+        timezone=rollups.STATS_TIMEZONE,
+        days=days,
+        total_choices=sum(map(sum, counts)),
+        counts=counts,
+        by_weekday=[sum(day) for day in counts],
+        by_hour=[sum(day[hour] for day in counts) for hour in range(24)]
     )
 
+    stats_cache.set(cache_key, response, generation, scope=machine)
+    return response
+
 
 @app.get("/stats/live", tags=["Statistics"])
-def get_live_stats(db: Session = Depends(get_db)):
+async def get_live_stats():
     """
     Statistiques en temps reel (derniere heure).
 
-    Utile pour un dashboard live.
+    Utile pour un dashboard live. Servi depuis la memoire, sans requete en
+    base ; preferer /stats/live/stream pour recevoir les choix en direct.
     """
-    one_hour_ago = datetime.utcnow() - timedelta(hours=1)
+    return live_hub.snapshot()
 
-    recent_choices = (
-        db.query(UserChoice)
-        .filter(UserChoice.event_time >= one_hour_ago)
-        .order_by(desc(UserChoice.event_time))
-        .limit(20)
-        .all()
-    )
 
-    active_machines = (
-        db.query(Machine)
-        .filter(Machine.last_seen >= one_hour_ago)
-        .all()
+def _sse(event: str, data: dict) -> str:
+    """Formate un message Server-Sent Events."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.get("/stats/live/stream", tags=["Statistics"])
+async def stream_live_stats(request: Request):
+    """
+    Flux Server-Sent Events des choix en direct.
+
+    Envoie un evenement `snapshot` (meme contenu que /stats/live) a la
+    connexion, puis un evenement `choice` par nouveau choix avec le compteur
+    choices_last_hour a jour. Un client trop lent recoit un nouveau
+    `snapshot` au lieu des choix manques.
+    """
+    async def events():
+        queue = live_hub.subscribe()
+        try:
+            yield _sse("snapshot", live_hub.snapshot())
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), LIVE_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keepalive\n\n"
+                    continue
+
+                if event is None:
+                    yield _sse("snapshot", live_hub.snapshot())
+                else:
+                    yield _sse("choice", {**event, "time": event["time"].isoformat()})
+        finally:
+            live_hub.unsubscribe(queue)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        # Desactive la mise en tampon de nginx pour ce flux
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
     )
 
-    return {
-        "recent_choices": [
-            {
-                "choix": c.choix,
-                "machine": c.machine,
-                "time": c.event_time.isoformat()
-            }
-            for c in recent_choices
+
+def _realtime_minutes(minutes: int, today: bool) -> int:
+    """Taille de la fenetre demandee (depuis minuit UTC si today)."""
+    if today:
+        now = datetime.utcnow()
+        return now.hour * 60 + now.minute + 1
+    return minutes
+
+
+@app.get("/stats/realtime", response_model=RealtimeStatsResponse, tags=["Statistics"])
+async def get_realtime_stats(
+    minutes: int = Query(60, ge=1, le=REALTIME_WINDOW),
+    today: bool = Query(False, description="Depuis minuit UTC (ignore minutes)"),
+    machine: Optional[str] = None,
+    top: Optional[int] = Query(None, ge=1, le=7, description="Nombre de boutons retournes")
+):
+    """
+    Statistiques des dernieres minutes (jusqu'a 24 h), sans requete en base.
+
+    Retourne les boutons les plus presses et l'activite de chaque borne,
+    a la minute pres.
+    """
+    minutes = _realtime_minutes(minutes, today)
+    totals = realtime_window.totals(minutes, machine)
+    total = sum(totals.values())
+
+    by_button: Dict[str, int] = {}
+    by_machine: Dict[str, int] = {}
+    for (name, choix), count in totals.items():
+        by_button[choix] = by_button.get(choix, 0) + count
+        by_machine[name] = by_machine.get(name, 0) + count
+    buttons = sorted(by_button.items(), key=lambda item: (-item[1], item[0]))
+    last_activity = realtime_window.last_activity(minutes)
+
+    return RealtimeStatsResponse(
+        minutes=minutes,
+        total_choices=total,
+        choices_by_button=[
+            ChoiceStatItem(choix=choix, count=count, percentage=round(count / total * 100, 1))
+            for choix, count in buttons[:top]
         ],
-        "active_machines": [m.name for m in active_machines],
-        "choices_last_hour": len(recent_choices)
-    }
+        choices_by_machine=[
+            MachineStatItem(machine=name, total_choices=count, last_activity=last_activity.get(name))
+            for name, count in sorted(by_machine.items(), key=lambda item: (-item[1], item[0]))
+        ]
+    )
+
+
+@app.get("/stats/realtime/rate", response_model=RealtimeRateResponse, tags=["Statistics"])
+async def get_realtime_rate(
+    minutes: int = Query(60, ge=1, le=REALTIME_WINDOW),
+    today: bool = Query(False, description="Depuis minuit UTC (ignore minutes)"),
+    machine: Optional[str] = None,
+    choix: Optional[str] = Query(None, pattern="^[A-Ga-g]$")
+):
+    """Nombre de choix minute par minute, sans requete en base."""
+    minutes = _realtime_minutes(minutes, today)
+    series = realtime_window.series(minutes, machine, choix.upper() if choix else None)
+    total = sum(count for _, count in series)
+
+    return RealtimeRateResponse(
+        minutes=minutes,
+        total_choices=total,
+        per_minute_avg=round(total / minutes, 2),
+        per_minute=[RateItem(minute=start, count=count) for start, count in series]
+    )
+
+
+@app.get("/stats/latency", response_model=LatencyResponse, tags=["Statistics"])
+async def get_latency_stats(
+    stage: str = Query("button_to_play", description="Etape mesuree par les bornes"),
+    minutes: int = Query(60, ge=1, le=1440)
+):
+    """
+    Reactivite des bornes sur une etape, d'apres leurs heartbeats.
+
+    Les bornes sont triees par p95 decroissant : les plus lentes en
+    premier. Les quantiles sont estimes a partir des histogrammes.
+    """
+    fleet, machines = fleet_latency.summary(stage, minutes)
+
+    def item(histogram, machine: Optional[str] = None) -> LatencyItem:
+        counts, total, maximum = histogram or ([0] * (len(heartbeats.BUCKETS_MS) + 1), 0.0, 0.0)
+        count = sum(counts)
+        status = fleet_latency.status(machine) if machine else {}
+        return LatencyItem(
+            machine=machine,
+            count=count,
+            mean_ms=round(total / count, 1) if count else 0.0,
+            p50_ms=round(heartbeats.quantile(counts, 0.50, maximum), 1),
+            p95_ms=round(heartbeats.quantile(counts, 0.95, maximum), 1),
+            p99_ms=round(heartbeats.quantile(counts, 0.99, maximum), 1),
+            max_ms=round(maximum, 1),
+            **status
+        )
+
+    items = [item(histogram, machine) for machine, histogram in machines.items()]
+    return LatencyResponse(
+        stage=stage,
+        minutes=minutes,
+        fleet=item(fleet),
+        machines=sorted(items, key=lambda i: (-i.p95_ms, i.machine))
+    )
+
+
+@app.get("/stats/cache", response_model=CacheStatsResponse, tags=["Statistics"])
+async def get_cache_stats():
+    """Compteurs du cache des statistiques (hits, misses, evictions...)."""
+    return stats_cache.stats()
 
 
 if __name__ == "__main__":
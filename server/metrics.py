@@ -0,0 +1,372 @@
+"""
+Metriques de l'API au format texte Prometheus (/metrics).
+
+- Requetes HTTP : nombre, latence (histogramme) par route, requetes en
+  cours.
+- Base de donnees : nombre et duree des requetes SQL par type d'ordre et
+  par route HTTP (evenements SQLAlchemy), occupation des pools.
+- Ingestion : choix recus par machine, file d'ecriture differee.
+- Bornes : duree des etapes d'un appui, recue par heartbeat.
+
+Les metriques sont tenues en memoire par processus, sans dependance
+externe : chaque worker uvicorn expose les siennes.
+"""
+
+import re
+import threading
+import time
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from fastapi import Request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from heartbeats import BUCKETS_MS as KIOSK_BUCKETS_MS
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Bornes des histogrammes de duree (secondes)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Bornes de l'histogramme du nombre de requetes SQL par requete HTTP
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+# Bornes de l'histogramme du nombre de choix par ecriture differee
+FLUSH_SIZE_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    """Echappe une valeur de label."""
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format(value: float) -> str:
+    """Formate une valeur (entiers sans decimale, infini)."""
+    if value == float("inf"):
+        return "+Inf"
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+class Metric:
+    """Metrique a labels (base des compteurs, jauges et histogrammes)."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labels: Sequence[str] = ()):
+        """
+        Initialise une metrique sans valeur.
+
+        Args:
+            name: Nom Prometheus.
+            help_text: Description (ligne HELP).
+            labels: Noms des labels.
+        """
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._values: Dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> LabelValues:
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def _labels(self, key: LabelValues, extra: Optional[Tuple[str, str]] = None) -> str:
+        pairs = list(zip(self.labels, key)) + ([extra] if extra else [])
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+    def samples(self) -> Iterable[str]:
+        """Lignes d'echantillons."""
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{self._labels(key)} {_format(value)}"
+
+    def render(self) -> List[str]:
+        """Bloc texte de la metrique (HELP, TYPE, echantillons)."""
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}", *self.samples()]
+
+
+class Counter(Metric):
+    """Compteur croissant."""
+
+    kind = "counter"
+
+    def inc(self, value: float = 1, **labels) -> None:
+        """Incremente le compteur."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+
+class Gauge(Metric):
+    """Valeur instantanee."""
+
+    kind = "gauge"
+
+    def inc(self, value: float = 1, **labels) -> None:
+        """Augmente la valeur."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def dec(self, value: float = 1, **labels) -> None:
+        """Diminue la valeur."""
+        self.inc(-value, **labels)
+
+    def set(self, value: float, **labels) -> None:
+        """Fixe la valeur."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def replace(self, values: Dict[LabelValues, float]) -> None:
+        """Remplace toutes les valeurs (les labels absents disparaissent)."""
+        with self._lock:
+            self._values = dict(values)
+
+
+class Histogram(Metric):
+    """Distribution par bornes cumulatives (_bucket, _sum, _count)."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ):
+        """
+        Initialise un histogramme vide.
+
+        Args:
+            name: Nom Prometheus.
+            help_text: Description (ligne HELP).
+            labels: Noms des labels.
+            buckets: Bornes superieures, croissantes (+Inf ajoute).
+        """
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets) + (float("inf"),)
+        self._series: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        """Ajoute une observation."""
+        key = self._key(labels)
+        with self._lock:
+            # Comptes par borne (non cumules), puis somme et nombre
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+
+    def add(self, counts: Sequence[int], total: float, **labels) -> None:
+        """
+        Ajoute un histogramme deja reparti sur les memes bornes.
+
+        Args:
+            counts: Comptes par borne (non cumules), +Inf inclus.
+            total: Somme des valeurs.
+        """
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            for index, count in enumerate(counts):
+                series[index] += count
+            series[-2] += total
+            series[-1] += sum(counts)
+
+    def samples(self) -> Iterable[str]:
+        """Lignes _bucket (cumulees), _sum et _count."""
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._series.items())
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                yield f"{self.name}_bucket{self._labels(key, ('le', _format(bound)))} {cumulative}"
+            yield f"{self.name}_sum{self._labels(key)} {_format(series[-2])}"
+            yield f"{self.name}_count{self._labels(key)} {_format(series[-1])}"
+
+
+# ========== Metriques de l'API ==========
+
+HTTP_REQUESTS = Counter(
+    "http_requests_total", "Requetes HTTP traitees.", ("method", "route", "status")
+)
+HTTP_LATENCY = Histogram(
+    "http_request_duration_seconds", "Duree des requetes HTTP (jusqu'aux en-tetes).", ("method", "route")
+)
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "Requetes HTTP en cours.")
+HTTP_IN_FLIGHT.set(0)
+REQUEST_DB_QUERIES = Histogram(
+    "http_request_db_queries", "Requetes SQL par requete HTTP.", ("route",), QUERY_COUNT_BUCKETS
+)
+REQUEST_DB_SECONDS = Histogram(
+    "http_request_db_seconds", "Temps passe en base par requete HTTP.", ("route",)
+)
+DB_QUERIES = Counter("db_queries_total", "Requetes SQL executees.", ("route", "statement"))
+DB_QUERY_SECONDS = Counter(
+    "db_query_seconds_total", "Temps cumule des requetes SQL.", ("route", "statement")
+)
+DB_QUERY_LATENCY = Histogram("db_query_duration_seconds", "Duree des requetes SQL.", ("statement",))
+DB_POOL = Gauge(
+    "db_pool_connections", "Connexions des pools SQLAlchemy par etat.", ("engine", "state")
+)
+CHOICES_INGESTED = Counter("choices_ingested_total", "Choix enregistres, par machine.", ("machine",))
+CHOICES_DUPLICATE = Counter(
+    "choices_duplicate_total", "Choix renvoyes deja enregistres (event_id), par machine.", ("machine",)
+)
+KIOSK_STAGE_LATENCY = Histogram(
+    "kiosk_stage_duration_seconds", "Duree des etapes des bornes (heartbeats).",
+    ("machine", "stage"), tuple(bound / 1000 for bound in KIOSK_BUCKETS_MS)
+)
+INGEST_RATE = Gauge(
+    "choices_ingest_rate_per_minute", "Choix par minute sur les 5 dernieres minutes, par machine.", ("machine",)
+)
+INGEST_QUEUE = Gauge("ingest_queue_pending", "Choix en attente d'ecriture differee.")
+INGEST_FLUSH_SIZE = Histogram(
+    "ingest_flush_size", "Choix ecrits par lot (ecriture differee).", (), FLUSH_SIZE_BUCKETS
+)
+INGEST_REJECTED = Counter("ingest_rejected_total", "Choix refuses, file d'ecriture pleine.")
+INGEST_QUARANTINED = Counter(
+    "ingest_quarantined_total", "Choix acquittes refuses par la base (rejected.jsonl)."
+)
+
+REGISTRY: List[Metric] = [
+    HTTP_REQUESTS, HTTP_LATENCY, HTTP_IN_FLIGHT,
+    REQUEST_DB_QUERIES, REQUEST_DB_SECONDS,
+    DB_QUERIES, DB_QUERY_SECONDS, DB_QUERY_LATENCY, DB_POOL,
+    CHOICES_INGESTED, CHOICES_DUPLICATE, INGEST_RATE, KIOSK_STAGE_LATENCY,
+    INGEST_QUEUE, INGEST_FLUSH_SIZE, INGEST_REJECTED, INGEST_QUARANTINED,
+]
+
+# Route hors requete HTTP (demarrage, taches de fond, scripts)
+BACKGROUND = "background"
+# Route des requetes qui ne correspondent a aucun endpoint
+UNMATCHED = "unmatched"
+
+
+def route_of(scope: dict) -> str:
+    """Modele de chemin de la route d'une requete (connu apres le routage)."""
+    return getattr(scope.get("route"), "path", UNMATCHED)
+
+
+class RequestTimer:
+    """Requetes SQL d'une requete HTTP (partage par contextvar)."""
+
+    __slots__ = ("scope", "queries", "seconds")
+
+    def __init__(self, scope: dict):
+        self.scope = scope
+        self.queries = 0
+        self.seconds = 0.0
+
+
+_current: ContextVar[Optional[RequestTimer]] = ContextVar("metrics_request", default=None)
+
+_STATEMENT = re.compile(r"\s*(\w+)")
+
+
+def _statement_type(statement: str) -> str:
+    """Premier mot d'un ordre SQL (SELECT, INSERT...)."""
+    match = _STATEMENT.match(statement)
+    return match.group(1).upper() if match else "OTHER"
+
+
+def instrument_engine(engine: Engine) -> None:
+    """
+    Mesure les requetes SQL d'un moteur (synchrone, ou async_engine.sync_engine).
+
+    Args:
+        engine: Moteur SQLAlchemy synchrone.
+    """
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["metrics_start"].pop()
+        statement_type = _statement_type(statement)
+        timer = _current.get()
+        route = route_of(timer.scope) if timer is not None else BACKGROUND
+        if timer is not None:
+            timer.queries += 1
+            timer.seconds += elapsed
+        DB_QUERIES.inc(route=route, statement=statement_type)
+        DB_QUERY_SECONDS.inc(elapsed, route=route, statement=statement_type)
+        DB_QUERY_LATENCY.observe(elapsed, statement=statement_type)
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        # La requete en echec n'atteint pas after_cursor_execute
+        starts = context.connection.info.get("metrics_start") if context.connection else None
+        if starts:
+            starts.pop()
+
+
+async def http_middleware(request: Request, call_next: Callable):
+    """
+    Middleware HTTP : latence, requetes en cours et requetes SQL par route.
+
+    La route est le modele de chemin (/choices/{choice_id}) pour limiter le
+    nombre de series. Les requetes SQL d'un flux (export, SSE) executees
+    apres l'envoi des en-tetes sont comptees dans db_queries_total, pas dans
+    http_request_db_*.
+    """
+    # Le routeur complete le scope partage : la route est connue des
+    # requetes SQL de l'endpoint
+    timer = RequestTimer(request.scope)
+    token = _current.set(timer)
+    HTTP_IN_FLIGHT.inc()
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        elapsed = time.perf_counter() - start
+        HTTP_IN_FLIGHT.dec()
+        route = route_of(request.scope)
+        HTTP_REQUESTS.inc(method=request.method, route=route, status=status)
+        HTTP_LATENCY.observe(elapsed, method=request.method, route=route)
+        REQUEST_DB_QUERIES.observe(timer.queries, route=route)
+        REQUEST_DB_SECONDS.observe(timer.seconds, route=route)
+        _current.reset(token)
+
+
+def observe_pool(name: str, pool) -> None:
+    """
+    Met a jour l'occupation d'un pool de connexions.
+
+    Args:
+        name: Nom du moteur (label engine).
+        pool: Pool SQLAlchemy (QueuePool ou AsyncAdaptedQueuePool).
+    """
+    if not hasattr(pool, "checkedout"):
+        return
+    DB_POOL.set(pool.size(), engine=name, state="size")
+    DB_POOL.set(pool.checkedout(), engine=name, state="checked_out")
+    DB_POOL.set(pool.checkedin(), engine=name, state="idle")
+    # overflow() est negatif tant que le pool n'est pas plein
+    DB_POOL.set(max(0, pool.overflow()), engine=name, state="overflow")
+
+
+def render() -> str:
+    """Toutes les metriques au format texte Prometheus."""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
@@ -3,7 +3,7 @@ Modeles SQLAlchemy pour la base de donnees.
 """
 
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, DateTime, Text
+from sqlalchemy import Column, ForeignKey, Integer, SmallInteger, String, DateTime, Text, Index, Uuid
 from sqlalchemy.ext.declarative import declarative_base
 
 Base = declarative_base()
@@ -13,15 +13,41 @@ class UserChoice(Base):
     """Enregistrement d'un choix utilisateur sur une borne."""
 
     __tablename__ = "user_choices"
+    __table_args__ = (
+        # Toutes les requetes filtrent sur event_time, seul ou avec machine /
+        # choix, et trient par (event_time, id). Les colonnes incluses
+        # permettent les agregats (rollups, compteurs) en parcours d'index seul.
+        Index(
+            "idx_user_choices_event_time_id", "event_time", "id",
+            postgresql_include=["machine_id", "choix"]
+        ),
+        Index(
+            "idx_user_choices_machine_event_time", "machine_id", "event_time", "id",
+            postgresql_include=["choix"]
+        ),
+        Index(
+            "idx_user_choices_choix_event_time", "choix", "event_time", "id",
+            postgresql_include=["machine_id"]
+        ),
+        # Deduplication des renvois des bornes (ON CONFLICT DO NOTHING). Un
+        # index unique d'une table partitionnee contient la cle de partition.
+        Index("uq_user_choices_event_id", "event_id", "event_time", unique=True),
+        # Partitions mensuelles creees par partitions.py
+        {"postgresql_partition_by": "RANGE (event_time)"},
+    )
 
-    id = Column(Integer, primary_key=True, index=True)
-    choix = Column(String(1), nullable=False, index=True)
-    video = Column(Text, nullable=False)
-    event_time = Column(DateTime, default=datetime.utcnow, index=True)
-    machine = Column(Text, nullable=False, index=True)
+    # La cle de partitionnement doit faire partie de la cle primaire
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    choix = Column(String(1), nullable=False)
+    # Machine et video sont stockees par identifiant (voir names.py)
+    video_id = Column(Integer, ForeignKey("videos.id"), nullable=False)
+    event_time = Column(DateTime, primary_key=True, default=datetime.utcnow)
+    machine_id = Column(Integer, ForeignKey("machines.id"), nullable=False)
+    # Identifiant genere par la borne a la mise en file (NULL avant la migration 016)
+    event_id = Column(Uuid(as_uuid=False), nullable=True)
 
     def __repr__(self):
-        return f"<UserChoice(id={self.id}, choix={self.choix}, machine={self.machine})>"
+        return f"<UserChoice(id={self.id}, choix={self.choix}, machine_id={self.machine_id})>"
 
 
 class Machine(Base):
@@ -29,12 +55,116 @@ class Machine(Base):
 
     __tablename__ = "machines"
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True)
     name = Column(String(100), unique=True, nullable=False, index=True)
     description = Column(Text, nullable=True)
     location = Column(Text, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     last_seen = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Suppression logique : les choix de la machine restent dans l'historique
+    deleted_at = Column(DateTime, nullable=True)
 
     def __repr__(self):
         return f"<Machine(id={self.id}, name={self.name})>"
+
+
+class Video(Base):
+    """Chemin d'une video jouee par les bornes."""
+
+    __tablename__ = "videos"
+
+    id = Column(Integer, primary_key=True)
+    path = Column(Text, unique=True, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<Video(id={self.id}, path={self.path})>"
+
+
+class ChoiceRollupHourly(Base):
+    """Nombre de choix par heure, machine et bouton (agregat incremental)."""
+
+    __tablename__ = "choice_rollups_hourly"
+
+    bucket = Column(DateTime, primary_key=True)
+    machine = Column(Text, primary_key=True)
+    choix = Column(String(1), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    last_event = Column(DateTime, nullable=False)
+
+    def __repr__(self):
+        return f"<ChoiceRollupHourly(bucket={self.bucket}, machine={self.machine}, choix={self.choix})>"
+
+
+class ChoiceRollupDaily(Base):
+    """Nombre de choix par jour, machine et bouton (agregat incremental)."""
+
+    __tablename__ = "choice_rollups_daily"
+
+    bucket = Column(DateTime, primary_key=True)
+    machine = Column(Text, primary_key=True)
+    choix = Column(String(1), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    last_event = Column(DateTime, nullable=False)
+
+    def __repr__(self):
+        return f"<ChoiceRollupDaily(bucket={self.bucket}, machine={self.machine}, choix={self.choix})>"
+
+
+
+class VideoRollupDaily(Base):
+    """Nombre de lectures par jour, bouton et video, toutes machines (agregat incremental)."""
+
+    __tablename__ = "video_rollups_daily"
+    __table_args__ = (
+        # Evolution d'une video dans le temps (/stats/videos/timeline)
+        Index("ix_video_rollups_daily_video_bucket", "video_id", "bucket"),
+    )
+
+    bucket = Column(DateTime, primary_key=True)
+    choix = Column(String(1), primary_key=True)
+    video_id = Column(Integer, ForeignKey("videos.id"), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    last_event = Column(DateTime, nullable=False)
+
+    def __repr__(self):
+        return f"<VideoRollupDaily(bucket={self.bucket}, choix={self.choix}, video_id={self.video_id})>"
+
+
+class VideoMachineRollupDaily(Base):
+    """Nombre de lectures par machine, jour, bouton et video (agregat incremental)."""
+
+    __tablename__ = "video_machine_rollups_daily"
+
+    # Machine en tete : les requetes par machine lisent une plage contigue
+    machine = Column(Text, primary_key=True)
+    bucket = Column(DateTime, primary_key=True)
+    choix = Column(String(1), primary_key=True)
+    video_id = Column(Integer, ForeignKey("videos.id"), primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    last_event = Column(DateTime, nullable=False)
+
+    def __repr__(self):
+        return (
+            f"<VideoMachineRollupDaily(machine={self.machine}, bucket={self.bucket}, "
+            f"choix={self.choix}, video_id={self.video_id})>"
+        )
+
+
+class ChoiceHeatmap(Base):
+    """Nombre de choix par machine, bouton, jour de la semaine et heure locale (cube)."""
+
+    __tablename__ = "choice_heatmap"
+
+    machine = Column(Text, primary_key=True)
+    choix = Column(String(1), primary_key=True)
+    # 0 = lundi ... 6 = dimanche, heure 0-23 (fuseau STATS_TIMEZONE)
+    weekday = Column(SmallInteger, primary_key=True)
+    hour = Column(SmallInteger, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return (
+            f"<ChoiceHeatmap(machine={self.machine}, choix={self.choix}, "
+            f"weekday={self.weekday}, hour={self.hour})>"
+        )
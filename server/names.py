@@ -0,0 +1,73 @@
+"""
+Cache des identifiants des tables de dictionnaire (videos).
+
+user_choices ne stocke que machine_id et video_id. A l'ingestion, les
+chemins de video recus sont convertis en identifiants via ce cache ; seuls
+les chemins jamais vus font une requete (upsert) en base. Les machines sont
+resolues par le registre des machines (registry.py).
+"""
+
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+class NameCache:
+    """Correspondance nom -> id d'une table a nom unique."""
+
+    def __init__(self, model, column: str):
+        """
+        Initialise un cache vide.
+
+        Args:
+            model: Modele SQLAlchemy (Machine, Video).
+            column: Colonne unique contenant le nom.
+        """
+        self.model = model
+        self.column = getattr(model, column)
+        self._ids: Dict[str, int] = {}
+
+    def get(self, name: str) -> Optional[int]:
+        """Identifiant en cache, ou None."""
+        return self._ids.get(name)
+
+    def remember(self, ids: Dict[str, int]) -> None:
+        """
+        Enregistre des identifiants, une fois leur transaction validee.
+
+        Args:
+            ids: Dictionnaire nom -> id (ex. retourne par resolve()).
+        """
+        self._ids.update(ids)
+
+    def forget(self, name: str) -> None:
+        """Oublie un nom (ligne supprimee)."""
+        self._ids.pop(name, None)
+
+    async def resolve(self, db: AsyncSession, names: Iterable[str]) -> Dict[str, int]:
+        """
+        Identifiants de plusieurs noms, crees si besoin.
+
+        Les noms crees ne sont pas mis en cache : appeler remember() apres
+        le commit, sinon un rollback laisserait des ids inexistants en cache.
+
+        Args:
+            db: Session de base de donnees (transaction de l'ingestion).
+            names: Noms a convertir.
+
+        Returns:
+            Dictionnaire nom -> id.
+        """
+        names = set(names)
+        ids = {name: self._ids[name] for name in names if name in self._ids}
+        missing = sorted(names - ids.keys())
+        if missing:
+            # L'upsert retourne l'id des lignes existantes comme des nouvelles
+            stmt = pg_insert(self.model).values([{self.column.key: name} for name in missing])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[self.column],
+                set_={self.column.key: stmt.excluded[self.column.key]}
+            ).returning(self.column, self.model.id)
+            ids.update((await db.execute(stmt)).tuples().all())
+        return ids
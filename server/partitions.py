@@ -0,0 +1,377 @@
+"""
+Partitionnement mensuel de user_choices.
+
+La table user_choices est partitionnee par mois sur event_time. Ce module
+cree les partitions a l'avance, applique la politique de retention
+(archivage des vieux mois en CSV compresse) et convertit une table
+existante non partitionnee.
+
+Les requetes bornees par `days` (event_time >= cutoff) ne lisent que les
+partitions concernees. Les agregats (rollups.py) ne sont pas touches par
+la retention : /stats continue de compter les mois archives.
+
+Usage:
+    python partitions.py            # creation des partitions + retention
+    python partitions.py list       # liste des partitions
+    python partitions.py migrate    # conversion d'une table existante
+"""
+
+import gzip
+import logging
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from models import Machine, UserChoice, Video
+
+logger = logging.getLogger(__name__)
+
+TABLE = UserChoice.__tablename__
+DEFAULT_PARTITION = f"{TABLE}_default"
+COLUMNS = "id, choix, video_id, event_time, machine_id, event_id"
+
+# Nombre de mois crees a l'avance
+PARTITION_PREMAKE = int(os.getenv("PARTITION_PREMAKE", "3"))
+# Nombre de mois conserves en base (0 = pas de retention)
+PARTITION_RETENTION_MONTHS = int(os.getenv("PARTITION_RETENTION_MONTHS", "0"))
+# Dossier des archives (vide = partitions detachees mais conservees en base)
+PARTITION_ARCHIVE_DIR = os.getenv("PARTITION_ARCHIVE_DIR", "")
+
+
+def month_start(moment: datetime) -> datetime:
+    """Debut du mois d'un horodatage."""
+    return moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(month: datetime, count: int) -> datetime:
+    """Decale un debut de mois de `count` mois."""
+    index = month.year * 12 + month.month - 1 + count
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+
+def partition_name(month: datetime) -> str:
+    """Nom de la partition d'un mois (user_choices_pAAAA_MM)."""
+    return f"{TABLE}_p{month:%Y_%m}"
+
+
+def is_partitioned(db: Session) -> bool:
+    """Indique si user_choices est une table partitionnee."""
+    return db.execute(text(
+        "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:table)"
+    ), {"table": TABLE}).first() is not None
+
+
+def list_partitions(db: Session) -> List[Tuple[str, Optional[datetime]]]:
+    """
+    Liste les partitions attachees.
+
+    Returns:
+        (nom, debut du mois), dans l'ordre chronologique. Le mois vaut None
+        pour la partition par defaut.
+    """
+    names = db.execute(text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass(:table)"
+    ), {"table": TABLE}).scalars().all()
+
+    partitions = []
+    for name in names:
+        try:
+            month = datetime.strptime(name[len(TABLE) + 2:], "%Y_%m")
+        except ValueError:
+            month = None
+        partitions.append((name, month))
+    return sorted(partitions, key=lambda p: (p[1] is None, p[1] or datetime.min))
+
+
+def create_partition(db: Session, month: datetime) -> bool:
+    """
+    Cree la partition d'un mois si elle n'existe pas.
+
+    Les choix de ce mois deja ranges dans la partition par defaut (horloge
+    de borne decalee) sont deplaces dans la nouvelle partition.
+
+    Args:
+        db: Session de base de donnees.
+        month: Debut du mois.
+
+    Returns:
+        True si la partition a ete creee.
+    """
+    name = partition_name(month)
+    if db.execute(text("SELECT to_regclass(:name)"), {"name": name}).scalar():
+        return False
+
+    bounds = {"start": month, "end": add_months(month, 1)}
+    misplaced = False
+    if db.execute(text("SELECT to_regclass(:name)"), {"name": DEFAULT_PARTITION}).scalar():
+        misplaced = db.execute(text(
+            f"SELECT 1 FROM {DEFAULT_PARTITION} "
+            "WHERE event_time >= :start AND event_time < :end LIMIT 1"
+        ), bounds).first() is not None
+
+    # PostgreSQL refuse de creer la partition si la partition par defaut
+    # contient deja des lignes de ce mois
+    if misplaced:
+        db.execute(text(f"ALTER TABLE {TABLE} DETACH PARTITION {DEFAULT_PARTITION}"))
+
+    db.execute(text(
+        f"CREATE TABLE {name} PARTITION OF {TABLE} "
+        f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{bounds['end']:%Y-%m-%d}')"
+    ))
+
+    if misplaced:
+        db.execute(text(
+            f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} "
+            "WHERE event_time >= :start AND event_time < :end RETURNING *) "
+            f"INSERT INTO {TABLE} ({COLUMNS}) SELECT {COLUMNS} FROM moved"
+        ), bounds)
+        db.execute(text(f"ALTER TABLE {TABLE} ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT"))
+
+    logger.info(f"Partition creee: {name}")
+    return True
+
+
+def ensure_partitions(
+    db: Session,
+    ahead: int = PARTITION_PREMAKE,
+    since: Optional[datetime] = None
+) -> List[str]:
+    """
+    Cree la partition par defaut et celles des prochains mois.
+
+    Args:
+        db: Session de base de donnees (commit a la charge de l'appelant).
+        ahead: Nombre de mois crees apres le mois courant.
+        since: Premier mois a couvrir (mois courant par defaut).
+
+    Returns:
+        Noms des partitions creees.
+    """
+    db.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF {TABLE} DEFAULT"
+    ))
+
+    current = month_start(datetime.utcnow())
+    month = month_start(since) if since else current
+    created = []
+    while month <= add_months(current, ahead):
+        if create_partition(db, month):
+            created.append(partition_name(month))
+        month = add_months(month, 1)
+    return created
+
+
+def archive_partition(db: Session, name: str, archive_dir: str) -> Optional[Path]:
+    """
+    Detache une partition et l'archive si un dossier est configure.
+
+    La partition est d'abord detachee (transaction courte) : les requetes
+    ne la lisent plus. Elle est ensuite exportee en CSV gzip, avec les noms
+    de machine et de video, puis supprimee. Sans dossier d'archive, elle
+    reste en base sous forme de table detachee.
+
+    Args:
+        db: Session de base de donnees.
+        name: Nom de la partition.
+        archive_dir: Dossier des archives (vide = detacher seulement).
+
+    Returns:
+        Le chemin de l'archive, ou None si la partition est seulement detachee.
+    """
+    db.execute(text(f"ALTER TABLE {TABLE} DETACH PARTITION {name}"))
+    db.commit()
+    logger.info(f"Partition detachee: {name}")
+
+    if not archive_dir:
+        return None
+
+    path = Path(archive_dir) / f"{name}.csv.gz"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    partial = path.with_suffix(".gz.part")
+
+    cursor = db.connection().connection.cursor()
+    with gzip.open(partial, "wb") as archive:
+        cursor.copy_expert(
+            "COPY (SELECT c.id, c.choix, v.path AS video, c.event_time, m.name AS machine, c.event_id "
+            f"FROM {name} c "
+            "JOIN videos v ON v.id = c.video_id "
+            "JOIN machines m ON m.id = c.machine_id "
+            "ORDER BY c.event_time, c.id) TO STDOUT WITH (FORMAT csv, HEADER)",
+            archive
+        )
+    cursor.close()
+    partial.replace(path)
+
+    db.execute(text(f"DROP TABLE {name}"))
+    db.commit()
+    logger.info(f"Partition archivee: {path}")
+    return path
+
+
+def oldest_kept(months: Optional[int] = None, now: Optional[datetime] = None) -> Optional[datetime]:
+    """
+    Premier mois conserve par la retention.
+
+    Args:
+        months: Nombre de mois conserves, mois courant inclus (0 = tout
+            garder, defaut : PARTITION_RETENTION_MONTHS).
+        now: Heure de reference (defaut : maintenant).
+
+    Returns:
+        Debut du plus ancien mois conserve, None sans retention.
+    """
+    months = PARTITION_RETENTION_MONTHS if months is None else months
+    if months <= 0:
+        return None
+    return add_months(month_start(now or datetime.utcnow()), 1 - months)
+
+
+def apply_retention(
+    db: Session,
+    months: int = PARTITION_RETENTION_MONTHS,
+    archive_dir: str = PARTITION_ARCHIVE_DIR
+) -> List[str]:
+    """
+    Archive les partitions plus anciennes que la periode de retention.
+
+    Args:
+        db: Session de base de donnees.
+        months: Nombre de mois conserves, mois courant inclus (0 = tout garder).
+        archive_dir: Dossier des archives (vide = detacher seulement).
+
+    Returns:
+        Noms des partitions retirees.
+    """
+    kept_since = oldest_kept(months)
+    if kept_since is None:
+        return []
+
+    removed = []
+    for name, month in list_partitions(db):
+        if month is not None and month < kept_since:
+            archive_partition(db, name, archive_dir)
+            removed.append(name)
+    return removed
+
+
+def maintain(db: Session) -> dict:
+    """
+    Maintenance periodique : partitions a venir puis retention.
+
+    Ne fait rien si user_choices n'est pas partitionnee (voir migrate).
+
+    Returns:
+        Partitions creees et retirees.
+    """
+    if not is_partitioned(db):
+        logger.warning(
+            f"{TABLE} n'est pas partitionnee : executer `python partitions.py migrate`"
+        )
+        return {"created": [], "removed": []}
+
+    created = ensure_partitions(db)
+    db.commit()
+    removed = apply_retention(db)
+    return {"created": created, "removed": removed}
+
+
+def migrate(db: Session) -> int:
+    """
+    Convertit une table user_choices existante en table partitionnee.
+
+    L'ancienne table (colonnes machine et video en texte) est renommee, la
+    nouvelle est creee avec ses partitions, les lignes sont recopiees (ids
+    conserves, noms convertis en machine_id / video_id) puis l'ancienne
+    table est supprimee. Tout se fait dans une seule transaction : a
+    executer API arretee.
+
+    Returns:
+        Nombre de lignes recopiees.
+
+    Raises:
+        ValueError: Des noms de machine depassent la taille de
+            machines.name ; rien n'est modifie.
+    """
+    if is_partitioned(db):
+        return 0
+
+    max_length = Machine.__table__.c.name.type.length
+    too_long = db.execute(text(
+        f"SELECT DISTINCT machine FROM {TABLE} WHERE length(machine) > :max_length ORDER BY machine"
+    ), {"max_length": max_length}).scalars().all()
+    if too_long:
+        raise ValueError(
+            f"Noms de machine de plus de {max_length} caracteres dans {TABLE}.machine "
+            f"(a raccourcir avant la migration) : {', '.join(too_long)}"
+        )
+
+    legacy = f"{TABLE}_legacy"
+    db.execute(text(f"ALTER TABLE {TABLE} RENAME TO {legacy}"))
+    db.execute(text(f"ALTER SEQUENCE IF EXISTS {TABLE}_id_seq RENAME TO {legacy}_id_seq"))
+
+    # Libere les noms d'index pour ceux de la nouvelle table
+    index_names = db.execute(text(
+        "SELECT indexname FROM pg_indexes WHERE tablename = :table"
+    ), {"table": legacy}).scalars().all()
+    for index_name in index_names:
+        db.execute(text(f'ALTER INDEX "{index_name}" RENAME TO "{index_name}_legacy"'))
+
+    Video.__table__.create(db.connection(), checkfirst=True)
+    UserChoice.__table__.create(db.connection())
+
+    first = db.execute(text(f"SELECT min(event_time) FROM {legacy}")).scalar()
+    ensure_partitions(db, since=first)
+
+    # Dictionnaires des machines et des videos
+    db.execute(text(
+        "INSERT INTO machines (name, created_at, last_seen) "
+        f"SELECT machine, min(event_time), max(event_time) FROM {legacy} GROUP BY machine "
+        "ON CONFLICT (name) DO NOTHING"
+    ))
+    db.execute(text(
+        f"INSERT INTO videos (path) SELECT DISTINCT video FROM {legacy} "
+        "ON CONFLICT (path) DO NOTHING"
+    ))
+
+    # event_time etait nullable : les lignes sans date sont datees de la migration
+    copied = db.execute(text(
+        f"INSERT INTO {TABLE} ({COLUMNS}) "
+        "SELECT l.id, l.choix, v.id, coalesce(l.event_time, now() at time zone 'utc'), m.id, NULL "
+        f"FROM {legacy} l "
+        "JOIN videos v ON v.path = l.video "
+        "JOIN machines m ON m.name = l.machine"
+    )).rowcount
+    db.execute(text(
+        f"SELECT setval(pg_get_serial_sequence('{TABLE}', 'id'), "
+        f"coalesce((SELECT max(id) FROM {TABLE}), 0) + 1, false)"
+    ))
+    db.execute(text(f"DROP TABLE {legacy}"))
+    db.commit()
+    return copied
+
+
+if __name__ == "__main__":
+    import sys
+    from database import SessionLocal
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    command = sys.argv[1] if len(sys.argv) > 1 else "maintain"
+
+    session = SessionLocal()
+    try:
+        if command == "migrate":
+            print(f"{migrate(session)} choix recopies")
+            print(maintain(session))
+        elif command == "list":
+            for partition, _ in list_partitions(session):
+                print(partition)
+        else:
+            print(maintain(session))
+    finally:
+        session.close()
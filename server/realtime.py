@@ -0,0 +1,174 @@
+"""
+Compteurs glissants en memoire pour les statistiques temps reel.
+
+Chaque couple (machine, bouton) possede un tampon circulaire de comptes
+par minute couvrant les dernieres 24 heures. Les compteurs sont alimentes
+a l'ingestion et initialises depuis la base au demarrage : /stats/realtime
+repond en O(minutes x couples) sans requete PostgreSQL.
+"""
+
+from array import array
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+EPOCH = datetime(1970, 1, 1)
+MINUTE = timedelta(minutes=1)
+
+# (machine, bouton)
+Key = Tuple[str, str]
+
+
+def minute_index(moment: datetime) -> int:
+    """Numero de la minute (UTC) contenant un horodatage."""
+    return (moment - EPOCH) // MINUTE
+
+
+def minute_start(index: int) -> datetime:
+    """Debut d'une minute a partir de son numero."""
+    return EPOCH + index * MINUTE
+
+
+class SlidingWindow:
+    """Comptes par minute et par (machine, bouton) sur une fenetre glissante."""
+
+    def __init__(self, minutes: int = 1440):
+        """
+        Initialise des compteurs vides.
+
+        Args:
+            minutes: Taille de la fenetre conservee (24 h par defaut).
+        """
+        self.size = minutes
+        self._head = minute_index(datetime.utcnow())
+        self._counts: Dict[Key, array] = {}
+
+    def _advance(self, now: datetime) -> None:
+        """Fait glisser la fenetre jusqu'a la minute courante."""
+        current = minute_index(now)
+        steps = min(current - self._head, self.size)
+        if steps <= 0:
+            return
+
+        # Les cases reutilisees contenaient des minutes sorties de la fenetre
+        for offset in range(1, steps + 1):
+            slot = (self._head + offset) % self.size
+            for counts in self._counts.values():
+                counts[slot] = 0
+        self._head = current
+
+    def add(self, machine: str, choix: str, moment: datetime, count: int = 1) -> None:
+        """
+        Comptabilise des choix.
+
+        Les choix hors de la fenetre sont ignores ; ceux dates dans le futur
+        (horloge de borne en avance) sont comptes dans la minute courante.
+
+        Args:
+            machine: Nom de la machine.
+            choix: Bouton presse.
+            moment: Horodatage du choix (UTC).
+            count: Nombre de choix (negatif pour une suppression).
+        """
+        self._advance(datetime.utcnow())
+        index = min(minute_index(moment), self._head)
+        if index <= self._head - self.size:
+            return
+
+        counts = self._counts.get((machine, choix))
+        if counts is None:
+            counts = self._counts[(machine, choix)] = array("i", bytes(4 * self.size))
+        slot = index % self.size
+        counts[slot] = max(0, counts[slot] + count)
+
+    def seed(self, rows: Iterable[Tuple[datetime, str, str, int]]) -> None:
+        """
+        Initialise les compteurs depuis la base.
+
+        Args:
+            rows: Comptes (minute, machine, bouton, nombre).
+        """
+        for minute, machine, choix, count in rows:
+            self.add(machine, choix, minute, count)
+
+    def _keys(self, machine: Optional[str], choix: Optional[str]) -> List[Key]:
+        """Couples correspondant aux filtres."""
+        return [
+            key for key in self._counts
+            if (machine is None or key[0] == machine) and (choix is None or key[1] == choix)
+        ]
+
+    def _slots(self, minutes: int) -> List[Tuple[int, int]]:
+        """(numero de minute, case) des `minutes` dernieres minutes, de la plus ancienne."""
+        minutes = min(minutes, self.size)
+        return [
+            (index, index % self.size)
+            for index in range(self._head - minutes + 1, self._head + 1)
+        ]
+
+    def totals(self, minutes: int, machine: Optional[str] = None) -> Dict[Key, int]:
+        """
+        Nombre de choix par (machine, bouton) sur les dernieres minutes.
+
+        Args:
+            minutes: Taille de la fenetre (minute courante incluse).
+            machine: Filtre optionnel sur la machine.
+
+        Returns:
+            Comptes non nuls par (machine, bouton).
+        """
+        self._advance(datetime.utcnow())
+        slots = [slot for _, slot in self._slots(minutes)]
+        totals = {}
+        for key in self._keys(machine, None):
+            counts = self._counts[key]
+            total = sum(counts[slot] for slot in slots)
+            if total:
+                totals[key] = total
+        return totals
+
+    def series(
+        self,
+        minutes: int,
+        machine: Optional[str] = None,
+        choix: Optional[str] = None
+    ) -> List[Tuple[datetime, int]]:
+        """
+        Nombre de choix minute par minute.
+
+        Args:
+            minutes: Taille de la fenetre (minute courante incluse).
+            machine: Filtre optionnel sur la machine.
+            choix: Filtre optionnel sur le bouton.
+
+        Returns:
+            (debut de minute, nombre), de la plus ancienne a la courante.
+        """
+        self._advance(datetime.utcnow())
+        keys = self._keys(machine, choix)
+        return [
+            (minute_start(index), sum(self._counts[key][slot] for key in keys))
+            for index, slot in self._slots(minutes)
+        ]
+
+    def last_activity(self, minutes: int) -> Dict[str, datetime]:
+        """
+        Derniere minute active de chaque machine sur les dernieres minutes.
+
+        Args:
+            minutes: Taille de la fenetre (minute courante incluse).
+        """
+        self._advance(datetime.utcnow())
+        slots = self._slots(minutes)
+        last: Dict[str, int] = {}
+        for (machine, _), counts in self._counts.items():
+            for index, slot in reversed(slots):
+                if index <= last.get(machine, -1):
+                    break
+                if counts[slot]:
+                    last[machine] = index
+                    break
+        return {machine: minute_start(index) for machine, index in last.items()}
+
+    def total(self, minutes: int, machine: Optional[str] = None) -> int:
+        """Nombre total de choix sur les dernieres minutes."""
+        return sum(self.totals(minutes, machine).values())
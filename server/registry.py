@@ -0,0 +1,168 @@
+"""
+Registre des machines en memoire.
+
+Le registre garde pour chaque machine son identifiant et sa derniere
+activite (last_seen). Il est charge au demarrage puis tenu a jour par les
+routes /machines et par l'ingestion : un choix ou un heartbeat d'une
+machine connue ne fait plus aucune requete sur la table machines. Seules
+les machines jamais vues sont inserees (auto-enregistrement).
+
+last_seen est mis a jour en memoire et ecrit en base periodiquement, en
+une seule requete pour toutes les machines actives depuis l'ecriture
+precedente (flush()). Les machines actives de /stats/live sont lues dans
+le registre.
+
+Une machine supprimee (deleted_at) n'est pas chargee : un nouveau choix ou
+heartbeat de sa part la reactive, comme un auto-enregistrement.
+
+Comme le hub de live.py, le registre est propre au processus : l'API doit
+tourner avec un seul worker uvicorn.
+"""
+
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import DateTime, Integer, column, select, update, values
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import Machine
+
+
+class MachineRegistry:
+    """Correspondance nom -> id des machines et derniere activite."""
+
+    def __init__(self):
+        """Initialise un registre vide (charge par load())."""
+        self._ids: Dict[str, int] = {}
+        self._last_seen: Dict[str, datetime] = {}
+        # Activite pas encore ecrite en base (nom -> last_seen)
+        self._dirty: Dict[str, datetime] = {}
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    async def load(self, db: AsyncSession) -> None:
+        """
+        Charge toutes les machines depuis la base.
+
+        Args:
+            db: Session de base de donnees.
+        """
+        rows = (await db.execute(
+            select(Machine.name, Machine.id, Machine.last_seen).where(Machine.deleted_at.is_(None))
+        )).all()
+        self._ids = {name: machine_id for name, machine_id, _ in rows}
+        self._last_seen = {name: seen for name, _, seen in rows if seen is not None}
+
+    def get(self, name: str) -> Optional[int]:
+        """Identifiant d'une machine, ou None si inconnue."""
+        return self._ids.get(name)
+
+    def last_seen(self, name: str) -> Optional[datetime]:
+        """Derniere activite connue d'une machine (memoire, plus recente que la base)."""
+        return self._last_seen.get(name)
+
+    async def resolve(self, db: AsyncSession, names: Iterable[str], seen_at: datetime) -> Dict[str, int]:
+        """
+        Identifiants de plusieurs machines, auto-enregistrees si inconnues
+        (ou reactivees si supprimees).
+
+        Les machines creees ne sont pas retenues : appeler touch() apres le
+        commit, sinon un rollback laisserait des ids inexistants en memoire.
+
+        Args:
+            db: Session de base de donnees (transaction de l'ingestion).
+            names: Noms des machines.
+            seen_at: Instant de reception (created_at des nouvelles machines).
+
+        Returns:
+            Dictionnaire nom -> id.
+        """
+        names = set(names)
+        ids = {name: self._ids[name] for name in names if name in self._ids}
+        missing = sorted(names - ids.keys())
+        if missing:
+            # Ordre stable pour eviter les interblocages entre lots concurrents
+            stmt = pg_insert(Machine).values([
+                {"name": name, "created_at": seen_at, "last_seen": seen_at}
+                for name in missing
+            ])
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[Machine.name],
+                set_={"last_seen": stmt.excluded.last_seen, "deleted_at": None}
+            ).returning(Machine.name, Machine.id)
+            ids.update((await db.execute(stmt)).tuples().all())
+        return ids
+
+    def touch(self, ids: Dict[str, int], seen_at: datetime) -> None:
+        """
+        Enregistre l'activite de machines, une fois leur transaction validee.
+
+        Args:
+            ids: Dictionnaire nom -> id (ex. retourne par resolve()).
+            seen_at: Instant de l'activite.
+        """
+        self._ids.update(ids)
+        for name in ids:
+            if seen_at > self._last_seen.get(name, datetime.min):
+                self._last_seen[name] = seen_at
+                self._dirty[name] = seen_at
+
+    def remember(self, machine: Machine) -> None:
+        """Enregistre une machine creee par /machines."""
+        self._ids[machine.name] = machine.id
+        if machine.last_seen is not None:
+            self._last_seen[machine.name] = machine.last_seen
+
+    def forget(self, name: str) -> None:
+        """Oublie une machine supprimee."""
+        self._ids.pop(name, None)
+        self._last_seen.pop(name, None)
+        self._dirty.pop(name, None)
+
+    def active(self, since: datetime) -> List[str]:
+        """Noms des machines actives depuis un instant, tries."""
+        return sorted(name for name, seen in self._last_seen.items() if seen >= since)
+
+    async def flush(self, db: AsyncSession) -> int:
+        """
+        Ecrit en base l'activite en attente, en une seule requete.
+
+        last_seen n'est jamais recule : une valeur plus recente deja en base
+        est conservee.
+
+        Args:
+            db: Session de base de donnees (validee par flush()).
+
+        Returns:
+            Nombre de machines mises a jour.
+        """
+        pending = {
+            self._ids[name]: seen
+            for name, seen in self._dirty.items()
+            if name in self._ids
+        }
+        self._dirty = {}
+        if not pending:
+            return 0
+
+        rows = values(
+            column("id", Integer), column("seen", DateTime), name="activity"
+        ).data(list(pending.items()))
+        try:
+            await db.execute(
+                update(Machine)
+                .where(Machine.id == rows.c.id, Machine.last_seen < rows.c.seen)
+                .values(last_seen=rows.c.seen)
+            )
+            await db.commit()
+        except Exception:
+            # Reessaye a la prochaine ecriture, sans ecraser une activite plus recente
+            names = {machine_id: name for name, machine_id in self._ids.items()}
+            for machine_id, seen in pending.items():
+                name = names.get(machine_id)
+                if name is not None and seen > self._dirty.get(name, datetime.min):
+                    self._dirty[name] = seen
+            raise
+        return len(pending)
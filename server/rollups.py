@@ -0,0 +1,514 @@
+"""
+Agregats horaires et journaliers des choix.
+
+Les tables choice_rollups_hourly et choice_rollups_daily comptent les choix
+par (periode, machine, bouton). Les lectures de chaque video sont comptees
+par (jour, bouton, video) dans video_rollups_daily, toutes machines
+confondues, et par machine dans video_machine_rollups_daily. Le cube
+choice_heatmap compte les choix par (machine, bouton, jour de la semaine,
+heure locale) sur tout l'historique.
+
+Les agregats sont mis a jour a chaque ingestion, dans la meme transaction
+que les choix, ce qui permet a /stats de lire un nombre de lignes
+proportionnel au nombre de periodes et non au nombre d'evenements.
+"""
+
+import os
+from datetime import datetime, time, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import select, insert, update, delete, func, union_all, cast, SmallInteger
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from models import (
+    UserChoice, Machine, ChoiceRollupHourly, ChoiceRollupDaily,
+    VideoRollupDaily, VideoMachineRollupDaily, ChoiceHeatmap
+)
+
+HOUR = timedelta(hours=1)
+DAY = timedelta(days=1)
+
+# (periode, machine, bouton[, video_id]) -> (nombre, dernier evenement)
+Buckets = Dict[tuple, Tuple[int, datetime]]
+
+# Colonnes de la cle des agregats (la periode en premier)
+KEYS = ("bucket", "machine", "choix")
+VIDEO_KEYS = ("bucket", "choix", "video_id")
+VIDEO_MACHINE_KEYS = ("bucket", "machine", "choix", "video_id")
+
+# Fuseau des heures du cube choice_heatmap (recalculer le cube apres un
+# changement : python rollups.py --heatmap)
+STATS_TIMEZONE = os.getenv("STATS_TIMEZONE", "UTC")
+TIMEZONE = ZoneInfo(STATS_TIMEZONE)
+
+
+def _truncate(moment: datetime, period: timedelta) -> datetime:
+    """Tronque un horodatage au debut de l'heure ou du jour."""
+    if period == DAY:
+        return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def _ceil(moment: datetime, period: timedelta) -> datetime:
+    """Arrondit un horodatage au debut de l'heure ou du jour suivant."""
+    start = _truncate(moment, period)
+    return start if start == moment else start + period
+
+
+def _aggregate(rows: Iterable[dict], period: timedelta, keys: Sequence[str] = KEYS) -> Buckets:
+    """Regroupe des choix (machine, choix, event_time[, video_id]) par periode."""
+    buckets: Buckets = {}
+    for row in rows:
+        moment = row["event_time"]
+        key = (_truncate(moment, period),) + tuple(row[name] for name in keys[1:])
+        count, last = buckets.get(key, (0, moment))
+        buckets[key] = (count + 1, max(last, moment))
+    return buckets
+
+
+def _upsert(db: Session, model, buckets: Buckets, keys: Sequence[str] = KEYS) -> None:
+    """Ajoute des comptes aux agregats existants (upsert)."""
+    if not buckets:
+        return
+
+    # Ordre stable pour eviter les interblocages entre ingestions concurrentes
+    stmt = pg_insert(model).values([
+        {**dict(zip(keys, key)), "count": count, "last_event": last}
+        for key, (count, last) in sorted(buckets.items())
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[getattr(model, name) for name in keys],
+        set_={
+            "count": model.count + stmt.excluded.count,
+            "last_event": func.greatest(model.last_event, stmt.excluded.last_event)
+        }
+    )
+    db.execute(stmt)
+
+
+def local_slot(moment: datetime) -> Tuple[int, int]:
+    """(jour de la semaine 0-6, heure) d'un horodatage UTC naif, dans STATS_TIMEZONE."""
+    local = moment.replace(tzinfo=timezone.utc).astimezone(TIMEZONE)
+    return local.weekday(), local.hour
+
+
+def local_days_start(days: int, now: Optional[datetime] = None) -> datetime:
+    """
+    Debut des `days` derniers jours calendaires de STATS_TIMEZONE (jour
+    courant inclus) : minuit local, en UTC naif comme les horodatages.
+
+    Args:
+        days: Nombre de jours.
+        now: Instant courant (UTC naif, maintenant par defaut).
+    """
+    local_now = (now or datetime.utcnow()).replace(tzinfo=timezone.utc).astimezone(TIMEZONE)
+    first_day = local_now.date() - timedelta(days=days - 1)
+    midnight = datetime.combine(first_day, time(), tzinfo=TIMEZONE)
+    return midnight.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def local_slot_sql(column) -> Tuple:
+    """Expressions SQL (jour de la semaine 0-6, heure) d'une colonne UTC naive."""
+    local = func.timezone(STATS_TIMEZONE, func.timezone("UTC", column))
+    return (
+        cast(func.extract("isodow", local) - 1, SmallInteger),
+        cast(func.extract("hour", local), SmallInteger)
+    )
+
+
+def _upsert_heatmap(db: Session, rows: Iterable[dict]) -> None:
+    """Ajoute des choix (machine, choix, event_time) au cube choice_heatmap."""
+    cells: Dict[Tuple[str, str, int, int], int] = {}
+    for row in rows:
+        key = (row["machine"], row["choix"]) + local_slot(row["event_time"])
+        cells[key] = cells.get(key, 0) + 1
+    if not cells:
+        return
+
+    # Ordre stable pour eviter les interblocages entre ingestions concurrentes
+    stmt = pg_insert(ChoiceHeatmap).values([
+        {"machine": machine, "choix": choix, "weekday": weekday, "hour": hour, "count": count}
+        for (machine, choix, weekday, hour), count in sorted(cells.items())
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[ChoiceHeatmap.machine, ChoiceHeatmap.choix, ChoiceHeatmap.weekday, ChoiceHeatmap.hour],
+        set_={"count": ChoiceHeatmap.count + stmt.excluded.count}
+    )
+    db.execute(stmt)
+
+
+def add_choices(db: Session, rows: Iterable[dict]) -> None:
+    """
+    Comptabilise de nouveaux choix dans les agregats.
+
+    A appeler dans la transaction qui insere les choix. Les agregats sont
+    indexes par nom de machine (et non par machine_id).
+
+    Args:
+        db: Session de base de donnees.
+        rows: Choix inseres (cles machine, choix, video_id et event_time).
+    """
+    rows = list(rows)
+    _upsert(db, ChoiceRollupHourly, _aggregate(rows, HOUR))
+    _upsert(db, ChoiceRollupDaily, _aggregate(rows, DAY))
+    _upsert(db, VideoRollupDaily, _aggregate(rows, DAY, VIDEO_KEYS), VIDEO_KEYS)
+    _upsert(db, VideoMachineRollupDaily, _aggregate(rows, DAY, VIDEO_MACHINE_KEYS), VIDEO_MACHINE_KEYS)
+    _upsert_heatmap(db, rows)
+
+
+def remove_choice(db: Session, choice: UserChoice, machine: str) -> None:
+    """
+    Retire un choix supprime des agregats.
+
+    Le choix doit deja avoir ete supprime (flush) pour que la date du
+    dernier evenement de sa periode soit recalculee sans lui.
+
+    Args:
+        db: Session de base de donnees.
+        choice: Choix supprime.
+        machine: Nom de la machine du choix.
+    """
+    hour = _truncate(choice.event_time, HOUR)
+    day = _truncate(choice.event_time, DAY)
+
+    last_in_hour = (
+        select(func.max(UserChoice.event_time))
+        .where(
+            UserChoice.event_time >= hour,
+            UserChoice.event_time < hour + HOUR,
+            UserChoice.machine_id == choice.machine_id,
+            UserChoice.choix == choice.choix
+        )
+        .scalar_subquery()
+    )
+    last_in_day = (
+        select(func.max(ChoiceRollupHourly.last_event))
+        .where(
+            ChoiceRollupHourly.bucket >= day,
+            ChoiceRollupHourly.bucket < day + DAY,
+            ChoiceRollupHourly.machine == machine,
+            ChoiceRollupHourly.choix == choice.choix
+        )
+        .scalar_subquery()
+    )
+
+    # L'agregat horaire doit etre a jour avant le calcul du journalier
+    for model, bucket, last_event in (
+        (ChoiceRollupHourly, hour, last_in_hour),
+        (ChoiceRollupDaily, day, last_in_day),
+    ):
+        key = (
+            (model.bucket == bucket)
+            & (model.machine == machine)
+            & (model.choix == choice.choix)
+        )
+        db.execute(delete(model).where(key, model.count <= 1))
+        db.execute(
+            update(model)
+            .where(key)
+            .values(count=model.count - 1, last_event=last_event)
+        )
+
+    # Lectures de la video : par machine, puis toutes machines
+    same_play = (
+        UserChoice.event_time >= day,
+        UserChoice.event_time < day + DAY,
+        UserChoice.choix == choice.choix,
+        UserChoice.video_id == choice.video_id
+    )
+    last_for_machine = (
+        select(func.max(UserChoice.event_time))
+        .where(*same_play, UserChoice.machine_id == choice.machine_id)
+        .scalar_subquery()
+    )
+    last_overall = select(func.max(UserChoice.event_time)).where(*same_play).scalar_subquery()
+
+    for model, key, last_event in (
+        (VideoMachineRollupDaily, [VideoMachineRollupDaily.machine == machine], last_for_machine),
+        (VideoRollupDaily, [], last_overall),
+    ):
+        key = [
+            model.bucket == day,
+            model.choix == choice.choix,
+            model.video_id == choice.video_id,
+            *key
+        ]
+        db.execute(delete(model).where(*key, model.count <= 1))
+        db.execute(
+            update(model)
+            .where(*key)
+            .values(count=model.count - 1, last_event=last_event)
+        )
+
+    weekday, hour = local_slot(choice.event_time)
+    cell = [
+        ChoiceHeatmap.machine == machine,
+        ChoiceHeatmap.choix == choice.choix,
+        ChoiceHeatmap.weekday == weekday,
+        ChoiceHeatmap.hour == hour
+    ]
+    db.execute(delete(ChoiceHeatmap).where(*cell, ChoiceHeatmap.count <= 1))
+    db.execute(update(ChoiceHeatmap).where(*cell).values(count=ChoiceHeatmap.count - 1))
+
+
+def _retained_since(db: Session) -> datetime:
+    """
+    Debut du mois du plus ancien choix encore dans user_choices.
+
+    Les mois precedents ont ete archives (partitions.py) : leurs agregats
+    ne peuvent plus etre recalcules et sont conserves. Sans choix en base,
+    retourne datetime.max (aucune periode a recalculer).
+    """
+    first = db.execute(select(func.min(UserChoice.event_time))).scalar()
+    if first is None:
+        return datetime.max
+    return first.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _rebuild_choice_rollup(db: Session, model, unit: str, since: datetime) -> None:
+    """Recalcule un agregat horaire ou journalier depuis since."""
+    db.execute(delete(model).where(model.bucket >= since))
+    bucket = func.date_trunc(unit, UserChoice.event_time)
+    db.execute(
+        insert(model).from_select(
+            ["bucket", "machine", "choix", "count", "last_event"],
+            select(
+                bucket,
+                Machine.name,
+                UserChoice.choix,
+                func.count(UserChoice.id),
+                func.max(UserChoice.event_time)
+            )
+            .join(Machine, Machine.id == UserChoice.machine_id)
+            .where(UserChoice.event_time >= since)
+            .group_by(bucket, Machine.name, UserChoice.choix)
+        )
+    )
+
+
+def _rebuild_video_machine_rollup(db: Session, since: datetime) -> None:
+    """Recalcule les lectures par machine et video depuis since."""
+    db.execute(delete(VideoMachineRollupDaily).where(VideoMachineRollupDaily.bucket >= since))
+    day = func.date_trunc("day", UserChoice.event_time)
+    db.execute(
+        insert(VideoMachineRollupDaily).from_select(
+            ["bucket", "machine", "choix", "video_id", "count", "last_event"],
+            select(
+                day,
+                Machine.name,
+                UserChoice.choix,
+                UserChoice.video_id,
+                func.count(UserChoice.id),
+                func.max(UserChoice.event_time)
+            )
+            .join(Machine, Machine.id == UserChoice.machine_id)
+            .where(UserChoice.event_time >= since)
+            .group_by(day, Machine.name, UserChoice.choix, UserChoice.video_id)
+        )
+    )
+
+
+def _rebuild_video_rollup(db: Session, since: datetime) -> None:
+    """Recalcule les lectures par video, toutes machines, depuis l'agregat par machine."""
+    db.execute(delete(VideoRollupDaily).where(VideoRollupDaily.bucket >= since))
+    db.execute(
+        insert(VideoRollupDaily).from_select(
+            ["bucket", "choix", "video_id", "count", "last_event"],
+            select(
+                VideoMachineRollupDaily.bucket,
+                VideoMachineRollupDaily.choix,
+                VideoMachineRollupDaily.video_id,
+                func.sum(VideoMachineRollupDaily.count),
+                func.max(VideoMachineRollupDaily.last_event)
+            )
+            .where(VideoMachineRollupDaily.bucket >= since)
+            .group_by(
+                VideoMachineRollupDaily.bucket,
+                VideoMachineRollupDaily.choix,
+                VideoMachineRollupDaily.video_id
+            )
+        )
+    )
+
+
+def rebuild_heatmap(db: Session, since: Optional[datetime] = None) -> None:
+    """
+    Recalcule le cube choice_heatmap, en un seul passage.
+
+    Les choix encore en base sont lus dans user_choices ; les mois archives
+    (avant since) dans les agregats horaires, dont chaque heure est comptee
+    dans l'heure locale de son debut (exact pour un fuseau a decalage
+    horaire entier). A relancer apres un changement de STATS_TIMEZONE.
+
+    Args:
+        db: Session de base de donnees (commit a la charge de l'appelant).
+        since: Debut des choix encore en base (calcule si None).
+    """
+    if since is None:
+        since = _retained_since(db)
+    db.execute(delete(ChoiceHeatmap))
+
+    weekday, hour = local_slot_sql(UserChoice.event_time)
+    retained = (
+        select(
+            Machine.name.label("machine"),
+            UserChoice.choix.label("choix"),
+            weekday.label("weekday"),
+            hour.label("hour"),
+            func.count(UserChoice.id).label("count")
+        )
+        .join(Machine, Machine.id == UserChoice.machine_id)
+        .where(UserChoice.event_time >= since)
+        .group_by(Machine.name, UserChoice.choix, weekday, hour)
+    )
+    weekday, hour = local_slot_sql(ChoiceRollupHourly.bucket)
+    archived = (
+        select(ChoiceRollupHourly.machine, ChoiceRollupHourly.choix, weekday, hour, func.sum(ChoiceRollupHourly.count))
+        .where(ChoiceRollupHourly.bucket < since)
+        .group_by(ChoiceRollupHourly.machine, ChoiceRollupHourly.choix, weekday, hour)
+    )
+    cells = union_all(retained, archived).subquery("cells")
+    db.execute(
+        insert(ChoiceHeatmap).from_select(
+            ["machine", "choix", "weekday", "hour", "count"],
+            select(cells.c.machine, cells.c.choix, cells.c.weekday, cells.c.hour, func.sum(cells.c.count))
+            .group_by(cells.c.machine, cells.c.choix, cells.c.weekday, cells.c.hour)
+        )
+    )
+
+
+# Agregats dans l'ordre de calcul (video_rollups_daily est deduit de
+# video_machine_rollups_daily, choice_heatmap des agregats horaires)
+REBUILDS = (
+    (ChoiceRollupHourly, lambda db, since: _rebuild_choice_rollup(db, ChoiceRollupHourly, "hour", since)),
+    (ChoiceRollupDaily, lambda db, since: _rebuild_choice_rollup(db, ChoiceRollupDaily, "day", since)),
+    (VideoMachineRollupDaily, _rebuild_video_machine_rollup),
+    (VideoRollupDaily, _rebuild_video_rollup),
+    (ChoiceHeatmap, rebuild_heatmap),
+)
+
+
+def rebuild(db: Session) -> None:
+    """
+    Recalcule les agregats depuis user_choices.
+
+    Seules les periodes encore en base sont recalculees : les agregats des
+    mois archives (retention de partitions.py) sont conserves.
+
+    Args:
+        db: Session de base de donnees (commit a la charge de l'appelant).
+    """
+    since = _retained_since(db)
+    for _, build in REBUILDS:
+        build(db, since)
+
+
+def backfill(db: Session) -> List[str]:
+    """
+    Calcule les agregats encore vides (premier demarrage, nouvelle table).
+
+    Un agregat deja rempli n'est jamais recalcule : il peut contenir des
+    mois archives qui ne sont plus dans user_choices.
+
+    Args:
+        db: Session de base de donnees (commit a la charge de l'appelant).
+
+    Returns:
+        Noms des tables calculees.
+    """
+    if db.execute(select(UserChoice.id).limit(1)).first() is None:
+        return []
+
+    since = _retained_since(db)
+    built = []
+    for model, build in REBUILDS:
+        if db.execute(select(model.count).limit(1)).first() is None:
+            build(db, since)
+            built.append(model.__tablename__)
+    return built
+
+
+def segments(cutoff: datetime, machine: Optional[str] = None):
+    """
+    Construit la sous-requete des choix depuis cutoff, par jour/machine/bouton.
+
+    La periode est decoupee en trois parties :
+    - [cutoff, heure suivante) : lignes brutes de user_choices ;
+    - [heure suivante, jour suivant) : agregats horaires ;
+    - [jour suivant, ...) : agregats journaliers.
+
+    Args:
+        cutoff: Debut de la periode.
+        machine: Filtre optionnel sur la machine.
+
+    Returns:
+        Sous-requete avec les colonnes day, machine, choix, count, last_event.
+    """
+    hour_start = _ceil(cutoff, HOUR)
+    day_start = _ceil(cutoff, DAY)
+
+    raw = (
+        select(
+            func.date(UserChoice.event_time).label("day"),
+            Machine.name.label("machine"),
+            UserChoice.choix.label("choix"),
+            func.count(UserChoice.id).label("count"),
+            func.max(UserChoice.event_time).label("last_event")
+        )
+        .join(Machine, Machine.id == UserChoice.machine_id)
+        .where(UserChoice.event_time >= cutoff, UserChoice.event_time < hour_start)
+        .group_by(func.date(UserChoice.event_time), Machine.name, UserChoice.choix)
+    )
+    hourly = (
+        select(
+            func.date(ChoiceRollupHourly.bucket),
+            ChoiceRollupHourly.machine,
+            ChoiceRollupHourly.choix,
+            ChoiceRollupHourly.count,
+            ChoiceRollupHourly.last_event
+        )
+        .where(ChoiceRollupHourly.bucket >= hour_start, ChoiceRollupHourly.bucket < day_start)
+    )
+    daily = (
+        select(
+            func.date(ChoiceRollupDaily.bucket),
+            ChoiceRollupDaily.machine,
+            ChoiceRollupDaily.choix,
+            ChoiceRollupDaily.count,
+            ChoiceRollupDaily.last_event
+        )
+        .where(ChoiceRollupDaily.bucket >= day_start)
+    )
+
+    if machine:
+        raw = raw.where(Machine.name == machine)
+        hourly = hourly.where(ChoiceRollupHourly.machine == machine)
+        daily = daily.where(ChoiceRollupDaily.machine == machine)
+
+    return union_all(raw, hourly, daily).subquery("segments")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Recalcule les agregats depuis user_choices.")
+    parser.add_argument(
+        "--heatmap", action="store_true",
+        help="Recalculer seulement le cube jour x heure (apres un changement de STATS_TIMEZONE)"
+    )
+    args = parser.parse_args()
+
+    session = SessionLocal()
+    try:
+        if args.heatmap:
+            rebuild_heatmap(session)
+        else:
+            rebuild(session)
+        session.commit()
+        print("Agregats recalcules")
+    finally:
+        session.close()
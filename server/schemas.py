@@ -2,9 +2,38 @@
 Schemas Pydantic pour la validation des donnees API.
 """
 
-from datetime import datetime
-from typing import Optional, List
-from pydantic import BaseModel, Field
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional, List, Tuple
+from uuid import UUID
+from pydantic import BaseModel, Field, field_validator
+
+import partitions
+
+# Fenetre acceptee pour l'horodatage des bornes : une borne sans horloge
+# temps reel peut envoyer 1970 ou une date future
+EVENT_TIME_MAX_AGE_DAYS = int(os.getenv("EVENT_TIME_MAX_AGE_DAYS", "365"))
+EVENT_TIME_MAX_SKEW = float(os.getenv("EVENT_TIME_MAX_SKEW", "300"))
+
+
+def event_time_window(now: Optional[datetime] = None) -> Tuple[datetime, datetime]:
+    """
+    Bornes acceptees pour event_time (UTC naif).
+
+    Args:
+        now: Heure du serveur (defaut : maintenant).
+
+    Returns:
+        (plus ancien, plus recent) : EVENT_TIME_MAX_AGE_DAYS dans le passe,
+        sans remonter avant le plus ancien mois conserve par la retention,
+        et EVENT_TIME_MAX_SKEW secondes dans le futur.
+    """
+    now = now or datetime.utcnow()
+    oldest = now - timedelta(days=EVENT_TIME_MAX_AGE_DAYS)
+    kept_since = partitions.oldest_kept(now=now)
+    if kept_since is not None:
+        oldest = max(oldest, kept_since)
+    return oldest, now + timedelta(seconds=EVENT_TIME_MAX_SKEW)
 
 
 # ========== UserChoice Schemas ==========
@@ -14,11 +43,39 @@ class ChoiceCreate(BaseModel):
     choix: str = Field(..., min_length=1, max_length=1, pattern="^[A-G]$")
     video: str = Field(..., min_length=1)
     machine: str = Field(..., min_length=1, max_length=100)
+    event_time: Optional[datetime] = None
+    # Identifiant unique genere par la borne : un renvoi du meme choix (meme
+    # event_id et event_time) est ignore. Genere par le serveur si absent.
+    event_id: Optional[UUID] = None
+
+    @field_validator("event_time")
+    @classmethod
+    def normalize_event_time(cls, value: Optional[datetime]) -> Optional[datetime]:
+        """
+        Convertit l'horodatage de la borne en UTC naif (format de la base).
+
+        Un horodatage hors de event_time_window() est refuse (422, ou
+        element "rejected" d'un lot) : il fausserait les agregats et
+        tomberait dans la partition par defaut.
+        """
+        if value is None:
+            return value
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        oldest, newest = event_time_window()
+        if not oldest <= value <= newest:
+            raise ValueError(
+                f"event_time hors de la fenetre acceptee "
+                f"({oldest:%Y-%m-%dT%H:%M:%S} - {newest:%Y-%m-%dT%H:%M:%S} UTC), "
+                f"horloge de la borne a verifier"
+            )
+        return value
 
 
 class ChoiceResponse(BaseModel):
     """Schema de reponse pour un choix."""
-    id: int
+    # Absent si l'ecriture est differee sans attente du commit (202)
+    id: Optional[int] = None
     choix: str
     video: str
     event_time: datetime
@@ -30,10 +87,29 @@ class ChoiceResponse(BaseModel):
 
 class ChoiceListResponse(BaseModel):
     """Schema pour une liste de choix avec pagination."""
-    total: int
+    total: Optional[int]
+    total_estimated: bool = False
+    next_cursor: Optional[str] = None
     items: List[ChoiceResponse]
 
 
+class ChoiceBatchItemResult(BaseModel):
+    """Statut d'un element d'un lot de choix."""
+    index: int
+    # created, accepted (ecriture differee), duplicate (deja enregistre) ou rejected
+    status: str
+    id: Optional[int] = None
+    error: Optional[str] = None
+
+
+class ChoiceBatchResponse(BaseModel):
+    """Reponse a l'enregistrement d'un lot de choix."""
+    created: int
+    rejected: int
+    duplicates: int = 0
+    items: List[ChoiceBatchItemResult]
+
+
 # ========== Machine Schemas ==========
 
 class MachineCreate(BaseModel):
@@ -62,6 +138,51 @@ class MachineResponse(BaseModel):
         from_attributes = True
 
 
+# ========== Heartbeat Schemas ==========
+
+class StageHistogram(BaseModel):
+    """Histogramme des durees d'une etape de la borne (ms)."""
+    n: int = Field(..., ge=0)
+    sum: float = Field(..., ge=0)
+    max: float = Field(..., ge=0)
+    b: List[int]
+
+
+class HeartbeatCreate(BaseModel):
+    """Heartbeat d'une borne : histogrammes depuis le heartbeat precedent."""
+    interval: float = Field(..., gt=0)
+    uptime: float = 0
+    buckets: List[float]
+    stages: Dict[str, StageHistogram] = {}
+    mode: Optional[str] = None
+    pending: Optional[int] = None
+    # Statistiques de la session HTTP de la borne (APIClient.connection_stats)
+    http: Optional[Dict[str, float]] = None
+
+
+class LatencyItem(BaseModel):
+    """Reactivite d'une borne (ou du parc) sur une etape."""
+    machine: Optional[str] = None
+    count: int
+    mean_ms: float
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    max_ms: float
+    mode: Optional[str] = None
+    pending: Optional[int] = None
+    connection_reuse: Optional[float] = None
+    last_heartbeat: Optional[datetime] = None
+
+
+class LatencyResponse(BaseModel):
+    """Reactivite du parc sur une etape, bornes les plus lentes en premier."""
+    stage: str
+    minutes: int
+    fleet: LatencyItem
+    machines: List[LatencyItem]
+
+
 # ========== Statistics Schemas ==========
 
 class ChoiceStatItem(BaseModel):
@@ -93,8 +214,80 @@ class StatsResponse(BaseModel):
     daily_activity: List[DailyStatItem]
 
 
+class VideoStatItem(BaseModel):
+    """Lectures d'une video."""
+    video: str
+    choix: str
+    plays: int
+    percentage: float
+    last_played: datetime
+
+
+class VideoStatsResponse(BaseModel):
+    """Videos les plus jouees sur les derniers jours."""
+    days: int
+    total_plays: int
+    videos: List[VideoStatItem]
+
+
+class VideoTimelineResponse(BaseModel):
+    """Lectures d'une video par jour."""
+    video: str
+    days: int
+    total_plays: int
+    daily: List[DailyStatItem]
+
+
+class HeatmapResponse(BaseModel):
+    """Choix par jour de la semaine et heure locale."""
+    timezone: str
+    days: Optional[int]
+    total_choices: int
+    # 7 lignes (lundi ... dimanche) de 24 heures
+    counts: List[List[int]]
+    by_weekday: List[int]
+    by_hour: List[int]
+
+
+class RealtimeStatsResponse(BaseModel):
+    """Statistiques des dernieres minutes (compteurs en memoire)."""
+    minutes: int
+    total_choices: int
+    choices_by_button: List[ChoiceStatItem]
+    choices_by_machine: List[MachineStatItem]
+
+
+class RateItem(BaseModel):
+    """Nombre de choix sur une minute."""
+    minute: datetime
+    count: int
+
+
+class RealtimeRateResponse(BaseModel):
+    """Debit de choix minute par minute."""
+    minutes: int
+    total_choices: int
+    per_minute_avg: float
+    per_minute: List[RateItem]
+
+
+class CacheStatsResponse(BaseModel):
+    """Compteurs du cache des statistiques."""
+    size: int
+    maxsize: int
+    ttl: float
+    max_staleness: float
+    hits: int
+    misses: int
+    hit_ratio: float
+    evictions: int
+    invalidations: int
+
+
 class HealthResponse(BaseModel):
     """Reponse du health check."""
     status: str
     database: str
     version: str
+    # Etat de la file d'ecriture differee (INGEST_MODE=buffered)
+    ingest: Optional[Dict[str, Any]] = None
@@ -0,0 +1,44 @@
+"""
+Generation de choix de test (verification des plans, benchmarks).
+
+Les choix sont inseres dans la transaction de la session : l'appelant
+l'annule a la fin pour ne pas modifier la base.
+"""
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+import partitions
+
+
+def seed(db: Session, rows: int, days: int = 365, machines: int = 50) -> None:
+    """
+    Insere des choix repartis sur `days` jours puis met a jour les statistiques.
+
+    Args:
+        db: Session de base de donnees (transaction a annuler).
+        rows: Nombre de choix generes.
+        days: Periode couverte, jusqu'a maintenant.
+        machines: Nombre de machines (bench_000, bench_001...).
+    """
+    partitions.ensure_partitions(db, since=datetime.utcnow() - timedelta(days=days))
+    db.execute(text(
+        "INSERT INTO machines (name) "
+        "SELECT 'bench_' || lpad(g::text, 3, '0') FROM generate_series(0, :machines - 1) g "
+        "ON CONFLICT (name) DO NOTHING"
+    ), {"machines": machines})
+    db.execute(text(
+        "INSERT INTO videos (path) VALUES ('/videos/demo.mp4') ON CONFLICT (path) DO NOTHING"
+    ))
+    db.execute(text(
+        "INSERT INTO user_choices (choix, video_id, event_time, machine_id, event_id) "
+        "SELECT chr(65 + (g % 7)), v.id, "
+        "  (now() at time zone 'utc') - random() * make_interval(days => :days), m.id, "
+        "  gen_random_uuid() "
+        "FROM generate_series(1, :rows) g "
+        "JOIN machines m ON m.name = 'bench_' || lpad((g % :machines)::text, 3, '0') "
+        "JOIN videos v ON v.path = '/videos/demo.mp4'"
+    ), {"rows": rows, "days": days, "machines": machines})
+    db.execute(text("ANALYZE user_choices"))
@@ -0,0 +1,287 @@
+"""
+Calcul des statistiques de /stats en une seule requete.
+
+Le total, les repartitions par bouton, par machine et par jour sont
+calcules en un seul passage sur les segments (rollups.segments) grace a
+GROUPING SETS. Le nombre de machines est lu dans la meme requete.
+
+Les requetes de /stats/videos lisent les agregats journaliers par video :
+leur cout depend de la periode demandee, pas de l'historique. La carte
+jour x heure de /stats/heatmap lit le cube choice_heatmap (tout
+l'historique) ou les agregats horaires (derniers jours).
+"""
+
+from collections import namedtuple
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import desc, func, select, tuple_
+
+import rollups
+from models import (
+    Machine, Video, VideoRollupDaily, VideoMachineRollupDaily, ChoiceRollupHourly, ChoiceHeatmap
+)
+from schemas import StatsResponse, ChoiceStatItem, MachineStatItem, DailyStatItem
+
+# Valeur de GROUPING(choix, machine, day) pour chaque ensemble de regroupement
+# (un bit a 1 par colonne agregee)
+BY_BUTTON = 0b011
+BY_MACHINE = 0b101
+BY_DAY = 0b110
+TOTAL = 0b111
+
+# Ligne au format de breakdown(), pour des totaux calcules hors de la base
+Row = namedtuple("Row", "choix machine day count last_event grouping total_machines")
+
+
+def breakdown(cutoff: datetime, machine: Optional[str] = None):
+    """
+    Construit la requete des statistiques depuis cutoff.
+
+    Args:
+        cutoff: Debut de la periode.
+        machine: Filtre optionnel sur la machine (applique a toutes les
+            repartitions).
+
+    Returns:
+        Requete retournant une ligne par bouton, machine, jour, plus une
+        ligne de total (colonne grouping).
+    """
+    segments = rollups.segments(cutoff, machine)
+    total_machines = select(func.count(Machine.id)).where(Machine.deleted_at.is_(None)).scalar_subquery()
+
+    return (
+        select(
+            segments.c.choix,
+            segments.c.machine,
+            segments.c.day,
+            func.coalesce(func.sum(segments.c.count), 0).label("count"),
+            func.max(segments.c.last_event).label("last_event"),
+            func.grouping(segments.c.choix, segments.c.machine, segments.c.day).label("grouping"),
+            total_machines.label("total_machines")
+        )
+        .group_by(func.grouping_sets(
+            tuple_(segments.c.choix),
+            tuple_(segments.c.machine),
+            tuple_(segments.c.day),
+            tuple_()
+        ))
+    )
+
+
+def assemble(rows: Iterable) -> StatsResponse:
+    """
+    Construit la reponse de /stats a partir des lignes de breakdown().
+
+    Args:
+        rows: Resultat de la requete.
+
+    Returns:
+        Les statistiques, triees comme avant (effectifs decroissants, jours
+        croissants).
+    """
+    total_choices = 0
+    total_machines = 0
+    buttons, machines, days = [], [], []
+
+    for row in rows:
+        if row.grouping == TOTAL:
+            total_choices = row.count
+            total_machines = row.total_machines
+        elif row.grouping == BY_BUTTON:
+            buttons.append(row)
+        elif row.grouping == BY_MACHINE:
+            machines.append(row)
+        elif row.grouping == BY_DAY:
+            days.append(row)
+
+    return StatsResponse(
+        total_choices=total_choices,
+        total_machines=total_machines,
+        choices_by_button=[
+            ChoiceStatItem(
+                choix=row.choix,
+                count=row.count,
+                percentage=round(row.count / total_choices * 100, 1) if total_choices > 0 else 0
+            )
+            for row in sorted(buttons, key=lambda r: (-r.count, r.choix))
+        ],
+        choices_by_machine=[
+            MachineStatItem(
+                machine=row.machine,
+                total_choices=row.count,
+                last_activity=row.last_event
+            )
+            for row in sorted(machines, key=lambda r: (-r.count, r.machine))
+        ],
+        daily_activity=[
+            DailyStatItem(date=str(row.day), count=row.count)
+            for row in sorted(days, key=lambda r: r.day)
+        ]
+    )
+
+
+def from_totals(
+    by_button: Dict[str, int],
+    by_machine: Dict[str, Tuple[int, datetime]],
+    by_day: Dict[date, int],
+    total_machines: int
+) -> StatsResponse:
+    """
+    Construit la reponse de /stats a partir de totaux deja calcules.
+
+    Utilise par les segments colonnes (analytics.py) : meme format et meme
+    tri que les statistiques calculees en base.
+
+    Args:
+        by_button: Nombre de choix par bouton.
+        by_machine: (nombre de choix, dernier choix) par machine.
+        by_day: Nombre de choix par jour.
+        total_machines: Nombre de machines enregistrees.
+
+    Returns:
+        Les statistiques.
+    """
+    rows = [Row(None, None, None, sum(by_button.values()), None, TOTAL, total_machines)]
+    rows += [Row(choix, None, None, count, None, BY_BUTTON, None) for choix, count in by_button.items()]
+    rows += [
+        Row(None, machine, None, count, last_event, BY_MACHINE, None)
+        for machine, (count, last_event) in by_machine.items()
+    ]
+    rows += [Row(None, None, day, count, None, BY_DAY, None) for day, count in by_day.items()]
+    return assemble(rows)
+
+
+def top_videos(
+    since: datetime,
+    machine: Optional[str] = None,
+    choix: Optional[str] = None,
+    limit: int = 10
+):
+    """
+    Construit la requete des videos les plus jouees depuis since.
+
+    Sans filtre de machine, lit l'agregat toutes machines (une ligne par
+    jour, bouton et video) ; avec, l'agregat de la machine.
+
+    Args:
+        since: Premier jour (debut de jour).
+        machine: Filtre optionnel sur la machine.
+        choix: Filtre optionnel sur le bouton.
+        limit: Nombre de videos.
+
+    Returns:
+        Requete retournant path, choix, plays, last_played et total
+        (lectures de toutes les videos de la periode), par lectures
+        decroissantes.
+    """
+    model = VideoMachineRollupDaily if machine else VideoRollupDaily
+    plays = func.sum(model.count)
+    ranked = (
+        select(
+            model.video_id,
+            model.choix,
+            plays.label("plays"),
+            func.max(model.last_event).label("last_played"),
+            func.sum(plays).over().label("total")
+        )
+        .where(model.bucket >= since)
+        .group_by(model.video_id, model.choix)
+        .order_by(desc(plays), model.video_id)
+        .limit(limit)
+    )
+    if machine:
+        ranked = ranked.where(model.machine == machine)
+    if choix:
+        ranked = ranked.where(model.choix == choix)
+    ranked = ranked.subquery()
+
+    return (
+        select(
+            Video.path,
+            ranked.c.choix,
+            ranked.c.plays,
+            ranked.c.last_played,
+            ranked.c.total
+        )
+        .join(Video, Video.id == ranked.c.video_id)
+        .order_by(desc(ranked.c.plays), Video.path)
+    )
+
+
+def video_timeline(video_id: int, since: datetime, machine: Optional[str] = None):
+    """
+    Construit la requete des lectures d'une video par jour depuis since.
+
+    Args:
+        video_id: Identifiant de la video.
+        since: Premier jour (debut de jour).
+        machine: Filtre optionnel sur la machine.
+
+    Returns:
+        Requete retournant day et count, par jour croissant.
+    """
+    model = VideoMachineRollupDaily if machine else VideoRollupDaily
+    day = func.date(model.bucket)
+    statement = (
+        select(day.label("day"), func.sum(model.count).label("count"))
+        .where(model.video_id == video_id, model.bucket >= since)
+        .group_by(day)
+        .order_by(day)
+    )
+    if machine:
+        statement = statement.where(model.machine == machine)
+    return statement
+
+
+def heatmap(machine: Optional[str] = None, choix: Optional[str] = None, since: Optional[datetime] = None):
+    """
+    Construit la requete des choix par jour de la semaine et heure locale.
+
+    Sans periode, lit le cube choice_heatmap (tout l'historique, au plus
+    7 x 24 cases par machine et bouton). Avec une periode, regroupe les
+    agregats horaires depuis since : chaque heure UTC est comptee dans
+    l'heure locale de son debut.
+
+    Args:
+        machine: Filtre optionnel sur la machine.
+        choix: Filtre optionnel sur le bouton.
+        since: Debut de la periode (None = tout l'historique).
+
+    Returns:
+        Requete retournant weekday (0 = lundi), hour et count.
+    """
+    if since is None:
+        statement = select(
+            ChoiceHeatmap.weekday, ChoiceHeatmap.hour, func.sum(ChoiceHeatmap.count).label("count")
+        )
+        if machine:
+            statement = statement.where(ChoiceHeatmap.machine == machine)
+        if choix:
+            statement = statement.where(ChoiceHeatmap.choix == choix)
+        return statement.group_by(ChoiceHeatmap.weekday, ChoiceHeatmap.hour)
+
+    # Une ligne par heure avant la conversion de fuseau (au plus 24 x days)
+    hours = (
+        select(ChoiceRollupHourly.bucket, func.sum(ChoiceRollupHourly.count).label("count"))
+        .where(ChoiceRollupHourly.bucket >= since)
+    )
+    if machine:
+        hours = hours.where(ChoiceRollupHourly.machine == machine)
+    if choix:
+        hours = hours.where(ChoiceRollupHourly.choix == choix)
+    hours = hours.group_by(ChoiceRollupHourly.bucket).subquery()
+
+    weekday, hour = rollups.local_slot_sql(hours.c.bucket)
+    return (
+        select(weekday.label("weekday"), hour.label("hour"), func.sum(hours.c.count).label("count"))
+        .group_by(weekday, hour)
+    )
+
+
+def heatmap_matrix(rows: Iterable) -> List[List[int]]:
+    """Matrice 7 x 24 (lundi en premier) a partir des lignes de heatmap()."""
+    counts = [[0] * 24 for _ in range(7)]
+    for row in rows:
+        counts[row.weekday][row.hour] += row.count
+    return counts
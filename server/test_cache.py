@@ -0,0 +1,79 @@
+"""
+Tests du cache des statistiques (cache.py).
+
+    cd server && python -m pytest -q test_cache.py
+"""
+
+import time
+
+from cache import StatsCache
+
+
+def test_fleet_entries_are_served_during_continuous_ingest():
+    cache = StatsCache(ttl=30, max_staleness=0.2)
+    machines = ["borne_01", "borne_02", "borne_03"]
+
+    # Un choix toutes les 5 ms, une lecture de /stats entre chaque choix
+    deadline = time.monotonic() + 0.5
+    index = 0
+    while time.monotonic() < deadline:
+        cache.invalidate(machines[index % len(machines)])
+        index += 1
+        if cache.get(("stats", None, 7)) is None:
+            generation = cache.generation()
+            cache.invalidate(machines[index % len(machines)])  # choix pendant le calcul
+            cache.set(("stats", None, 7), {"total": index}, generation)
+        time.sleep(0.005)
+
+    stats = cache.stats()
+    assert stats["hits"] > 0
+    assert stats["hit_ratio"] > 0.5
+
+
+def test_fleet_entry_staleness_is_bounded():
+    cache = StatsCache(ttl=30, max_staleness=0.05)
+    cache.set("all", 1, cache.generation())
+    assert cache.get("all") == 1
+
+    cache.invalidate("borne_01")
+    assert cache.get("all") == 1
+    time.sleep(0.06)
+    assert cache.get("all") is None
+
+
+def test_machine_entries_are_invalidated_per_machine():
+    cache = StatsCache(ttl=30)
+    cache.set("a", 1, cache.generation("borne_01"), scope="borne_01")
+    cache.set("b", 2, cache.generation("borne_02"), scope="borne_02")
+
+    cache.invalidate("borne_01")
+
+    assert cache.get("a") is None
+    assert cache.get("b") == 2
+
+
+def test_set_racing_an_insert_of_the_same_machine_is_ignored():
+    cache = StatsCache(ttl=30)
+    generation = cache.generation("borne_01")
+    other = cache.generation("borne_02")
+    cache.invalidate("borne_01")
+
+    cache.set("a", 1, generation, scope="borne_01")
+    cache.set("b", 2, other, scope="borne_02")
+
+    assert cache.get("a") is None
+    assert cache.get("b") == 2
+
+
+def test_full_invalidation_drops_everything():
+    cache = StatsCache(ttl=30)
+    generation = cache.generation()
+    cache.set("all", 1, generation)
+    cache.set("a", 2, cache.generation("borne_01"), scope="borne_01")
+
+    cache.invalidate()
+
+    assert cache.get("all") is None
+    assert cache.get("a") is None
+    cache.set("all", 1, generation)
+    assert cache.get("all") is None
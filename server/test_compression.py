@@ -0,0 +1,77 @@
+"""
+Tests de la decompression des corps gzip (compression.py).
+
+Sans base de donnees : une application minimale avec les memes middlewares
+que main.py (metriques autour de la decompression).
+
+    cd server && python -m pytest -q test_compression.py
+"""
+
+import gzip
+import json
+
+from fastapi import Body, FastAPI
+from fastapi.testclient import TestClient
+
+import metrics
+from compression import GzipRequestMiddleware
+
+
+def _client() -> TestClient:
+    """Application avec une route d'echo, ordre des middlewares de main.py."""
+    app = FastAPI()
+
+    @app.post("/echo/{name}")
+    async def echo(name: str, payload: list = Body(...)):
+        return {"name": name, "size": len(payload)}
+
+    app.add_middleware(GzipRequestMiddleware, max_size=1024)
+    app.middleware("http")(metrics.http_middleware)
+    return TestClient(app)
+
+
+def _requests(route: str) -> float:
+    """Nombre de requetes POST 200 comptees pour une route."""
+    return metrics.HTTP_REQUESTS._values.get(("POST", route, "200"), 0)
+
+
+def test_gzip_body_is_decompressed():
+    body = gzip.compress(json.dumps([1, 2, 3]).encode())
+    response = _client().post(
+        "/echo/a", content=body,
+        headers={"Content-Type": "application/json", "Content-Encoding": "gzip"}
+    )
+    assert response.status_code == 200
+    assert response.json() == {"name": "a", "size": 3}
+
+
+def test_gzip_request_keeps_route_label():
+    before = _requests("/echo/{name}")
+    unmatched = _requests(metrics.UNMATCHED)
+
+    body = gzip.compress(json.dumps([1, 2, 3]).encode())
+    response = _client().post(
+        "/echo/a", content=body,
+        headers={"Content-Type": "application/json", "Content-Encoding": "gzip"}
+    )
+
+    assert response.status_code == 200
+    assert _requests("/echo/{name}") == before + 1
+    assert _requests(metrics.UNMATCHED) == unmatched
+
+
+def test_gzip_bomb_is_rejected():
+    body = gzip.compress(b"[" + b"0," * 4096 + b"0]")
+    response = _client().post(
+        "/echo/a", content=body,
+        headers={"Content-Type": "application/json", "Content-Encoding": "gzip"}
+    )
+    assert response.status_code == 413
+
+
+def test_invalid_gzip_is_rejected():
+    response = _client().post(
+        "/echo/a", content=b"not gzip",
+        headers={"Content-Type": "application/json", "Content-Encoding": "gzip"}
+    )
+    assert response.status_code == 400
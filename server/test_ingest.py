@@ -0,0 +1,153 @@
+"""
+Tests de l'ecriture differee (ingest.py) en cas d'echec d'ecriture.
+
+Sans base de donnees : l'ecriture est simulee par un writer en memoire.
+
+    cd server && python -m pytest -q test_ingest.py
+"""
+
+import asyncio
+import json
+import uuid
+from datetime import datetime
+
+from sqlalchemy.exc import DataError
+
+from ingest import IngestBuffer, RowRejected
+
+
+def _row(choix: str = "A") -> dict:
+    """Choix valide au format de main._choice_row."""
+    return {
+        "choix": choix,
+        "video": f"/videos/{choix}/1.mp4",
+        "machine": "borne_01",
+        "event_time": datetime(2025, 10, 1, 12, 0),
+        "event_id": str(uuid.uuid4())
+    }
+
+
+class FakeWriter:
+    """Writer en memoire : refuse les lots contenant un choix "Z"."""
+
+    def __init__(self, down: bool = False):
+        self.down = down
+        self.written = []
+        self.calls = 0
+
+    async def __call__(self, rows):
+        self.calls += 1
+        if self.down:
+            raise OSError("connexion refusee")
+        if any(row["choix"] == "Z" for row in rows):
+            raise DataError("INSERT", {}, Exception("valeur trop longue pour le type character(1)"))
+        self.written.extend(rows)
+        return [(len(self.written) - len(rows) + index + 1, True) for index in range(len(rows))]
+
+
+async def _flush_all(buffer: IngestBuffer) -> None:
+    """Attend que la file soit vide."""
+    while buffer.pending:
+        await asyncio.sleep(0.01)
+
+
+def test_async_bad_row_is_quarantined(tmp_path):
+    async def scenario():
+        writer = FakeWriter()
+        buffer = IngestBuffer(writer, flush_interval=0.01, durability="async", spool_dir=tmp_path)
+        buffer.start()
+        rows = [_row("A"), _row("Z"), _row("B"), _row("C")]
+        for row in rows:
+            assert await buffer.submit([row]) is None
+        await _flush_all(buffer)
+
+        # La file n'est pas bloquee : les choix suivants sont ecrits
+        assert await buffer.submit([_row("D")]) is None
+        await _flush_all(buffer)
+        await buffer.close()
+        return writer, buffer, rows
+
+    writer, buffer, rows = asyncio.run(scenario())
+
+    assert [row["choix"] for row in writer.written] == ["A", "B", "C", "D"]
+    assert buffer.quarantined == 1
+    lines = (tmp_path / "rejected.jsonl").read_text().splitlines()
+    assert len(lines) == 1
+    record = json.loads(lines[0])
+    assert record["row"]["event_id"] == rows[1]["event_id"]
+    assert "trop longue" in record["error"]
+    assert not (tmp_path / "pending.jsonl").exists()
+
+
+def test_sync_bad_row_does_not_fail_other_requests(tmp_path):
+    async def scenario():
+        writer = FakeWriter()
+        buffer = IngestBuffer(writer, flush_interval=0.05, durability="sync", spool_dir=tmp_path)
+        buffer.start()
+        # Trois requetes regroupees dans le meme lot
+        results = await asyncio.gather(
+            buffer.submit([_row("A")]),
+            buffer.submit([_row("B"), _row("Z")]),
+            buffer.submit([_row("C")])
+        )
+        await buffer.close()
+        return writer, results
+
+    writer, (first, second, third) = asyncio.run(scenario())
+
+    assert [row["choix"] for row in writer.written] == ["A", "B", "C"]
+    assert first[0][1] is True
+    assert second[0][1] is True
+    assert isinstance(second[1], RowRejected)
+    assert third[0][1] is True
+
+
+def test_close_spools_unwritten_rows_and_start_replays_them(tmp_path):
+    rows = [_row("A"), _row("B")]
+
+    async def shutdown_while_down():
+        writer = FakeWriter(down=True)
+        buffer = IngestBuffer(writer, flush_interval=0.01, durability="async", spool_dir=tmp_path)
+        buffer.start()
+        assert await buffer.submit(rows) is None
+        while writer.calls < 2:
+            await asyncio.sleep(0.01)
+        await buffer.close()
+        return buffer
+
+    buffer = asyncio.run(shutdown_while_down())
+    assert buffer.spooled == 2
+    assert buffer.pending == 0
+    assert len((tmp_path / "pending.jsonl").read_text().splitlines()) == 2
+
+    async def restart():
+        writer = FakeWriter()
+        buffer = IngestBuffer(writer, flush_interval=0.01, durability="sync", spool_dir=tmp_path)
+        buffer.start()
+        await _flush_all(buffer)
+        await buffer.close()
+        return writer
+
+    writer = asyncio.run(restart())
+    assert writer.written == rows
+    assert not (tmp_path / "pending.jsonl").exists()
+
+
+def test_transient_failure_retries_without_quarantine(tmp_path):
+    async def scenario():
+        writer = FakeWriter(down=True)
+        buffer = IngestBuffer(writer, flush_interval=0.01, durability="async", spool_dir=tmp_path)
+        buffer.start()
+        await buffer.submit([_row("A")])
+        while writer.calls < 2:
+            await asyncio.sleep(0.01)
+        writer.down = False
+        await _flush_all(buffer)
+        await buffer.close()
+        return writer, buffer
+
+    writer, buffer = asyncio.run(scenario())
+
+    assert [row["choix"] for row in writer.written] == ["A"]
+    assert buffer.quarantined == 0
+    assert not (tmp_path / "rejected.jsonl").exists()
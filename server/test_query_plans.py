@@ -0,0 +1,154 @@
+"""
+Verification des plans d'execution des requetes de l'API.
+
+Execute EXPLAIN sur les requetes construites par main.py, stats.py et
+rollups.py, et echoue si user_choices est lue par un parcours sequentiel
+au lieu d'un parcours d'index. Ignore sans PostgreSQL joignable.
+
+Si la base contient peu de choix, des choix de test sont inseres dans une
+transaction annulee a la fin : la base n'est pas modifiee.
+
+    cd server && python -m pytest -q test_query_plans.py
+    TEST_DATABASE_URL=postgresql://... python -m pytest -q test_query_plans.py
+"""
+
+import json
+import os
+from datetime import datetime, timedelta
+from typing import Iterator, List, Tuple
+
+import pytest
+from sqlalchemy import create_engine, event, select, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+import database
+import main
+import rollups
+import stats
+from models import Machine, UserChoice
+from seed import seed
+
+ALLOWED_SCANS = {"Index Only Scan", "Index Scan", "Bitmap Heap Scan", "Bitmap Index Scan"}
+
+# En dessous, le planificateur prefere a raison un parcours sequentiel
+MIN_ROWS = 100000
+SEED_ROWS = 200000
+
+engine = create_engine(os.getenv("TEST_DATABASE_URL", database.DATABASE_URL))
+try:
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+except OperationalError:
+    pytest.skip("PostgreSQL non joignable", allow_module_level=True)
+
+
+@pytest.fixture(scope="module")
+def db() -> Iterator[Session]:
+    """Session dans une transaction annulee a la fin du module."""
+    connection = engine.connect()
+    transaction = connection.begin()
+    session = Session(bind=connection, join_transaction_mode="create_savepoint")
+    rows = session.scalar(text(
+        "SELECT coalesce(sum(reltuples), 0) FROM pg_class "
+        "WHERE relkind = 'r' AND relname LIKE :prefix"
+    ), {"prefix": f"{UserChoice.__tablename__}%"})
+    if rows < MIN_ROWS:
+        seed(session, SEED_ROWS)
+    try:
+        yield session
+    finally:
+        session.close()
+        transaction.rollback()
+        connection.close()
+
+
+def endpoint_queries() -> List[Tuple[str, object]]:
+    """Requetes des endpoints, construites par les memes fonctions que les routes."""
+    now = datetime.utcnow()
+    listing = main._choices_query(None, None, 7)
+    by_machine = main._choices_query("bench_001", None, 7)
+    by_choix = main._choices_query(None, "A", 7)
+
+    return [
+        ("GET /choices", main._page_query(listing)),
+        ("GET /choices?machine", main._page_query(by_machine)),
+        ("GET /choices?choix", main._page_query(by_choix)),
+        ("GET /choices?after", main._page_query(listing, (now - timedelta(days=1), 1))),
+        ("GET /choices total (machine)", main._count_query(by_machine)),
+        ("GET /choices total (choix)", main._count_query(by_choix)),
+        ("GET /choices/export?machine", by_machine.order_by(UserChoice.event_time, UserChoice.id)),
+        ("GET /choices/{id}", main._choice_select().where(UserChoice.id == 1)),
+        ("GET /stats (lignes brutes)", stats.breakdown(now - timedelta(minutes=30))),
+        ("POST /choices (renvois)", main._existing_choices_query(
+            [("00000000-0000-0000-0000-000000000000", now - timedelta(hours=2))]
+        )),
+        ("demarrage (choix recents)", main._recent_choices_query(now - timedelta(hours=1))),
+        ("demarrage (compteurs 24 h)", main._minute_counts_query(now - timedelta(days=1))),
+    ]
+
+
+def scans(plan: dict) -> Iterator[Tuple[str, str]]:
+    """Parcourt un plan JSON : (type de noeud, table) pour chaque lecture de user_choices."""
+    relation = plan.get("Relation Name", "")
+    if relation.startswith(UserChoice.__tablename__):
+        yield plan["Node Type"], relation
+    for child in plan.get("Plans", []):
+        yield from scans(child)
+
+
+def sequential_scans(db: Session, sql: str, parameters=None) -> List[str]:
+    """Partitions de user_choices lues sans index par une requete."""
+    # Un parcours sequentiel d'une partition vide (mois a venir) est normal
+    empty = set(db.execute(text(
+        "SELECT relname FROM pg_class WHERE relkind = 'r' "
+        "AND relname LIKE :prefix AND reltuples <= 0"
+    ), {"prefix": f"{UserChoice.__tablename__}%"}).scalars())
+
+    plan = db.connection().exec_driver_sql(f"EXPLAIN (FORMAT JSON) {sql}", parameters or {}).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return sorted({
+        relation for node, relation in scans(plan[0]["Plan"])
+        if relation not in empty and node not in ALLOWED_SCANS
+    })
+
+
+@pytest.mark.parametrize("name,statement", endpoint_queries(), ids=[name for name, _ in endpoint_queries()])
+def test_endpoint_query_uses_index(db, name, statement):
+    sql = statement.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True})
+    assert sequential_scans(db, str(sql)) == []
+
+
+def test_delete_rollup_queries_use_index(db):
+    """Requetes executees par rollups.remove_choice (DELETE /choices/{id})."""
+    choice, machine = db.execute(
+        select(UserChoice, Machine.name)
+        .join(Machine, Machine.id == UserChoice.machine_id)
+        .where(UserChoice.event_time >= datetime.utcnow() - timedelta(days=30))
+        .order_by(UserChoice.event_time.desc(), UserChoice.id.desc())
+        .limit(1)
+    ).first()
+
+    savepoint = db.begin_nested()
+    db.delete(choice)
+    db.flush()
+
+    executed = []
+
+    def capture(_conn, _cursor, statement, parameters, _context, _executemany):
+        executed.append((statement, parameters))
+
+    connection = db.connection()
+    event.listen(connection, "before_cursor_execute", capture)
+    try:
+        rollups.remove_choice(db, choice, machine)
+    finally:
+        event.remove(connection, "before_cursor_execute", capture)
+
+    reads = [(sql, params) for sql, params in executed if UserChoice.__tablename__ in sql]
+    assert reads
+    for sql, params in reads:
+        assert sequential_scans(db, sql, params) == [], sql
+    savepoint.rollback()
@@ -0,0 +1,47 @@
+"""
+Tests de la validation des choix (schemas.py).
+
+    cd server && python -m pytest -q test_schemas.py
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+from pydantic import ValidationError
+
+import schemas
+from schemas import ChoiceCreate
+
+
+def _choice(event_time) -> ChoiceCreate:
+    return ChoiceCreate(choix="A", video="/videos/A/1.mp4", machine="borne_01", event_time=event_time)
+
+
+def test_event_time_is_converted_to_naive_utc():
+    moment = datetime.utcnow().replace(microsecond=0)
+    choice = _choice(moment.isoformat() + "+02:00")
+    assert choice.event_time == moment - timedelta(hours=2)
+
+
+@pytest.mark.parametrize("event_time", ["1970-01-01T00:00:00Z", "2099-01-01T00:00:00"])
+def test_event_time_outside_window_is_rejected(event_time):
+    with pytest.raises(ValidationError, match="hors de la fenetre"):
+        _choice(event_time)
+
+
+def test_event_time_window_follows_retention(monkeypatch):
+    now = datetime(2026, 3, 15, 12, 0)
+
+    monkeypatch.setattr(schemas.partitions, "PARTITION_RETENTION_MONTHS", 0)
+    oldest, newest = schemas.event_time_window(now)
+    assert oldest == now - timedelta(days=schemas.EVENT_TIME_MAX_AGE_DAYS)
+    assert newest == now + timedelta(seconds=schemas.EVENT_TIME_MAX_SKEW)
+
+    # Pas d'horodatage avant le plus ancien mois conserve
+    monkeypatch.setattr(schemas.partitions, "PARTITION_RETENTION_MONTHS", 2)
+    oldest, _ = schemas.event_time_window(now)
+    assert oldest == datetime(2026, 2, 1)
+
+
+def test_missing_event_time_is_accepted():
+    assert _choice(None).event_time is None